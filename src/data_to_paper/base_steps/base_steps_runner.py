@@ -1,3 +1,4 @@
+import contextlib
 import glob
 import json
 import os
@@ -13,7 +14,7 @@ from data_to_paper.base_products.file_descriptions import (
     CreateDataFileDescriptions,
     DataFileDescriptions,
 )
-from data_to_paper.env import FOLDER_FOR_RUN, DEBUG_MODE, SCHOLAR_SERVER
+from data_to_paper.env import FOLDER_FOR_RUN, DEBUG_MODE, SCHOLAR_SERVER, JOURNAL_CONVERSATION_ACTIONS
 from data_to_paper.interactive.base_app_startup import BaseStartDialog
 from data_to_paper.servers.api_cost import StageToCost
 from data_to_paper.utils.file_utils import clear_directory
@@ -27,6 +28,8 @@ from data_to_paper.conversation.stage import Stage
 from data_to_paper.conversation.actions_and_conversations import ActionsAndConversations
 from data_to_paper.terminate.exceptions import TerminateException, ResetStepException
 from data_to_paper.run_gpt_code.code_runner_wrapper import RUN_CACHE_FILEPATH
+from data_to_paper.run_gpt_code.cache_runs import get_cache_store_directory
+from data_to_paper.latex.latex_to_pdf import LATEX_COMPILATION_CACHE_DIRECTORY
 from data_to_paper.text import dedent_triple_quote_str
 from data_to_paper.utils.replacer import Replacer
 
@@ -50,6 +53,7 @@ class BaseStepsRunner(ProductsHandler, AppInteractor):
         "semantic_scholar_embedding_responses.bin"
     )
     CODE_RUNNER_CACHE_FILENAME = "code_runner_cache.pkl"
+    LATEX_COMPILATION_CACHE_DIRNAME = "latex_compilation_cache"
     API_USAGE_COST_FILENAME = "api_usage_cost.json"
 
     PROJECT_PARAMETERS_FILENAME = "data-to-paper.json"
@@ -319,6 +323,10 @@ class BaseStepsRunner(ProductsHandler, AppInteractor):
                 self.SEMANTIC_SCHOLAR_EMBEDDING_RESPONSES_FILENAME,
                 self.API_USAGE_COST_FILENAME,
             ]
+        ] + [
+            str(get_cache_store_directory(self.output_directory / self.CODE_RUNNER_CACHE_FILENAME)),
+            str(self.output_directory / self.LATEX_COMPILATION_CACHE_DIRNAME),
+            OPENAI_SERVER_CALLER.get_journal_file_path(self.output_directory / self.OPENAI_RESPONSES_FILENAME),
         ]
 
     def _create_or_clean_output_folder(self):
@@ -354,6 +362,9 @@ class BaseStepsRunner(ProductsHandler, AppInteractor):
         @RUN_CACHE_FILEPATH.temporary_set(
             self._get_path_in_output_directory(self.CODE_RUNNER_CACHE_FILENAME)
         )
+        @LATEX_COMPILATION_CACHE_DIRECTORY.temporary_set(
+            self._get_path_in_output_directory(self.LATEX_COMPILATION_CACHE_DIRNAME)
+        )
         @SCHOLAR_SERVER.get_server_instance().record_or_replay(
             self._get_path_in_output_directory(
                 self.CROSSREF_RESPONSES_FILENAME
@@ -379,7 +390,11 @@ class BaseStepsRunner(ProductsHandler, AppInteractor):
         self._create_or_clean_output_folder()
         self._create_temp_folder_to_run_in()
         self._pre_run_preparations()
-        with console_log_file_context(self.output_directory / "console_log.txt"):
+        with console_log_file_context(
+            self.output_directory / "console_log.txt"
+        ), self.actions_and_conversations.actions.journal_to_file(
+            self.output_directory / self.ACTIONS_FILENAME
+        ) if JOURNAL_CONVERSATION_ACTIONS else contextlib.nullcontext():
             try:
                 run()
             finally:
@@ -177,6 +177,63 @@ class SortedCitationCollectionProduct(CitationCollectionProduct):
         return s
 
 
+@dataclass
+class CitationEmbeddingIndex:
+    """
+    The embeddings of citations, packed into a single matrix of unit vectors.
+    Allows getting the embedding similarity of all the citations with a single matrix-vector product.
+    """
+    bibtex_ids_to_rows: Dict[str, int]
+    unit_embeddings: np.ndarray  # (num_citations, embedding_size)
+    _target: Optional[np.ndarray] = None
+    _similarities: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_citations(cls, citations: Iterable[Citation]) -> "CitationEmbeddingIndex":
+        bibtex_ids_to_rows = {}
+        embeddings = []
+        for citation in citations:
+            if citation.embedding is not None and citation.bibtex_id not in bibtex_ids_to_rows:
+                bibtex_ids_to_rows[citation.bibtex_id] = len(embeddings)
+                embeddings.append(citation.embedding)
+        embeddings = np.array(embeddings, dtype=float).reshape(len(embeddings), -1)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return cls(bibtex_ids_to_rows=bibtex_ids_to_rows, unit_embeddings=embeddings / norms)
+
+    def contains_all(self, citations: Iterable[Citation]) -> bool:
+        return all(citation.embedding is None or citation.bibtex_id in self.bibtex_ids_to_rows
+                   for citation in citations)
+
+    def get_similarities(self, citations: List[Citation], embedding_target: np.ndarray) -> np.ndarray:
+        """
+        Return the embedding similarity of each citation to the target (0 for citations without embedding).
+        The similarities of all the indexed citations are calculated once per target.
+        """
+        if self._target is not embedding_target:
+            norm = np.linalg.norm(embedding_target)
+            self._similarities = np.append(self.unit_embeddings @ (embedding_target / (norm or 1)), 0.)
+            self._target = embedding_target
+        rows = [self.bibtex_ids_to_rows.get(citation.bibtex_id, -1) if citation.embedding is not None else -1
+                for citation in citations]  # -1 is the appended 0 similarity
+        return self._similarities[rows]
+
+
+def get_indices_of_top_values(values: np.ndarray, k: Optional[int] = None) -> np.ndarray:
+    """
+    Return the indices of the k highest values (all values, if k is None), in decreasing order of the values.
+    Equal values keep their original order (as with a stable sort).
+    """
+    if k is not None and k < len(values):
+        if k <= 0:
+            return np.array([], dtype=int)
+        kth_value = values[np.argpartition(-values, k - 1)[k - 1]]
+        candidates = np.flatnonzero(values >= kth_value)
+    else:
+        candidates = np.arange(len(values))
+    return candidates[np.lexsort((candidates, -values[candidates]))][:k]
+
+
 class LiteratureSearchParams(NamedTuple):
     total: int
     minimal_influence: int
@@ -196,6 +253,24 @@ class LiteratureSearch(ValueProduct):
         default_factory=dict
     )
     api_source: str = SCHOLAR_SERVER.server
+    _embedding_index: Optional[CitationEmbeddingIndex] = field(default=None, init=False, repr=False, compare=False)
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._embedding_index = None  # citations were added
+
+    def _get_all_citations(self) -> Iterable[Citation]:
+        for queries_to_citations in self.values():
+            for citations in queries_to_citations.values():
+                yield from citations
+
+    def get_embedding_similarities(self, citations: List[Citation]) -> np.ndarray:
+        """
+        Return the embedding similarity of each of the citations to the embedding target.
+        """
+        if self._embedding_index is None or not self._embedding_index.contains_all(citations):
+            self._embedding_index = CitationEmbeddingIndex.from_citations(self._get_all_citations())
+        return self._embedding_index.get_similarities(citations, self.embedding_target)
 
     def get_queries(self, scope: Optional[str] = None) -> List[str]:
         """
@@ -287,13 +362,11 @@ class LiteratureSearch(ValueProduct):
                 ]
 
             if sort_by_similarity and self.embedding_target is not None:
-                citations = sorted(
-                    citations,
-                    key=lambda citation: citation.get_embedding_similarity(
-                        self.embedding_target
-                    ),
-                    reverse=True,
+                indices = get_indices_of_top_values(
+                    self.get_embedding_similarities(citations),
+                    k=total if total is not None and total >= 0 else None,
                 )
+                citations = [citations[index] for index in indices]
             else:
                 citations = sorted(citations, key=lambda citation: citation.search_rank)
 
@@ -362,17 +435,24 @@ class LiteratureSearch(ValueProduct):
         )
         if GET_LITERATURE_SEARCH_FOR_PRINT:
             style = "print"
+        fields = (
+            CITATION_REPR_FIELDS_FOR_LLM
+            if style == "llm"
+            else CITATION_REPR_FIELDS_FOR_PRINT
+        )
+        citations = list(citations)
+        if "embedding_similarity" in fields and self.embedding_target is not None:
+            similarities = self.get_embedding_similarities(citations)
+        else:
+            similarities = [None] * len(citations)
         return "\n".join(
             citation.pretty_repr(
-                fields=(
-                    CITATION_REPR_FIELDS_FOR_LLM
-                    if style == "llm"
-                    else CITATION_REPR_FIELDS_FOR_PRINT
-                ),
+                fields=fields,
                 is_html=style == "html",
                 embedding_target=self.embedding_target,
+                embedding_similarity=similarity,
             )
-            for citation in citations
+            for citation, similarity in zip(citations, similarities)
         )
 
     def get_header(
@@ -234,15 +234,22 @@ class BaseLiteratureSearchReviewGPT(
                 f'<p>Searching "{SCHOLAR_SERVER.server}" '
                 f"for papers related to our study in the following areas:</p>\n"
             )
+            # All the queries are sent together (concurrently); responses are recorded in the order of the queries:
+            query_requests = [
+                ((query,), dict(rows=self.number_of_papers_per_query))
+                for queries in scopes_to_list_of_queries.values()
+                for query in queries
+            ]
+            responses = iter(
+                SCHOLAR_SERVER.get_server_instance().get_server_responses(query_requests)
+            )
             for scope, queries in scopes_to_list_of_queries.items():
                 queries_to_citations = {}
                 html += f"<h3>{scope.title()}-related queries:</h3>\n"
                 for query in queries:
-                    citations = (
-                        SCHOLAR_SERVER.get_server_instance().get_server_response(
-                            query, rows=self.number_of_papers_per_query
-                        )
-                    )
+                    citations = next(responses)
+                    if isinstance(citations, Exception):
+                        raise citations
                     num_citations = len(citations)
                     html += f'<p><b style="color: #1E90FF;">Query:</b> "{query}".\n'
                     html += f'<br><b style="color: #1E90FF;">Found:</b> {num_citations} citations.</p>\n'
@@ -0,0 +1,206 @@
+"""
+An append-only journal of the actions applied to conversations.
+
+The journal is a stream of pickled records, written as actions are applied, so that it can be tailed while a run
+is in progress, and replayed lazily, record by record.
+Messages are stored once, in their own records, and are referenced by id from the actions (and from the context
+of other messages). Message stores (see `MessageContext`) are append-only, so only the messages added to a store
+since it was last written are recorded. A store record is written only after the records of all its messages.
+The conversations are not stored; they are re-attached to the actions when the journal is read.
+"""
+
+from __future__ import annotations
+
+import io
+import pickle
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, Optional, Set, Union
+
+from data_to_paper.utils.print_to_file import print_and_log_red
+
+from .actions_and_conversations import Action, Conversations
+from .message import Message
+from .message_context import MessageStore
+
+JOURNAL_HEADER = b'data-to-paper action journal\n'  # pickle streams start with a different byte (PROTO)
+MESSAGE_RECORD = 'message'
+STORE_RECORD = 'store'
+ACTION_RECORD = 'action'
+CONVERSATIONS_ID = 'conversations'
+
+
+class _JournalPickler(pickle.Pickler):
+    """
+    Pickles a record, replacing messages and conversations with references.
+    """
+
+    def __init__(self, file, journal: ActionJournal):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.journal = journal
+
+    def persistent_id(self, obj):
+        if isinstance(obj, Message):
+            return MESSAGE_RECORD, self.journal.get_message_id(obj)
+        if isinstance(obj, MessageStore):
+            return STORE_RECORD, self.journal.get_store_id(obj)
+        if isinstance(obj, Conversations):
+            return CONVERSATIONS_ID
+        return None
+
+
+class _JournalUnpickler(pickle.Unpickler):
+
+    def __init__(self, file, reader: ActionJournalReader):
+        super().__init__(file)
+        self.reader = reader
+
+    def persistent_load(self, pid):
+        if pid == CONVERSATIONS_ID:
+            return self.reader.conversations
+        record_type, record_id = pid
+        if record_type == STORE_RECORD:
+            # a store can be referenced (by the context of a message) before its messages are recorded
+            return self.reader.stores.setdefault(record_id, MessageStore())
+        return self.reader.messages[record_id]
+
+
+@dataclass
+class ActionJournal:
+    """
+    Writes actions to a new journal file, one record at a time.
+    Each message is written once, before the first record that references it.
+    """
+    file_path: Union[str, Path]
+    _file: Optional[BinaryIO] = None
+    _messages_to_ids: Dict[int, int] = field(default_factory=dict)
+    _messages: List[Message] = field(default_factory=list)  # keeps the written messages alive, so ids are not reused
+    _stores_to_ids: Dict[int, int] = field(default_factory=dict)
+    _stores: List[MessageStore] = field(default_factory=list)
+    _stores_to_written_lens: Dict[int, int] = field(default_factory=dict)
+    _written_message_ids: Set[int] = field(default_factory=set)
+    _pending_store_records: List[tuple] = field(default_factory=list)
+
+    def _get_file(self) -> BinaryIO:
+        if self._file is None:
+            self._file = open(self.file_path, 'wb')
+            self._file.write(JOURNAL_HEADER)
+        return self._file
+
+    def _write_record(self, record: tuple):
+        buffer = io.BytesIO()
+        _JournalPickler(buffer, self).dump(record)
+        # records referenced by this record were already written (while pickling it)
+        self._get_file().write(buffer.getvalue())
+
+    def get_message_id(self, message: Message) -> int:
+        """
+        Return the id of the message, writing the message to the journal if it was not written yet.
+        """
+        message_id = self._messages_to_ids.get(id(message))
+        if message_id is None:
+            message_id = self._messages_to_ids[id(message)] = len(self._messages)
+            self._messages.append(message)
+            # messages in the context of this message are written (with higher ids) before it
+            self._write_record((MESSAGE_RECORD, message_id, type(message), message.__dict__))
+            self._written_message_ids.add(message_id)
+            self._write_ready_store_records()
+        return message_id
+
+    def _write_ready_store_records(self):
+        """
+        Write the pending store records, in order, as long as the records of all their messages were written.
+        """
+        while self._pending_store_records and all(
+                self._messages_to_ids[id(message)] in self._written_message_ids
+                for message in self._pending_store_records[0][3]):
+            self._write_record(self._pending_store_records.pop(0))
+
+    def get_store_id(self, store: MessageStore) -> int:
+        """
+        Return the id of the message store, writing the messages added to the store since it was last written.
+        """
+        store_id = self._stores_to_ids.get(id(store))
+        if store_id is None:
+            store_id = self._stores_to_ids[id(store)] = len(self._stores)
+            self._stores.append(store)
+            self._stores_to_written_lens[store_id] = 0
+        written_len = self._stores_to_written_lens[store_id]
+        if len(store) > written_len:
+            self._stores_to_written_lens[store_id] = len(store)
+            messages = store[written_len:]
+            for message in messages:
+                # a message that is being written (its context refers to this store) is written later:
+                self.get_message_id(message)
+            self._pending_store_records.append((STORE_RECORD, store_id, written_len, messages))
+            self._write_ready_store_records()
+        return store_id
+
+    def append(self, action: Action):
+        try:
+            self._write_record((ACTION_RECORD, action))
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            # the journal should not fail the run
+            print_and_log_red(f'Failed writing {type(action).__name__} to the action journal:\n{e}', should_log=False)
+        self._get_file().flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+@dataclass
+class ActionJournalReader:
+    """
+    Reads the actions of a journal lazily.
+
+    Iterating yields the actions recorded so far; iterating again continues from where the previous iteration
+    stopped, so a journal that is still being written can be tailed.
+    The actions are attached to `conversations`.
+    """
+    file_path: Union[str, Path]
+    conversations: Conversations = field(default_factory=Conversations)
+    messages: Dict[int, Message] = field(default_factory=dict)
+    stores: Dict[int, MessageStore] = field(default_factory=dict)
+    _position: int = len(JOURNAL_HEADER)
+
+    def _read_record(self, file: BinaryIO) -> Optional[tuple]:
+        """
+        Return the next complete record, or None if there is none (yet).
+        """
+        file.seek(self._position)
+        try:
+            record = _JournalUnpickler(file, self).load()
+        except (EOFError, pickle.UnpicklingError):
+            return None  # end of file, or a record that is still being written
+        self._position = file.tell()
+        return record
+
+    def __iter__(self) -> Iterator[Action]:
+        with open(self.file_path, 'rb') as file:
+            while True:
+                record = self._read_record(file)
+                if record is None:
+                    return
+                if record[0] == MESSAGE_RECORD:
+                    _, message_id, message_type, state = record
+                    message = message_type.__new__(message_type)
+                    message.__dict__.update(state)
+                    self.messages[message_id] = message
+                elif record[0] == STORE_RECORD:
+                    _, store_id, start, messages = record
+                    store = self.stores.setdefault(store_id, MessageStore())
+                    assert len(store) == start
+                    for message in messages:
+                        store.intern(message)
+                elif record[0] == ACTION_RECORD:
+                    yield record[1]
+
+
+def is_action_journal(file_path: Union[str, Path]) -> bool:
+    """
+    Return True if the file is an action journal (rather than a pickled list of actions).
+    """
+    with open(file_path, 'rb') as file:
+        return file.read(len(JOURNAL_HEADER)) == JOURNAL_HEADER
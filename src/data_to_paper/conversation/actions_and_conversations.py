@@ -10,14 +10,18 @@ The dict of conversations is used to keep track of conversations by name, as the
 from __future__ import annotations
 
 import pickle
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Union, Dict, List, Optional, Set
+from typing import Union, Dict, List, Optional, Set, TYPE_CHECKING
 from dataclasses import dataclass, field
 
 from data_to_paper.utils.print_to_file import print_and_log
 from data_to_paper.base_cast import Agent
 from .conversation import Conversation
 
+if TYPE_CHECKING:
+    from .action_journal import ActionJournal
+
 
 @dataclass(frozen=True)
 class Action:
@@ -82,13 +86,87 @@ class Actions(List[Action]):
 
     abbreviate_repeated_printed_content: bool = True
 
+    _printed_contents: Set[str] = field(default_factory=set, init=False, repr=False, compare=False)
+    "Index of the contents of the printed messages in the first `_num_indexed_actions` actions."
+
+    _num_indexed_actions: int = field(default=0, init=False, repr=False, compare=False)
+
+    _journal: Optional[ActionJournal] = field(default=None, init=False, repr=False, compare=False)
+    "The journal to which applied actions are written (see `journal_to_file`)."
+
+    def __getstate__(self):
+        # the index is not saved; it is rebuilt from the actions when needed
+        state = self.__dict__.copy()
+        state.pop('_printed_contents', None)
+        state.pop('_num_indexed_actions', None)
+        state.pop('_journal', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        object.__setattr__(self, '_printed_contents', set())
+        object.__setattr__(self, '_num_indexed_actions', 0)
+        object.__setattr__(self, '_journal', None)
+
+    def _reset_printed_contents(self):
+        self._printed_contents.clear()
+        object.__setattr__(self, '_num_indexed_actions', 0)
+
+    # Appended actions are indexed lazily; any other change of the list resets the index:
+
+    def clear(self):
+        super().clear()
+        self._reset_printed_contents()
+
+    def __setitem__(self, index, value):
+        super().__setitem__(index, value)
+        self._reset_printed_contents()
+
+    def __delitem__(self, index):
+        super().__delitem__(index)
+        self._reset_printed_contents()
+
+    def insert(self, index, action: Action):
+        super().insert(index, action)
+        self._reset_printed_contents()
+
+    def pop(self, index=-1) -> Action:
+        action = super().pop(index)
+        self._reset_printed_contents()
+        return action
+
+    def remove(self, action: Action):
+        super().remove(action)
+        self._reset_printed_contents()
+
+    @staticmethod
+    def _is_printed_message(action: Action) -> bool:
+        from .conversation_actions import AppendMessage
+        return isinstance(action, AppendMessage) and action.should_print and action.should_add_to_conversation()
+
+    def _get_printed_contents(self) -> Set[str]:
+        """
+        Return the index of printed message contents, updated with any actions appended since the last call.
+        """
+        for action in self[self._num_indexed_actions:]:
+            if self._is_printed_message(action):
+                self._printed_contents.add(action.message.content)
+        object.__setattr__(self, '_num_indexed_actions', len(self))
+        return self._printed_contents
+
+    def is_repeated_printed_content(self, content: str) -> bool:
+        """
+        Return True if the content was already printed in a previous message.
+        """
+        return content in self._get_printed_contents()
+
     def apply_action(self, action: Action, is_color: bool = True,
                      should_append: bool = True):
         if action.should_print:
             from .conversation_actions import AppendMessage
             if self.abbreviate_repeated_printed_content \
                     and isinstance(action, AppendMessage) \
-                    and action.message.content in self.get_all_message_contents(only_printed=True):
+                    and self.is_repeated_printed_content(action.message.content):
                 s = action.pretty_repr(is_color=is_color, abbreviate_content=True)
                 s_bw = action.pretty_repr(is_color=False, abbreviate_content=True)
             else:
@@ -99,21 +177,47 @@ class Actions(List[Action]):
         if should_append:
             self.append(action)
         action.apply()
+        if should_append and self._journal is not None:
+            self._journal.append(action)
+
+    @contextmanager
+    def journal_to_file(self, file_path: Union[str, Path]):
+        """
+        Write the actions to an action journal, and keep appending the actions applied within the context.
+        """
+        from .action_journal import ActionJournal
+        journal = ActionJournal(file_path)
+        for action in self:
+            journal.append(action)
+        object.__setattr__(self, '_journal', journal)
+        try:
+            yield journal
+        finally:
+            object.__setattr__(self, '_journal', None)
+            journal.close()
 
     def save_actions_to_file(self, file_path: Union[str, Path]):
         """
-        Save the primary list of actions to a json file.
+        Save the primary list of actions to an action journal file.
         """
-        with open(file_path, 'wb') as f:
-            pickle.dump(self, f)
+        with self.journal_to_file(file_path):
+            pass
 
-    def load_actions_from_file(self, file_path: Union[str, Path]):
+    def load_actions_from_file(self, file_path: Union[str, Path], conversations: Optional[Conversations] = None):
         """
-        Load a list of actions from a json file.
+        Load a list of actions from an action journal file (or from a pickled list of actions, saved by older
+        versions).
+        The actions of a journal are attached to `conversations`.
         """
-        with open(file_path, 'rb') as f:
-            self.clear()
-            self.extend(pickle.load(f))
+        from .action_journal import ActionJournalReader, is_action_journal
+        self.clear()
+        if is_action_journal(file_path):
+            if conversations is None:
+                conversations = Conversations()
+            self.extend(ActionJournalReader(file_path, conversations=conversations))
+        else:
+            with open(file_path, 'rb') as f:
+                self.extend(pickle.load(f))
         return self
 
     def get_actions_for_conversation(self, conversation_name: str) -> List[Action]:
@@ -130,10 +234,7 @@ class Actions(List[Action]):
         """
         from .conversation_actions import AppendMessage
         return [action.message.content for action in self
-                if isinstance(action, AppendMessage) and (not only_printed or
-                                                          (action.should_print and
-                                                           action.should_add_to_conversation()))
-                ]
+                if isinstance(action, AppendMessage) and (not only_printed or self._is_printed_message(action))]
 
 
 @dataclass(frozen=True)
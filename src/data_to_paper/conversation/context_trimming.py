@@ -0,0 +1,90 @@
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+from data_to_paper.servers.llm_call import count_number_of_tokens_in_message
+from data_to_paper.servers.model_engine import ModelEngine
+
+from .message import Message
+
+
+@dataclass
+class ContextTrimmingPlan:
+    """
+    The model to use, and the messages to hide, so that a request fits the context of the model.
+    """
+    model_engine: ModelEngine
+    hidden_indices: List[int] = field(default_factory=list)
+    "Indices (in the conversation) of the messages to hide."
+
+    num_tokens: int = 0
+    "Number of tokens in the messages that are sent (without the expected response)."
+
+    num_hidden_tokens: int = 0
+    expected_tokens_in_response: int = 0
+    fits: bool = True
+    "False if the request does not fit even after hiding all the messages that can be hidden."
+
+    def is_trivial(self) -> bool:
+        return self.fits and not self.hidden_indices
+
+    def pretty_repr(self) -> str:
+        s = f'Context of {self.num_tokens} tokens (+ {self.expected_tokens_in_response} expected in response) ' \
+            f'for {self.model_engine} (max {self.model_engine.max_tokens} tokens)'
+        if self.hidden_indices:
+            s += f'; hiding {len(self.hidden_indices)} messages ({self.num_hidden_tokens} tokens): ' \
+                 f'{self.hidden_indices}'
+        if not self.fits:
+            s += '; DOES NOT FIT'
+        return s
+
+
+def get_models_with_more_context(model_engine: ModelEngine) -> List[ModelEngine]:
+    """
+    Return the model, followed by the models we can bump to for more context.
+    """
+    models = [model_engine]
+    while True:
+        try:
+            model = models[-1].get_model_with_more_context()
+        except ValueError:
+            return models
+        if model in models:  # the largest models map to themselves
+            return models
+        models.append(model)
+
+
+def plan_context_trimming(indices_and_messages: List[Tuple[int, Message]], model_engine: ModelEngine,
+                          expected_tokens_in_response: int, num_protected_messages: int = 1,
+                          ) -> ContextTrimmingPlan:
+    """
+    Plan how to fit the messages, and the expected response, into the context of the model.
+
+    We first bump the model (see `ModelEngine.get_model_with_more_context`), if needed. If the messages do not fit
+    even the largest model, we hide the minimal number of messages from the top, keeping the first
+    `num_protected_messages` messages (the system message).
+
+    Messages are counted with `count_number_of_tokens_in_message`, which uses the token counts memoised by the
+    messages, so only new, or changed, messages are encoded.
+    """
+    messages = [message for _, message in indices_and_messages]
+    num_tokens = 0
+    for model in get_models_with_more_context(model_engine):
+        num_tokens = count_number_of_tokens_in_message(messages, model)
+        if num_tokens + expected_tokens_in_response <= model.max_tokens:
+            return ContextTrimmingPlan(model_engine=model, num_tokens=num_tokens,
+                                       expected_tokens_in_response=expected_tokens_in_response)
+
+    # the largest model:
+    budget = model.max_tokens - expected_tokens_in_response
+    hidden_indices = []
+    num_hidden_tokens = 0
+    first_hideable = min(num_protected_messages, len(indices_and_messages))
+    for i in range(first_hideable, len(indices_and_messages)):
+        if num_tokens <= budget:
+            break
+        hidden_indices.append(indices_and_messages[i][0])
+        num_hidden_tokens += messages[i].get_number_of_tokens(model)
+        num_tokens = count_number_of_tokens_in_message(messages[:first_hideable] + messages[i + 1:], model)
+    return ContextTrimmingPlan(model_engine=model, hidden_indices=hidden_indices, num_tokens=num_tokens,
+                               num_hidden_tokens=num_hidden_tokens,
+                               expected_tokens_in_response=expected_tokens_in_response, fits=num_tokens <= budget)
@@ -7,6 +7,7 @@ from typing import List, Tuple, Optional, Set
 from data_to_paper.utils.tag_pairs import SAVE_TAGS
 
 from .message import Message, Role
+from .message_context import MessageContext, MessageStore
 from .message_designation import GeneralMessageDesignation, convert_general_message_designation_to_int_list
 
 from typing import TYPE_CHECKING
@@ -32,6 +33,15 @@ class Conversation(List[Message]):
         self.conversation_name = conversation_name
         self.participants = participants  # None - do not enforce participants
 
+    @property
+    def message_store(self) -> MessageStore:
+        """
+        The store of the messages referred to by the contexts of the messages of the conversation.
+        """
+        if getattr(self, '_message_store', None) is None:
+            self._message_store = MessageStore()
+        return self._message_store
+
     def add_participant(self, agent: Agent):
         if self.participants is None:
             self.participants = []
@@ -73,6 +83,12 @@ class Conversation(List[Message]):
         """
         return [message for _, message in self.get_chosen_indices_and_messages(hidden_messages)]
 
+    def get_context(self, messages: List[Message]) -> MessageContext:
+        """
+        Return a compact context of the given messages of the conversation (see `MessageContext`).
+        """
+        return MessageContext.from_messages(messages, self.message_store)
+
     def get_last_response(self) -> str:
         """
         Return the last response from the assistant.
@@ -1,13 +1,14 @@
 from dataclasses import dataclass
-from typing import Optional, Set, Iterable, Union, List
+from typing import Optional, Set, Iterable, Union, Sequence
 
 from data_to_paper.utils.print_to_file import print_and_log_red
 from data_to_paper.base_cast import Agent
-from data_to_paper.servers.llm_call import try_get_llm_response
+from data_to_paper.servers.llm_call import try_get_llm_response, DEFAULT_EXPECTED_TOKENS_IN_RESPONSE
 from data_to_paper.servers.model_engine import OPENAI_CALL_PARAMETERS_NAMES, OpenaiCallParameters, ModelEngine
 from data_to_paper.run_gpt_code.code_utils import add_label_to_first_triple_quotes_if_missing
 
 from .actions_and_conversations import ActionsAndConversations, Conversations, Actions
+from .context_trimming import plan_context_trimming
 from .conversation import Conversation
 from .message import Message, Role, create_message, create_message_from_other_message
 from .message_designation import GeneralMessageDesignation, convert_general_message_designation_to_list
@@ -98,7 +99,7 @@ class ConversationManager:
 
     def create_and_append_message(self, role: Role, content: str, tag: Optional[str], comment: Optional[str] = None,
                                   ignore: bool = False, previous_code: Optional[str] = None, is_code: bool = False,
-                                  context: Optional[List[Message]] = None,
+                                  context: Optional[Sequence[Message]] = None,
                                   is_background: bool = False, **kwargs):
         """
         Append a message to a specified conversation.
@@ -166,6 +167,8 @@ class ConversationManager:
         """
         Get and append a response from openai to a specified conversation.
 
+        If the messages do not fit the context of the model, we plan upfront which model to bump to, and which
+        messages to hide (see `plan_context_trimming`).
         If failed, retry while removing more messages upstream.
         """
         hidden_messages = convert_general_message_designation_to_list(hidden_messages)
@@ -176,9 +179,22 @@ class ConversationManager:
         openai_call_parameters = \
             OpenaiCallParameters(**{k: kwargs.pop(k) for k in OPENAI_CALL_PARAMETERS_NAMES if k in kwargs})
 
-        # we try to get a response. if we fail we bump the model, and then gradually remove messages from the top,
-        # starting at message 1 (we don't remove message 0, which is the system message).
         model = openai_call_parameters.model_engine or ModelEngine.DEFAULT
+        plan = plan_context_trimming(indices_and_messages, model,
+                                     expected_tokens_in_response or DEFAULT_EXPECTED_TOKENS_IN_RESPONSE)
+        if not plan.is_trivial():
+            print_and_log_red(f'############# Trimming context #############\n{plan.pretty_repr()}')
+        if plan.model_engine is not model:
+            model = openai_call_parameters.model_engine = plan.model_engine
+        if plan.hidden_indices:
+            actual_hidden_messages.extend(plan.hidden_indices)
+            plan_hidden_indices = set(plan.hidden_indices)
+            indices_and_messages = [(index, message) for index, message in indices_and_messages
+                                    if index not in plan_hidden_indices]
+
+        # we try to get a response. if we fail (e.g. the server counts more tokens than planned) we bump the model,
+        # and then gradually remove messages from the top,
+        # starting at message 1 (we don't remove message 0, which is the system message).
         while True:
             message = self._try_get_and_append_llm_response(tag=tag, comment=comment, is_code=is_code,
                                                             is_json=is_json,
@@ -192,10 +208,11 @@ class ConversationManager:
 
             # we failed to get a response. We start by bumping the model, if possible:
             try:
-                model = model.get_model_with_more_context()
-                model_was_bumped = True
+                bumped_model = model.get_model_with_more_context()
             except ValueError:
-                model_was_bumped = False
+                bumped_model = model
+            model_was_bumped = bumped_model is not model  # the largest models map to themselves
+            model = bumped_model
             if model_was_bumped:
                 print_and_log_red(f'############# Bumping model #############')
                 openai_call_parameters.model_engine = model
@@ -239,7 +256,7 @@ class ConversationManager:
         if is_code:
             content = add_label_to_first_triple_quotes_if_missing(content, 'python')
         message = create_message(
-            context=messages,
+            context=self.conversation.get_context(messages),
             role=Role.ASSISTANT, content=content, tag=tag, agent=self.assistant_agent,
             openai_call_parameters=None if openai_call_parameters.is_all_none() else openai_call_parameters,
             previous_code=previous_code, is_code=is_code,
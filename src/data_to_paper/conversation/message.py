@@ -3,14 +3,15 @@ from __future__ import annotations
 import difflib
 import colorama
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
-from typing import NamedTuple, Optional, List
+from typing import NamedTuple, Optional, Dict, Sequence, Tuple
 
 from data_to_paper.env import TEXT_WIDTH, MINIMAL_COMPACTION_TO_SHOW_CODE_DIFF, HIDE_INCOMPLETE_CODE, SHOW_LLM_CONTEXT
 from data_to_paper.base_cast import Agent
 from data_to_paper.run_gpt_code.code_utils import extract_code_from_text, FailedExtractingBlock
-from data_to_paper.servers.llm_call import count_number_of_tokens_in_message
+from data_to_paper.servers.llm_call import count_number_of_tokens_in_message, count_number_of_tokens_in_text, \
+    get_encoding_for_model_engine
 from data_to_paper.servers.model_engine import OpenaiCallParameters, ModelEngine
 from data_to_paper.text import line_count, wrap_as_block
 from data_to_paper.text.highlighted_text import colored_text, format_text_with_code_blocks
@@ -69,7 +70,12 @@ class Message:
     effective_index_in_conversation: Optional[int] = None
     # index of the message in the conversation, ignoring commenter and ignored messages
 
-    context: List[Message] = None
+    context: Sequence[Message] = None
+    # the messages sent to the LLM to get this message (a list, or a compact `MessageContext`)
+
+    _encodings_to_content_and_num_tokens: Optional[Dict[Tuple[str, bool], Tuple[str, int]]] = \
+        field(default=None, init=False, repr=False, compare=False)
+    # memoised token counts of the content (with, and without, a trailing newline)
 
     def to_llm_dict(self):
         return {'role': Role.ASSISTANT.value if self.role.is_assistant_or_surrogate()
@@ -143,9 +149,21 @@ class Message:
             is_incomplete_code = HIDE_INCOMPLETE_CODE and last_section is not None and not last_section.is_complete
         return content, is_incomplete_code
 
-    def get_number_of_tokens(self, model_engine: ModelEngine = None) -> int:
+    def get_number_of_tokens(self, model_engine: ModelEngine = None, with_trailing_newline: bool = False) -> int:
+        """
+        Return the number of tokens in the content (followed by a newline, if `with_trailing_newline`).
+        The count is memoised per encoding, and is re-counted if the content is replaced.
+        """
         model_engine = model_engine or self.get_llm_model()
-        return count_number_of_tokens_in_message([self], model_engine)
+        key = (get_encoding_for_model_engine(model_engine).name, with_trailing_newline)
+        if self._encodings_to_content_and_num_tokens is None:
+            self._encodings_to_content_and_num_tokens = {}
+        content_and_num_tokens = self._encodings_to_content_and_num_tokens.get(key)
+        if content_and_num_tokens is None or content_and_num_tokens[0] is not self.content:
+            text = self.content + '\n' if with_trailing_newline else self.content
+            content_and_num_tokens = (self.content, count_number_of_tokens_in_text(text, model_engine))
+            self._encodings_to_content_and_num_tokens[key] = content_and_num_tokens
+        return content_and_num_tokens[1]
 
     def get_number_of_tokens_in_context(self) -> int:
         if self.context is None:
@@ -275,7 +293,7 @@ class JsonMessage(Message):
 
 
 def create_message(role: Role, content: str, tag: str = '', agent: Optional[Agent] = None, ignore: bool = False,
-                   openai_call_parameters: OpenaiCallParameters = None, context: List[Message] = None,
+                   openai_call_parameters: OpenaiCallParameters = None, context: Sequence[Message] = None,
                    previous_code: str = None, is_code: bool = False,
                    is_json: bool = False,
                    is_background: bool = False) -> Message:
@@ -0,0 +1,103 @@
+"""
+A compact representation of the context of a message (the messages sent to the LLM to get the message).
+
+The contexts of consecutive messages in a conversation are mostly the same messages. Rather than a list of all the
+messages, a context is a reference into an append-only store of the messages of the conversation, given as runs of
+consecutive store indices. A context is usually a single run, or a few runs if messages were hidden or reset.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple, Union, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .message import Message
+
+
+class MessageStore:
+    """
+    An append-only store of messages. Each message is stored once, and is referred to by its index in the store.
+    """
+
+    def __init__(self):
+        self._messages: List[Message] = []
+        self._ids_to_indices: Dict[int, int] = {}
+
+    def __len__(self):
+        return len(self._messages)
+
+    def __getitem__(self, index):
+        return self._messages[index]
+
+    def intern(self, message: Message) -> int:
+        """
+        Return the index of the message in the store, adding the message if it is not in the store.
+        """
+        index = self._ids_to_indices.get(id(message))
+        if index is None:
+            index = self._ids_to_indices[id(message)] = len(self._messages)
+            self._messages.append(message)
+        return index
+
+    def __getstate__(self):
+        return {'_messages': self._messages}
+
+    def __setstate__(self, state):
+        self._messages = state['_messages']
+        self._ids_to_indices = {id(message): index for index, message in enumerate(self._messages)}
+
+
+class MessageContext(Sequence['Message']):
+    """
+    An immutable sequence of messages, stored as runs (start, stop) of indices into a `MessageStore`.
+    """
+
+    def __init__(self, store: MessageStore, runs: Tuple[Tuple[int, int], ...]):
+        self.store = store
+        self.runs = runs
+        self._len = sum(stop - start for start, stop in runs)
+
+    @classmethod
+    def from_messages(cls, messages: Iterable[Message], store: MessageStore) -> MessageContext:
+        runs = []
+        for index in (store.intern(message) for message in messages):
+            if runs and runs[-1][1] == index:
+                runs[-1][1] += 1
+            else:
+                runs.append([index, index + 1])
+        return cls(store, tuple((start, stop) for start, stop in runs))
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self) -> Iterator[Message]:
+        for start, stop in self.runs:
+            yield from self.store[start:stop]
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Message, List[Message]]:
+        if isinstance(index, slice):
+            return list(self)[index]
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError('context index out of range')
+        for start, stop in self.runs:
+            if index < stop - start:
+                return self.store[start + index]
+            index -= stop - start
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence) or isinstance(other, str):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def __getstate__(self):
+        return {'store': self.store, 'runs': self.runs}
+
+    def __setstate__(self, state):
+        self.__init__(state['store'], state['runs'])
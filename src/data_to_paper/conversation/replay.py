@@ -3,17 +3,24 @@ from pathlib import Path
 
 from typing import Union
 
+from .action_journal import ActionJournalReader, is_action_journal
 from .actions_and_conversations import Actions
 
 
 def replay_actions(file_path: Union[str, Path], is_color: bool = True):
     """
     Replay a list of actions on conversations.
+
+    Actions of an action journal are read and replayed one at a time (on new conversations).
+    Actions are re-appended as they are replayed, so that repeated contents are abbreviated as in the original run.
     """
     actions = Actions()
 
-    actions.load_actions_from_file(file_path)
-    for action in actions:
-        actions.apply_action(action, is_color=is_color, should_append=False)
+    if is_action_journal(file_path):
+        saved_actions = ActionJournalReader(file_path)
+    else:
+        saved_actions = Actions().load_actions_from_file(file_path)
+    for action in saved_actions:
+        actions.apply_action(action, is_color=is_color)
 
     return actions
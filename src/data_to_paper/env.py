@@ -1,3 +1,4 @@
+import tempfile
 from pathlib import Path
 
 from data_to_paper.servers.model_engine import ModelEngine
@@ -21,6 +22,13 @@ CODING_MODEL_ENGINE = ModelEngine.GPT4o
 JSON_MODEL_ENGINE = ModelEngine.GPT4o
 WRITING_MODEL_ENGINE = ModelEngine.GPT4o
 
+# Max number of LLM requests sent concurrently:
+MAX_CONCURRENT_LLM_REQUESTS = Mutable(8)
+
+# Throttle LLM requests by the requests/tokens per minute of each model engine (MODEL_ENGINE_TO_RATE_LIMITS).
+# Off by default: the API enforces its own limits, and rate-limit errors are retried with backoff.
+LIMIT_LLM_REQUEST_RATES = Flag(False)
+
 """ SCHOLAR SERVER """
 # Choose the server for the scholar API:
 if SEMANTIC_SCHOLAR_API_KEY.key is not None:
@@ -28,6 +36,13 @@ if SEMANTIC_SCHOLAR_API_KEY.key is not None:
 else:
     SCHOLAR_SERVER = ScholarServer("Crossref")
 
+# A cache of literature-search and embedding responses, shared by all runs and projects (SQLite file).
+# Responses not found in the run's recorded responses are looked up here before querying the server.
+# None to not use a shared cache. For example: Path.home() / ".cache" / "data_to_paper" / "scholar_cache.sqlite"
+SHARED_RESPONSE_CACHE_FILEPATH = Mutable(None)
+SHARED_RESPONSE_CACHE_TTL = Mutable(30 * 24 * 60 * 60)  # seconds. None for no expiration
+SHARED_RESPONSE_CACHE_MAX_SIZE = Mutable(1024 ** 3)  # bytes. None for unlimited
+
 # Use json mode when requesting LLM structured response:
 JSON_MODE = True
 
@@ -38,6 +53,10 @@ SUPPORTED_PACKAGES = ("numpy", "pandas", "scipy", "sklearn")
 # max time for code timeout when running LLM-writen code (seconds)
 MAX_EXEC_TIME = Mutable(600)
 
+# Run LLM code in a pool of pre-warmed worker processes (instead of starting a new process for each run).
+# Saves the process start-up and library-import time on each debug iteration.
+RUN_CODE_IN_WORKER_POOL = Flag(False)
+
 # Round numbers in LLM code output:
 NUM_DIGITS_FOR_FLOATS = 4
 
@@ -66,6 +85,28 @@ HIDE_INCOMPLETE_CODE = Flag(True)
 DELAY_CODE_RUN_CACHE_RETRIEVAL = Mutable(0.01)  # seconds
 DELAY_SERVER_CACHE_RETRIEVAL = Mutable(0.01)  # seconds
 
+# Write the conversation actions of a run, as they are applied, to an action journal in the output directory
+# (conversation_actions.pkl), so that the run can be replayed, or followed while it is in progress:
+JOURNAL_CONVERSATION_ACTIONS = Flag(False)
+
+# Folder for indexes of the functions that the overrides of LLM code replace (e.g. the scipy functions that return
+# p-values), keyed by the package version. None to discover the functions each time the code is run.
+OVERRIDES_TARGETS_INDEX_FOLDER = Mutable(Path(tempfile.gettempdir()) / "data_to_paper_overrides_index")
+
+# Max size of the code-run cache (bytes). Least-recently-used runs are evicted. None for unlimited.
+MAX_CODE_RUN_CACHE_SIZE = Mutable(None)
+
+# Hash of data files for the code-run cache key: 'sha256', 'blake2b', or (requires installing) 'xxhash', 'blake3'.
+CODE_RUN_CACHE_HASH_ALGORITHM = Mutable('sha256')
+
+""" LATEX """
+# Folder for precompiled latex formats of the document preamble (built with `pdflatex -ini` and mylatexformat),
+# so that repeated compilations skip loading the packages. None to compile the preamble with each document.
+LATEX_FORMATS_FOLDER = Mutable(Path(tempfile.gettempdir()) / "data_to_paper_latex_formats")
+
+# Max size of the cache of latex compilations (bytes). Least-recently-used compilations are evicted. None for unlimited.
+MAX_LATEX_COMPILATION_CACHE_SIZE = Mutable(256 * 1024 ** 2)
+
 # Pause time (in seconds). 0 for no pause; None to wait for Continue button.
 PAUSE_AT_RULE_BASED_FEEDBACK = Mutable(None)
 PAUSE_AT_LLM_FEEDBACK = Mutable(None)
@@ -1,15 +1,17 @@
 import re
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from functools import partial
-from typing import Optional, Dict, Union, Iterable, Collection, Tuple
+from typing import Optional, Dict, Union, Iterable, Collection, Tuple, List
 
 from pathlib import Path
 
 from data_to_paper.terminate.exceptions import MissingInstallationError
+from data_to_paper.latex.exceptions import BaseLatexProblemInCompilation, LatexCompilationError
 from data_to_paper.latex.clean_latex import process_latex_text_and_math
 from data_to_paper.latex.latex_to_pdf import evaluate_latex_num_command, is_pdflatex_package_installed, \
-    is_pdflatex_installed, save_latex_and_compile_to_pdf, PDFLATEX_INSTALLATION_INSTRUCTIONS
+    is_pdflatex_installed, save_latex_and_compile_to_pdf, is_latex_compilation_cached, \
+    PDFLATEX_INSTALLATION_INSTRUCTIONS
 
 from data_to_paper.servers.custom_types import Citation
 from data_to_paper.text import dedent_triple_quote_str
@@ -135,6 +137,34 @@ IS_PDFLATEX_INSTALLED: Optional[bool] = None
 MISSING_PDFLATEX_PACKAGES: Optional[bool] = None
 
 
+def get_table_widths_from_pdflatex_output(pdflatex_output: str, num_tables: int) -> List[Optional[float]]:
+    """
+    Parse the output of compiling tables in a batch (see `LatexDocument.compile_tables`).
+    Return the width of each table, as fraction of the page margin width; None for tables with errors, or
+    whose width was not reported.
+    """
+    widths = [None] * num_tables
+    margin_width = re.findall(pattern=r'Page margin width: (\d+\.\d+)pt', string=pdflatex_output)
+    if not margin_width:
+        return widths
+    margin_width = float(margin_width[0])
+    index = None
+    indices_with_errors = set()
+    for line in pdflatex_output.splitlines():
+        start_match = re.match(pattern=r'Start of table (\d+)$', string=line)
+        width_match = re.match(pattern=r'Width of table (\d+): (\d+\.\d+)pt', string=line)
+        if start_match:
+            index = int(start_match.group(1))
+        elif width_match:
+            width_index = int(width_match.group(1))
+            if width_index not in indices_with_errors:
+                widths[width_index] = float(width_match.group(2)) / margin_width
+            index = None
+        elif line.startswith(LatexCompilationError.problem_starting_term) and index is not None:
+            indices_with_errors.add(index)
+    return widths
+
+
 @dataclass(frozen=True)
 class LatexDocument:
     """
@@ -160,6 +190,9 @@ class LatexDocument:
 
     allow_displayitem_tilde: bool = False
 
+    _tables_to_widths: Dict[str, float] = field(default_factory=dict, init=False, repr=False, compare=False)
+    # widths of tables compiled in a batch (see `compile_tables`)
+
     def _style_section(self, section: str) -> str:
         if not self.section_numbering:
             section = section.replace(r'\section{', r'\section*{')
@@ -193,6 +226,22 @@ class LatexDocument:
 
         return section
 
+    def get_preamble(self) -> str:
+        """
+        Return the start of the document, which is the same for all documents (the document class, the packages,
+        and the initiation commands).
+        """
+        s = ''
+        s += r"\documentclass[{fontsize}pt]{{{kind}}}".format(kind=self.kind, fontsize=self.fontsize) + '\n'
+        s += '\n'.join([r'\usepackage' + package for package in self.packages]) + '\n'
+
+        s += '\\sectionfont{\\' + self.section_heading_fontsize + '}\n'
+        s += '\\subsectionfont{\\' + self.subsection_heading_fontsize + '}\n'
+        s += '\\subsubsectionfont{\\' + self.subsubsection_heading_fontsize + '}\n'
+
+        s += '\n'.join(self.initiation_commands) + '\n'
+        return s
+
     def get_document(self,
                      content: Optional[Union[str, Iterable[str], Dict[Optional[str], str]]] = None,
                      title: Optional[str] = None,
@@ -210,15 +259,7 @@ class LatexDocument:
                 abstract = content.pop('abstract')
 
         # Build the document:
-        s = ''
-        s += r"\documentclass[{fontsize}pt]{{{kind}}}".format(kind=self.kind, fontsize=self.fontsize) + '\n'
-        s += '\n'.join([r'\usepackage' + package for package in self.packages]) + '\n'
-
-        s += '\\sectionfont{\\' + self.section_heading_fontsize + '}\n'
-        s += '\\subsectionfont{\\' + self.subsection_heading_fontsize + '}\n'
-        s += '\\subsubsectionfont{\\' + self.subsubsection_heading_fontsize + '}\n'
-
-        s += '\n'.join(self.initiation_commands) + '\n'
+        s = self.get_preamble()
 
         # Define title, author:
         if title is not None and not title.startswith(r'\title'):
@@ -353,23 +394,28 @@ class LatexDocument:
         `LatexCompilationError` is raised if there are errors.
         """
 
-        self.raise_if_pdflatex_is_not_installed()
-        self.raise_if_packages_are_not_installed()
-
         latex = self.get_document(content=content, title=title, abstract=abstract, appendix=appendix, author=author,
                                   with_references=bool(references), add_before_document=add_before_document)
+        if not is_latex_compilation_cached(latex, output_directory=output_directory, references=references,
+                                           format_cite=format_cite, figures_folder=figures_folder):
+            self.raise_if_pdflatex_is_not_installed()
+            self.raise_if_packages_are_not_installed()
         pdf_output, over_width_pts = save_latex_and_compile_to_pdf(latex, file_stem=file_stem,
                                                                    output_directory=output_directory,
                                                                    references=references,
                                                                    format_cite=format_cite,
-                                                                   figures_folder=figures_folder)
+                                                                   figures_folder=figures_folder,
+                                                                   preamble=self.get_preamble())
         return latex, pdf_output, over_width_pts
 
     def compile_table(self, latex_table: str, file_stem: str = 'test', output_directory: Optional[str] = None) -> float:
         """
         Compile a latex table to pdf and return the width of the tabular part of the table,
         expressed as fraction of the page margin width.
+        Tables already compiled in a batch (see `compile_tables`) are not compiled again.
         """
+        if output_directory is None and latex_table in self._tables_to_widths:
+            return self._tables_to_widths[latex_table]
 
         lrbox_table = dedent_triple_quote_str(r"""
             % Define the save box within the document block
@@ -394,3 +440,71 @@ class LatexDocument:
         table_width = re.findall(pattern=r'Table width: (\d+\.\d+)pt', string=pdf_output)[0]
         margin_width = re.findall(pattern=r'Page margin width: (\d+\.\d+)pt', string=pdf_output)[0]
         return float(table_width) / float(margin_width)
+
+    def compile_tables(self, latex_tables: Iterable[str], file_stem: str = 'test') -> List[Optional[float]]:
+        """
+        Compile many latex tables in a single pdflatex run, and return the width of the tabular part of each table,
+        expressed as fraction of the page margin width (as in `compile_table`).
+
+        Each table is typeset between its own start and width markers, so that errors are attributed to the
+        table in which they occurred. The width is None for tables with errors; compiling these with
+        `compile_table` gives their own error.
+        A table with an error may affect the following tables (e.g., with an unclosed group), so the widths of
+        the tables after it are not used; these tables are compiled again, in a new batch.
+        The widths are kept, so that `compile_table` does not compile these tables again.
+        """
+        latex_tables = list(latex_tables)
+        widths = [None] * len(latex_tables)
+        indices_to_compile = []
+        for index, latex_table in enumerate(latex_tables):
+            try:
+                get_tabular_block(latex_table)
+            except AttributeError:
+                continue  # no tabular block; left for `compile_table`
+            indices_to_compile.append(index)
+        while indices_to_compile:
+            batch_widths = self._compile_tables_batch(latex_tables, indices_to_compile, file_stem)
+            if batch_widths is None:
+                break
+            num_reliable = next((i for i, index in enumerate(indices_to_compile) if batch_widths[index] is None),
+                                len(indices_to_compile))
+            for index in indices_to_compile[:num_reliable]:
+                widths[index] = batch_widths[index]
+                self._tables_to_widths[latex_tables[index]] = widths[index]
+            indices_to_compile = indices_to_compile[num_reliable + 1:]
+        return widths
+
+    def _compile_tables_batch(self, latex_tables: List[str], indices_to_compile: List[int],
+                              file_stem: str) -> Optional[List[Optional[float]]]:
+        """
+        Compile the tables of the given indices in a single pdflatex run, and return the width of each of the
+        tables (None for tables that were not compiled, or had errors).
+        Return None if the document cannot be compiled, or fails before the tables.
+        """
+        content = dedent_triple_quote_str(r"""
+            \newsavebox{\mytablebox} % Create a box to store the tables
+            \typeout{Page margin width: \the\textwidth}
+            """)
+        for index in indices_to_compile:
+            latex_table = latex_tables[index]
+            tabular = get_tabular_block(latex_table)
+            content += dedent_triple_quote_str(r"""
+
+                \typeout{Start of table <index>}
+                \begin{lrbox}{\mytablebox}
+                  <tabular>%
+                \end{lrbox}
+                <table>
+                \clearpage
+                \typeout{Width of table <index>: \the\wd\mytablebox}
+                """).replace('<index>', str(index)).replace('<tabular>', tabular).replace('<table>', latex_table)
+
+        try:
+            _, pdf_output, _ = self.compile_document(content=content, format_cite=False, file_stem=file_stem)
+        except LatexCompilationError as e:
+            pdf_output = e.pdflatex_output
+        except BaseLatexProblemInCompilation:
+            return None  # e.g. a wrong \num command; left for `compile_table`
+        if 'Page margin width: ' not in pdf_output:
+            return None
+        return get_table_widths_from_pdflatex_output(pdf_output, len(latex_tables))
@@ -1,19 +1,28 @@
+import atexit
+import hashlib
 import importlib
 import os
 import re
 import shutil
 import subprocess
+import tempfile
 import fitz  # PyMuPDF
 import numpy as np
 
-from typing import Optional, Collection, Tuple, Dict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Optional, Collection, Tuple, Dict, List, Iterator, Iterable, Callable
 
 from pathlib import Path
 
+from data_to_paper.env import LATEX_FORMATS_FOLDER, MAX_LATEX_COMPILATION_CACHE_SIZE
+from data_to_paper.run_gpt_code.cache_store import IndexedCacheStore, get_content_hash
 from data_to_paper.utils.subprocess_call import get_subprocess_kwargs
 from data_to_paper.terminate.exceptions import MissingInstallationError
 from data_to_paper.servers.custom_types import Citation
-from data_to_paper.utils.file_utils import run_in_temp_directory
+from data_to_paper.utils.file_utils import run_in_temp_directory, run_in_directory
+from data_to_paper.utils.mutable import Mutable
+from data_to_paper.utils.print_to_file import print_and_log
 from data_to_paper.code_and_output_files.ref_numeric_values import replace_hyperlinks_with_values
 from data_to_paper.text.text_extractors import extract_all_external_brackets
 
@@ -22,6 +31,17 @@ from .exceptions import LatexCompilationError, LatexNumCommandFormulaEvalError,
 
 BIB_FILENAME: str = 'citations.bib'
 
+# Folder of the cache of latex compilations (see `save_latex_and_compile_to_pdf`). None to not cache.
+LATEX_COMPILATION_CACHE_DIRECTORY = Mutable(None)
+_DIRECTORIES_TO_LATEX_COMPILATION_STORES: Dict[Path, IndexedCacheStore] = {}
+# Compilation errors are cached only in the current process (keyed by the cache directory and the key of the
+# compilation), as they may be caused by the TeX installation (e.g. a missing package), which can be fixed between runs:
+_LATEX_COMPILATION_KEYS_TO_ERRORS: Dict[Tuple[Path, tuple], Tuple[LatexCompilationError, Dict[str, bytes]]] = {}
+
+# With a precompiled format, mylatexformat skips the preamble of the document up to this command
+# (which is \relax when compiling without the format):
+END_OF_PRECOMPILED_PREAMBLE = r'\csname endofdump\endcsname'
+
 PDFLATEX_INSTALLATION_INSTRUCTIONS = r"""
 Installations instructions for pdflatex:
 
@@ -79,6 +99,66 @@ def is_pdflatex_package_installed(package: str) -> Optional[bool]:
     return True
 
 
+FOLDERS_AND_PREAMBLES_TO_FORMAT_FILES: Dict[Tuple[Path, str], Optional[Path]] = {}
+
+
+def _get_pdflatex_version() -> str:
+    return subprocess.run(['pdflatex', '--version'], **get_subprocess_kwargs()).stdout.decode().splitlines()[0]
+
+
+def _build_format_file(preamble: str, format_file: Path) -> bool:
+    """
+    Dump the preamble into a format file, using `pdflatex -ini` and mylatexformat.
+    Check that a document compiles with the format.
+    Return whether the format was built.
+    """
+    format_name = format_file.stem
+    with run_in_temp_directory():
+        with open('preamble.tex', 'w', encoding='utf-8') as f:
+            f.write(preamble + '\\begin{document}\n\\end{document}\n')
+        with open('check.tex', 'w', encoding='utf-8') as f:
+            f.write(preamble + END_OF_PRECOMPILED_PREAMBLE + '\n\\begin{document}\ncheck\n\\end{document}\n')
+        try:
+            subprocess.run(['pdflatex', '-ini', '-interaction=nonstopmode', f'-jobname={format_name}',
+                            '&pdflatex', 'mylatexformat.ltx', 'preamble.tex'], **get_subprocess_kwargs(capture=False))
+            subprocess.run(['pdflatex', f'-fmt={format_name}', '-interaction=nonstopmode', 'check.tex'],
+                           **get_subprocess_kwargs(capture=False))
+        except (FileNotFoundError, subprocess.CalledProcessError):
+            return False
+        if not os.path.exists('check.pdf'):
+            return False
+        format_file.parent.mkdir(parents=True, exist_ok=True)
+        # replace atomically, in case another process is building the same format:
+        shutil.copy(format_name + '.fmt', str(format_file) + '.tmp')
+        os.replace(str(format_file) + '.tmp', format_file)
+    return True
+
+
+def get_precompiled_format_file(preamble: str) -> Optional[Path]:
+    """
+    Return a format file with the preamble precompiled, so that compiling a document with this preamble does not
+    load the packages again.
+    Formats are kept in `LATEX_FORMATS_FOLDER`, keyed by the hash of the preamble and the pdflatex version; a format
+    is built the first time its preamble is compiled.
+    Return None if precompiled formats are disabled, or not supported (e.g. mylatexformat is not installed).
+    """
+    if LATEX_FORMATS_FOLDER.val is None:
+        return None
+    formats_folder = Path(LATEX_FORMATS_FOLDER.val)
+    if (formats_folder, preamble) not in FOLDERS_AND_PREAMBLES_TO_FORMAT_FILES:
+        format_file = None
+        try:
+            key = hashlib.sha256((_get_pdflatex_version() + '\n' + preamble).encode('utf-8')).hexdigest()
+        except (FileNotFoundError, subprocess.CalledProcessError):
+            key = None
+        if key is not None:
+            format_file = formats_folder / f'preamble_{key[:16]}.fmt'
+            if not format_file.exists() and not _build_format_file(preamble, format_file):
+                format_file = None
+        FOLDERS_AND_PREAMBLES_TO_FORMAT_FILES[(formats_folder, preamble)] = format_file
+    return FOLDERS_AND_PREAMBLES_TO_FORMAT_FILES[(formats_folder, preamble)]
+
+
 def is_string_plain_number(string: str) -> bool:
     try:
         float(string)
@@ -173,20 +253,251 @@ def _get_over_width_pts(pdflatex_output: str) -> Optional[float]:
     return None
 
 
+AUXILIARY_EXTENSIONS = ('.aux', '.toc', '.lof', '.lot', '.out', '.bbl')  # files that pdflatex passes read
+MAX_PDFLATEX_PASSES = 5
+
+
+@dataclass
+class LatexCompilationFolder:
+    """
+    A folder in which a document is compiled.
+    The folder of a paper is kept between its compilations, so that the auxiliary files (.aux, .bbl, ...) and the
+    figures of the previous compilation are reused, and a recompilation after small edits takes a single pass.
+    """
+    path: str
+    bibtex_inputs_hash: Optional[str] = None
+    passes: List[str] = field(default_factory=list)
+    "The passes (pdflatex, bibtex) run in the last compilation."
+
+
+OUTPUT_DIRECTORIES_AND_FILE_STEMS_TO_COMPILATION_FOLDERS: Dict[Tuple[str, str], LatexCompilationFolder] = {}
+
+
+@contextmanager
+def _run_in_compilation_folder(file_stem: str, output_directory: Optional[str] = None,
+                               ) -> Iterator[LatexCompilationFolder]:
+    """
+    Run in the compilation folder of the document saved to the output directory (created on first use),
+    or in a new temporary folder if the document is not saved.
+    """
+    if output_directory is None:
+        with run_in_temp_directory() as folder:
+            yield LatexCompilationFolder(folder)
+        return
+    key = (os.path.abspath(output_directory), file_stem)
+    compilation_folder = OUTPUT_DIRECTORIES_AND_FILE_STEMS_TO_COMPILATION_FOLDERS.get(key)
+    if compilation_folder is None or not os.path.exists(compilation_folder.path):
+        compilation_folder = LatexCompilationFolder(tempfile.mkdtemp(prefix='data_to_paper_latex_'))
+        atexit.register(shutil.rmtree, compilation_folder.path, ignore_errors=True)
+        OUTPUT_DIRECTORIES_AND_FILE_STEMS_TO_COMPILATION_FOLDERS[key] = compilation_folder
+    with run_in_directory(compilation_folder.path):
+        yield compilation_folder
+
+
+def _copy_if_changed(file_path: Path):
+    """
+    Copy the file to the current folder, unless it is already there (same size and modification time).
+    """
+    file_path = Path(file_path)
+    stat = file_path.stat()
+    if os.path.exists(file_path.name):
+        copied_stat = os.stat(file_path.name)
+        if copied_stat.st_size == stat.st_size and copied_stat.st_mtime == stat.st_mtime:
+            return
+    shutil.copy2(file_path, file_path.name)
+
+
+def _get_hash_of_files(file_names: Iterable[str], line_filter: Callable[[str], bool] = None) -> str:
+    hasher = hashlib.sha256()
+    for file_name in file_names:
+        hasher.update(file_name.encode('utf-8') + b'\0')
+        if not os.path.exists(file_name):
+            continue
+        with open(file_name, 'rb') as f:
+            for line in f:
+                if line_filter is None or line_filter(line.decode('utf-8', errors='replace')):
+                    hasher.update(line)
+    return hasher.hexdigest()
+
+
+def _is_aux_line_read_by_pdflatex(line: str) -> bool:
+    # the page count, and the \relax at the start, do not affect the next pass
+    return not (line.startswith(r'\relax') or line.startswith(r'\gdef \@abspage@last'))
+
+
+def _is_aux_line_read_by_bibtex(line: str) -> bool:
+    return line.startswith(r'\citation') or line.startswith(r'\bibdata') or line.startswith(r'\bibstyle')
+
+
+def _get_hash_of_auxiliary_files(file_stem: str) -> str:
+    """
+    Hash of the auxiliary files that a pdflatex pass reads; if a pass does not change them, the document
+    reached a fixed point.
+    """
+    return _get_hash_of_files([file_stem + '.aux'], _is_aux_line_read_by_pdflatex) + \
+        _get_hash_of_files([file_stem + extension for extension in AUXILIARY_EXTENSIONS[1:]])
+
+
+def _remove_auxiliary_files(file_stem: str):
+    for extension in AUXILIARY_EXTENSIONS:
+        if os.path.exists(file_stem + extension):
+            os.remove(file_stem + extension)
+
+
+def _get_referenced_figures(latex_content: str, figures_folder: Optional[Path] = None) -> List[Path]:
+    if figures_folder is None:
+        return []
+    return sorted(f for f in figures_folder.glob('*.png') if f.is_file() and f.stem in latex_content)
+
+
+def _get_latex_compilation_key(latex_content: str, references: Collection[Citation] = None,
+                               format_cite: bool = True, figures_folder: Optional[Path] = None,
+                               with_files: bool = False) -> tuple:
+    """
+    The key of a compilation in the cache: the hashes of the latex content, the references, and the content
+    of the figures referenced by the latex content.
+    """
+    references_hash = hashlib.sha256(
+        '\n\n'.join(sorted(reference.bibtex for reference in references or ())).encode('utf-8')).hexdigest()
+    figures_hashes = tuple((figure.name, get_content_hash(figure.read_bytes()))
+                           for figure in _get_referenced_figures(latex_content, figures_folder))
+    return ('latex_compilation', get_content_hash(latex_content.encode('utf-8')), references_hash, figures_hashes,
+            format_cite, with_files)
+
+
+def get_latex_compilation_cache_store() -> Optional[IndexedCacheStore]:
+    """
+    Return the cache of latex compilations, or None if compilations are not cached.
+    """
+    directory = LATEX_COMPILATION_CACHE_DIRECTORY.val
+    if directory is None:
+        return None
+    directory = Path(directory).absolute()
+    store = _DIRECTORIES_TO_LATEX_COMPILATION_STORES.get(directory)
+    if store is None:
+        store = _DIRECTORIES_TO_LATEX_COMPILATION_STORES[directory] = IndexedCacheStore(directory=directory)
+    store.max_size = MAX_LATEX_COMPILATION_CACHE_SIZE.val
+    return store
+
+
+def is_latex_compilation_cached(latex_content: str, output_directory: Optional[str] = None,
+                                references: Collection[Citation] = None, format_cite: bool = True,
+                                figures_folder: Optional[Path] = None) -> bool:
+    store = get_latex_compilation_cache_store()
+    if store is None:
+        return False
+    key = _get_latex_compilation_key(latex_content, references, format_cite, figures_folder,
+                                     with_files=output_directory is not None)
+    return key in store or (store.directory, key) in _LATEX_COMPILATION_KEYS_TO_ERRORS
+
+
 def save_latex_and_compile_to_pdf(latex_content: str, file_stem: str, output_directory: Optional[str] = None,
                                   references: Collection[Citation] = None, format_cite: bool = True,
-                                  figures_folder: Optional[Path] = None,
+                                  figures_folder: Optional[Path] = None, preamble: Optional[str] = None,
                                   ) -> Tuple[str, Optional[float]]:
+    """
+    Compile the latex content to pdf (see `_save_latex_and_compile_to_pdf`).
+
+    Compilations are cached in `LATEX_COMPILATION_CACHE_DIRECTORY` (if set), keyed by the latex content, the
+    references and the referenced figures. The cache keeps the pdflatex output (from which table widths are read),
+    and, for documents saved to an output directory, the saved files (pdf, tex, bib).
+    Compilation errors are cached only for the current process.
+    """
+    store = get_latex_compilation_cache_store()
+    if store is None:
+        return _save_latex_and_compile_to_pdf(latex_content, file_stem, output_directory, references, format_cite,
+                                              figures_folder, preamble)
+    saved_files = {'.tex': file_stem + '.tex', '.pdf': file_stem + '.pdf', '.bib': BIB_FILENAME}
+    key = _get_latex_compilation_key(latex_content, references, format_cite, figures_folder,
+                                     with_files=output_directory is not None)
+    if (store.directory, key) in _LATEX_COMPILATION_KEYS_TO_ERRORS:
+        error, extensions_to_contents = _LATEX_COMPILATION_KEYS_TO_ERRORS[(store.directory, key)]
+        pdflatex_output = over_width_pts = None
+    elif key in store:
+        (pdflatex_output, over_width_pts, error), extensions_to_contents = store.get(key)
+    else:
+        error = extensions_to_contents = None
+    if extensions_to_contents is not None:
+        if output_directory is not None:
+            for extension, content in extensions_to_contents.items():
+                with open(os.path.join(output_directory, saved_files[extension]), 'wb') as f:
+                    f.write(content)
+        if error is not None:
+            raise error
+        return pdflatex_output, over_width_pts
+
+    def get_saved_files_contents(extensions) -> Dict[str, bytes]:
+        if output_directory is None:
+            return {}
+        extensions_to_contents = {}
+        for extension in extensions:
+            file_path = os.path.join(output_directory, saved_files[extension])
+            if os.path.exists(file_path):
+                with open(file_path, 'rb') as f:
+                    extensions_to_contents[extension] = f.read()
+        return extensions_to_contents
+
+    try:
+        pdflatex_output, over_width_pts = _save_latex_and_compile_to_pdf(
+            latex_content, file_stem, output_directory, references, format_cite, figures_folder, preamble)
+    except LatexCompilationError as e:
+        _LATEX_COMPILATION_KEYS_TO_ERRORS[(store.directory, key)] = (e, get_saved_files_contents(['.tex']))
+        raise
+    extensions = ['.tex', '.pdf', '.bib'] if references else ['.tex', '.pdf']
+    store.put(key, (pdflatex_output, over_width_pts, None), get_saved_files_contents(extensions))
+    return pdflatex_output, over_width_pts
+
+
+def _save_latex_and_compile_to_pdf(latex_content: str, file_stem: str, output_directory: Optional[str] = None,
+                                   references: Collection[Citation] = None, format_cite: bool = True,
+                                   figures_folder: Optional[Path] = None, preamble: Optional[str] = None,
+                                   ) -> Tuple[str, Optional[float]]:
+    """
+    Compile the latex content to pdf.
+    If `preamble` is given (the start of the latex content, which does not change between compilations), it is
+    precompiled into a format (see `get_precompiled_format_file`), which is used for compiling the document.
+
+    If `format_cite`, pdflatex is rerun (with bibtex, if there are references) only while the auxiliary files
+    change. Documents saved to an output directory are compiled in a folder kept between their compilations
+    (see `LatexCompilationFolder`).
+    Return the output of the first pdflatex pass, and the overflow width, if any.
+    """
     references = references or set()
     should_compile_with_bib = len(references) > 0
     latex_file_name = file_stem + '.tex'
     pdflatex_params = ['pdflatex', '--shell-escape', '-interaction=nonstopmode', latex_file_name]
-    with run_in_temp_directory():
-        # Copy the figures from the output directory to the temp directory:
-        if figures_folder is not None:
-            png_files_in_running_directory = [f for f in figures_folder.glob('*.png') if f.is_file()]
-            for png_file in png_files_in_running_directory:
-                shutil.copy(png_file, '.')
+    format_file = None
+    if preamble is not None and latex_content.startswith(preamble):
+        format_file = get_precompiled_format_file(preamble)
+    compiled_latex_content = latex_content
+    if format_file is not None:
+        pdflatex_params.insert(1, f'-fmt={format_file.stem}')
+        # The marker is added only to the compiled file (not to the saved file, nor to error messages).
+        # It starts the line after the preamble, so that line numbers in the pdflatex output are not shifted.
+        compiled_latex_content = preamble + END_OF_PRECOMPILED_PREAMBLE + latex_content[len(preamble):]
+
+    def move_to_output_directory():
+        if output_directory is not None and compiled_latex_content != latex_content \
+                and os.path.exists(latex_file_name):
+            with open(latex_file_name, 'w', encoding='utf-8') as f:
+                f.write(latex_content)
+        _move_latex_and_pdf_to_output_directory(file_stem, output_directory, latex_file_name)
+
+    with _run_in_compilation_folder(file_stem, output_directory) as compilation_folder:
+        compilation_folder.passes = []
+        if format_file is not None:
+            _copy_if_changed(format_file)
+
+        # Copy the figures from the output directory to the compilation folder,
+        # and remove figures of previous compilations which are no longer there:
+        png_files_in_running_directory = [f for f in figures_folder.glob('*.png') if f.is_file()] \
+            if figures_folder is not None else []
+        for png_file in png_files_in_running_directory:
+            _copy_if_changed(png_file)
+        png_file_names = {png_file.name for png_file in png_files_in_running_directory}
+        for png_file in Path('.').glob('*.png'):
+            if png_file.name not in png_file_names:
+                png_file.unlink()
 
         # Create the bib file:
         if should_compile_with_bib:
@@ -195,36 +506,53 @@ def save_latex_and_compile_to_pdf(latex_content: str, file_stem: str, output_dir
                 f.write('\n\n'.join(references_bibtex))
 
         with open(latex_file_name, 'w', encoding='utf-8') as f:
-            f.write(latex_content)
-        try:
-            pdflatex_output = subprocess.run(pdflatex_params, **get_subprocess_kwargs())
-        except FileNotFoundError:
-            raise MissingInstallationError(package_name="pdflatex", instructions=PDFLATEX_INSTALLATION_INSTRUCTIONS)
-        except subprocess.CalledProcessError as e:
-            _move_latex_and_pdf_to_output_directory(file_stem, output_directory, latex_file_name)
-            raise LatexCompilationError(latex_content=latex_content,
-                                        pdflatex_output=e.stdout.decode('utf-8', errors='replace'))
+            f.write(compiled_latex_content)
 
-        pdflatex_output = pdflatex_output.stdout.decode('utf-8', errors='replace')
-
-        if format_cite:
+        def run_pdflatex() -> str:
+            compilation_folder.passes.append('pdflatex')
             try:
-                if should_compile_with_bib:
+                output = subprocess.run(pdflatex_params, **get_subprocess_kwargs())
+            except FileNotFoundError:
+                raise MissingInstallationError(package_name="pdflatex",
+                                               instructions=PDFLATEX_INSTALLATION_INSTRUCTIONS)
+            except subprocess.CalledProcessError as e:
+                _remove_auxiliary_files(file_stem)  # so that they do not fail the next compilation
+                move_to_output_directory()
+                raise LatexCompilationError(latex_content=latex_content,
+                                            pdflatex_output=e.stdout.decode('utf-8', errors='replace'))
+            return output.stdout.decode('utf-8', errors='replace')
+
+        hash_of_auxiliary_files = _get_hash_of_auxiliary_files(file_stem)
+        pdflatex_output = run_pdflatex()
+        while format_cite:
+            if should_compile_with_bib:
+                bibtex_inputs_hash = _get_hash_of_files([file_stem + '.aux'], _is_aux_line_read_by_bibtex) + \
+                    _get_hash_of_files([BIB_FILENAME])
+                if bibtex_inputs_hash != compilation_folder.bibtex_inputs_hash \
+                        or not os.path.exists(file_stem + '.bbl'):
+                    compilation_folder.passes.append('bibtex')
                     try:
                         subprocess.run(['bibtex', file_stem], **get_subprocess_kwargs(capture=False))
                     except FileNotFoundError:
                         raise MissingInstallationError(package_name="bibtex",
                                                        instructions=PDFLATEX_INSTALLATION_INSTRUCTIONS)
-                subprocess.run(pdflatex_params, **get_subprocess_kwargs(capture=False))
-                subprocess.run(pdflatex_params, **get_subprocess_kwargs(capture=False))
-            except subprocess.CalledProcessError:
-                _move_latex_and_pdf_to_output_directory(file_stem, output_directory, latex_file_name)
-                raise
+                    except subprocess.CalledProcessError:
+                        move_to_output_directory()
+                        raise
+                    compilation_folder.bibtex_inputs_hash = bibtex_inputs_hash
+            previous_hash_of_auxiliary_files = hash_of_auxiliary_files
+            hash_of_auxiliary_files = _get_hash_of_auxiliary_files(file_stem)
+            if hash_of_auxiliary_files == previous_hash_of_auxiliary_files \
+                    or compilation_folder.passes.count('pdflatex') >= MAX_PDFLATEX_PASSES:
+                break
+            run_pdflatex()
 
         with importlib.resources.path('data_to_paper.latex.resources', 'watermark.pdf') as watermark_path:
             add_watermark_to_pdf(file_stem + '.pdf', str(watermark_path))
 
-        _move_latex_and_pdf_to_output_directory(file_stem, output_directory, latex_file_name)
+        move_to_output_directory()
+        if output_directory is not None and format_cite:
+            print_and_log(f'Compiled {file_stem}.pdf ({", ".join(compilation_folder.passes)}).', should_log=False)
         over_width_pts = _get_over_width_pts(pdflatex_output)
         return pdflatex_output, over_width_pts
 
@@ -959,11 +959,32 @@ class TableCompilationDfContentChecker(CompilationDfContentChecker):
         header, index = index, header
         return df_to_latex(self.df.T, self.filename, index=index, header=header, **kwargs)
 
+    def _df_to_latex(self):
+        with RegisteredRunContext.temporarily_disable_all():
+            with OnStrPValue(OnStr.SMALLER_THAN):
+                return df_to_latex(self.df, self.filename, **self.kwargs)
+
+    def get_latex_tables_to_compile(self) -> List[str]:
+        """
+        Return the latex tables that `check_compilation_and_get_width` may compile: the table, and its transpose.
+        Tables that cannot be created are skipped (they are reported by the checks).
+        """
+        latex_tables = []
+        try:
+            latex_tables.append(self._df_to_latex())
+        except Exception:
+            pass
+        try:
+            with OnStrPValue(OnStr.SMALLER_THAN):
+                latex_tables.append(self._df_to_latex_transpose())
+        except Exception:
+            pass
+        return latex_tables
+
     def check_compilation_and_get_width(self):
         exception = None
+        latex = self._df_to_latex()
         with RegisteredRunContext.temporarily_disable_all():
-            with OnStrPValue(OnStr.SMALLER_THAN):
-                latex = df_to_latex(self.df, self.filename, **self.kwargs)
             try:
                 width = self.latex_document.compile_table(latex)
             except BaseLatexProblemInCompilation as e:
@@ -1463,6 +1484,24 @@ def check_analysis_df(df: InfoDataFrameWithSaveObjFuncCall, **k) -> RunIssues:
         raise ValueError(f"func should be either df_to_figure or df_to_latex, not {func}")
 
 
+def compile_displayitem_tables(dfs: List[InfoDataFrameWithSaveObjFuncCall], latex_document: LatexDocument):
+    """
+    Compile the tables of the dfs, and their transposes, in a single pdflatex run.
+    The widths are kept by the latex document, so that checking each df (see `TableCompilationDfContentChecker`)
+    does not run pdflatex again.
+    """
+    latex_tables = []
+    for df in dfs:
+        func_call = df.get_func_call()
+        if func_call.func != df_to_latex:
+            continue
+        checker = TableCompilationDfContentChecker(df=df, func=func_call.func, filename=func_call.filename,
+                                                   kwargs=func_call.kwargs, latex_document=latex_document)
+        latex_tables.extend(checker.get_latex_tables_to_compile())
+    if latex_tables:
+        latex_document.compile_tables(latex_tables)
+
+
 def check_displayitem_df(df: InfoDataFrameWithSaveObjFuncCall, **k) -> RunIssues:
     func = df.get_func_call().func
     if func == df_to_figure:
@@ -22,7 +22,7 @@ from data_to_paper.run_gpt_code.run_issues import RunIssue, CodeProblem
 from data_to_paper.text import dedent_triple_quote_str
 
 from ..analysis.coding import BaseDataFramePickleContentOutputFileRequirement, DataAnalysisDebuggerConverser
-from ...check_df_to_funcs.df_checker import check_displayitem_df
+from ...check_df_to_funcs.df_checker import check_displayitem_df, compile_displayitem_tables
 
 
 @dataclass
@@ -47,6 +47,13 @@ class TexDisplayitemContentOutputFileRequirement(BaseDataFramePickleContentOutpu
     def _check_df(self, content: InfoDataFrameWithSaveObjFuncCall) -> List[RunIssue]:
         return check_displayitem_df(content, output_folder=self.output_folder, latex_document=self.latex_document)
 
+    def compile_tables(self, contents: List[InfoDataFrameWithSaveObjFuncCall]):
+        """
+        Compile the tables of all the files in a single pdflatex run, ahead of checking the files one by one.
+        """
+        if self.latex_document is not None:
+            compile_displayitem_tables(contents, latex_document=self.latex_document)
+
     def _convert_view_purpose_to_pvalue_on_str(self, view_purpose: ViewPurpose) -> OnStr:
         return OnStr.SMALLER_THAN
 
@@ -120,7 +127,15 @@ class DisplayitemsDebuggerConverser(DataAnalysisDebuggerConverser):
             )]
         return []
 
+    def _compile_created_tables(self, code_and_output: CodeAndOutput):
+        files_to_contents = code_and_output.created_files.get_created_content_files_to_contents()
+        for requirement in self.output_file_requirements:
+            if isinstance(requirement, TexDisplayitemContentOutputFileRequirement):
+                requirement.compile_tables(
+                    [files_to_contents[filename] for filename in code_and_output.created_files[requirement]])
+
     def _get_issues_for_created_output_files(self, code_and_output: CodeAndOutput, contexts) -> List[RunIssue]:
+        self._compile_created_tables(code_and_output)
         issues = super()._get_issues_for_created_output_files(code_and_output, contexts)
         if issues:
             return issues
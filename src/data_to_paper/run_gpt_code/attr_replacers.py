@@ -1,12 +1,22 @@
 from __future__ import annotations
 
+import functools
+import hashlib
 import importlib
+import json
+import os
 import pkgutil
+import sys
 from dataclasses import dataclass
+from importlib.metadata import version, PackageNotFoundError
+from pathlib import Path
 
 import inspect
+import io
 
-from typing import Callable, Iterable, Any, Optional, Tuple, Dict, Union
+from typing import Callable, Iterable, Any, Optional, Tuple, Dict, Union, List, ClassVar
+
+from data_to_paper.env import OVERRIDES_TARGETS_INDEX_FOLDER
 
 from .base_run_contexts import RegisteredRunContext
 from .exceptions import CodeUsesForbiddenFunctions
@@ -74,6 +84,91 @@ def _import_obj(obj_import_str: Optional[str, Any]):
     return obj_import_str
 
 
+@functools.lru_cache(maxsize=None)
+def get_package_version(package_name: str) -> Optional[str]:
+    try:
+        return version(package_name)
+    except PackageNotFoundError:
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def get_source_hash_of_class(cls: type) -> str:
+    """
+    A hash of the source code of the class and of its base classes.
+    """
+    sources = []
+    for base in cls.__mro__:
+        if base.__module__ == 'builtins':
+            continue
+        try:
+            sources.append(inspect.getsource(base))
+        except (OSError, TypeError):
+            sources.append(base.__qualname__)
+    return hashlib.sha256('\n'.join(sources).encode('utf-8')).hexdigest()[:16]
+
+
+def _find_parent(module_name: str, qualname: str):
+    """
+    Return the module, or the class (given by its qualified name within the module).
+    """
+    parent = sys.modules.get(module_name)
+    if parent is None:
+        parent = importlib.import_module(module_name)
+    for name in qualname.split('.') if qualname else []:
+        parent = getattr(parent, name)
+    return parent
+
+
+def _get_parent_names(parent) -> Optional[Tuple[str, str]]:
+    """
+    Return the (module name, qualified name) by which the module, or the class, is found (see `_find_parent`).
+    None if it cannot be found by name.
+    """
+    if inspect.ismodule(parent):
+        names = (parent.__name__, '')
+    else:
+        names = (getattr(parent, '__module__', None), getattr(parent, '__qualname__', None))
+        if None in names:
+            return None
+    try:
+        if _find_parent(*names) is parent:
+            return names
+    except Exception:
+        pass
+    return None
+
+
+TargetName = Tuple[str, str, str]  # module name, qualified name of the class ('' for module), attr name
+_INDEX_FILE_PATHS_TO_TARGETS: Dict[Path, List[TargetName]] = {}
+
+
+def load_targets_index(file_path: Path) -> Optional[List[TargetName]]:
+    """
+    Return the targets kept in the index file, or None if there is no index.
+    """
+    if file_path not in _INDEX_FILE_PATHS_TO_TARGETS:
+        try:
+            # `io.open`, rather than `open`, which is overridden when the contexts are entered within a code run:
+            with io.open(file_path, 'r') as f:
+                _INDEX_FILE_PATHS_TO_TARGETS[file_path] = [tuple(target) for target in json.load(f)]
+        except (OSError, ValueError):
+            return None
+    return _INDEX_FILE_PATHS_TO_TARGETS[file_path]
+
+
+def save_targets_index(file_path: Path, targets: List[TargetName]):
+    _INDEX_FILE_PATHS_TO_TARGETS[file_path] = targets
+    try:
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_file_path = file_path.with_name(f'{file_path.name}.{os.getpid()}.tmp')
+        with io.open(temp_file_path, 'w') as f:
+            json.dump(targets, f)
+        os.replace(temp_file_path, file_path)
+    except OSError:
+        pass  # the index is kept in memory
+
+
 @dataclass
 class OverrideImportedObjContext(RegisteredRunContext):
     obj_import_str: Optional[str, Any] = None
@@ -85,7 +180,7 @@ class OverrideImportedObjContext(RegisteredRunContext):
 
 @dataclass
 class MultiAttrReplacerContext(OverrideImportedObjContext):
-    _originals: Optional[dict] = None
+    _patches: Optional[List[Tuple[Any, str, Any]]] = None  # (parent, attr name, original), in order of replacement
 
     def _get_all_parents(self) -> set:
         raise NotImplementedError
@@ -96,26 +191,94 @@ class MultiAttrReplacerContext(OverrideImportedObjContext):
     def _get_custom_wrapper(self, parent, attr_name, original_func):
         raise NotImplementedError
 
+    def _get_all_targets(self) -> List[Tuple[Any, str]]:
+        """
+        Return the (parent, attr name) pairs to replace.
+        """
+        return [(parent, attr_name)
+                for parent in self._get_all_parents() for attr_name in self._get_all_attrs_for_parent(parent)]
+
     def __enter__(self):
-        self._originals = {}
-        for parent in self._get_all_parents():
-            for attr_name in self._get_all_attrs_for_parent(parent):
-                original = getattr(parent, attr_name)
-                self._originals[(parent, attr_name)] = original
-                setattr(parent, attr_name, self._get_custom_wrapper(parent, attr_name, original))
+        # create all the wrappers, then install them together:
+        patches = [(parent, attr_name, getattr(parent, attr_name)) for parent, attr_name in self._get_all_targets()]
+        wrappers = [self._get_custom_wrapper(parent, attr_name, original) for parent, attr_name, original in patches]
+        for (parent, attr_name, _), wrapper in zip(patches, wrappers):
+            setattr(parent, attr_name, wrapper)
+        self._patches = patches
         return super().__enter__()
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        for (parent, attr_name), original in self._originals.items():
+        for parent, attr_name, original in reversed(self._patches):
             setattr(parent, attr_name, original)
-        self._originals = None
+        self._patches = None
         return super().__exit__(exc_type, exc_val, exc_tb)
 
 
 @dataclass
 class SystematicAttrReplacerContext(MultiAttrReplacerContext):
+    """
+    Replaces the attributes (of the modules, or classes, found by `_get_all_parents`) which `_should_replace`.
+
+    Discovering the attributes may walk many modules and classes. If `INDEXED_PACKAGE` is set, the discovered
+    targets are kept, by name, in an index file in `OVERRIDES_TARGETS_INDEX_FOLDER`, keyed by the version of the
+    package and of data_to_paper, and by the source of the context class (which determines the targets),
+    so that entering the context is a direct loop over the indexed targets.
+    """
     recursive: bool = True
 
+    INDEXED_PACKAGE: ClassVar[Optional[str]] = None
+
+    def _get_targets_index_key(self) -> Optional[tuple]:
+        """
+        The key of the index of the targets. None to discover the targets on each entry.
+        """
+        if self.INDEXED_PACKAGE is None:
+            return None
+        return self.obj_import_str, self.recursive, self.INDEXED_PACKAGE, get_package_version(self.INDEXED_PACKAGE), \
+            get_package_version('data_to_paper'), get_source_hash_of_class(type(self))
+
+    def _get_targets_index_file_path(self) -> Optional[Path]:
+        key = self._get_targets_index_key()
+        if key is None or OVERRIDES_TARGETS_INDEX_FOLDER.val is None:
+            return None
+        key_hash = hashlib.sha256(repr(key).encode('utf-8')).hexdigest()[:16]
+        return Path(OVERRIDES_TARGETS_INDEX_FOLDER.val) / f'{type(self).__name__}_{key_hash}.json'
+
+    def _get_indexed_targets(self, targets_index: List[TargetName]) -> Optional[List[Tuple[Any, str]]]:
+        """
+        Return the targets of the index, or None if the index does not match the loaded modules.
+        """
+        targets = []
+        for target in targets_index:
+            try:
+                module_name, qualname, attr_name = target
+                parent = _find_parent(module_name, qualname)
+            except Exception:
+                return None
+            if not self._is_right_type(parent.__dict__.get(attr_name)):
+                return None
+            targets.append((parent, attr_name))
+        return targets
+
+    def _get_all_targets(self) -> List[Tuple[Any, str]]:
+        index_file_path = self._get_targets_index_file_path()
+        if index_file_path is None:
+            return super()._get_all_targets()
+        targets_index = load_targets_index(index_file_path)
+        if targets_index is not None:
+            targets = self._get_indexed_targets(targets_index)
+            if targets is not None:
+                return targets
+        targets = super()._get_all_targets()
+        targets_index = []
+        for parent, attr_name in targets:
+            parent_names = _get_parent_names(parent)
+            if parent_names is None:
+                return targets  # the targets cannot be indexed by name
+            targets_index.append(parent_names + (attr_name, ))
+        save_targets_index(index_file_path, targets_index)
+        return targets
+
     def _get_all_modules(self) -> list:
         all_modules = [self.obj]
         if self.recursive:
@@ -135,12 +298,12 @@ class SystematicAttrReplacerContext(MultiAttrReplacerContext):
 
 class SystematicMethodReplacerContext(SystematicAttrReplacerContext):
     def _get_all_parents(self) -> list:
-        classes = []
+        classes = {}  # ordered set
         for mod in self._get_all_modules():
             for name, obj in _carefully_get_members(mod):
-                if inspect.isclass(obj) and obj not in classes:
-                    classes.append(obj)
-        return classes
+                if inspect.isclass(obj):
+                    classes[obj] = None
+        return list(classes)
 
     def _is_right_type(self, obj) -> bool:
         return inspect.isfunction(obj) or inspect.ismethod(obj)
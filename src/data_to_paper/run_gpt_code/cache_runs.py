@@ -7,15 +7,18 @@ import traceback
 from traceback import FrameSummary
 
 from contextlib import contextmanager
-from dataclasses import asdict, dataclass
+from dataclasses import asdict, dataclass, field
 
 from pathlib import Path
-from typing import Union
+from typing import Dict, Set, Tuple, Union
 
-from data_to_paper.env import DELAY_CODE_RUN_CACHE_RETRIEVAL
+from data_to_paper.env import DELAY_CODE_RUN_CACHE_RETRIEVAL, MAX_CODE_RUN_CACHE_SIZE, \
+    CODE_RUN_CACHE_HASH_ALGORITHM
 from data_to_paper.utils.file_utils import run_in_directory
 from data_to_paper.utils.print_to_file import print_and_log
 
+from .cache_store import IndexedCacheStore
+
 
 def old_directory_hash(directory):
     """Create a hash based on all files in the directory."""
@@ -60,6 +63,104 @@ def directory_hash(directory):
     return hasher.hexdigest()
 
 
+def _get_file_hasher(algorithm: str):
+    if algorithm in ('sha256', 'blake2b'):
+        return hashlib.new(algorithm)
+    if algorithm == 'xxhash':
+        import xxhash  # optional dependency
+        return xxhash.xxh3_128()
+    if algorithm == 'blake3':
+        import blake3  # optional dependency
+        return blake3.blake3()
+    raise ValueError(f'Unknown hash algorithm: {algorithm}')
+
+
+def _hash_file(file_path: str, algorithm: str) -> str:
+    hasher = _get_file_hasher(algorithm)
+    with open(file_path, 'rb') as file:
+        while chunk := file.read(1024 * 1024):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+# Files modified less than this time ago (ns) are not remembered, as they may still change within the same mtime tick
+_MIN_AGE_FOR_REMEMBERING_FILE_HASH = 2_000_000_000
+
+
+@dataclass
+class FileHashCache:
+    """
+    Remember the hash of each file, keyed by its (path, size, mtime_ns, inode).
+    Files are re-hashed only if they were changed.
+    """
+    algorithm: str = 'sha256'
+    paths_to_stats_and_hashes: Dict[str, Tuple[tuple, str]] = field(default_factory=dict)
+    num_hashed_files: int = 0
+
+    def get_file_hash(self, file_path: str) -> str:
+        stat = os.stat(file_path)
+        stat_key = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+        stat_and_hash = self.paths_to_stats_and_hashes.get(file_path)
+        if stat_and_hash is not None and stat_and_hash[0] == stat_key:
+            return stat_and_hash[1]
+        file_hash = _hash_file(file_path, self.algorithm)
+        self.num_hashed_files += 1
+        if time.time_ns() - stat.st_mtime_ns > _MIN_AGE_FOR_REMEMBERING_FILE_HASH:
+            self.paths_to_stats_and_hashes[file_path] = (stat_key, file_hash)
+        return file_hash
+
+
+_ALGORITHMS_TO_FILE_HASH_CACHES: Dict[str, FileHashCache] = {}
+
+
+def get_file_hash_cache(algorithm: str = None) -> FileHashCache:
+    algorithm = algorithm or CODE_RUN_CACHE_HASH_ALGORITHM.val
+    if algorithm not in _ALGORITHMS_TO_FILE_HASH_CACHES:
+        _ALGORITHMS_TO_FILE_HASH_CACHES[algorithm] = FileHashCache(algorithm=algorithm)
+    return _ALGORITHMS_TO_FILE_HASH_CACHES[algorithm]
+
+
+def directory_fingerprint(directory, algorithm: str = None) -> str:
+    """
+    Create a hash based on the relative path and the content hash of each file in the directory.
+    Content hashes are cached (see `FileHashCache`), so only new or changed files are read.
+    """
+    file_hash_cache = get_file_hash_cache(algorithm)
+    hasher = hashlib.sha256(file_hash_cache.algorithm.encode('utf-8'))
+    root_dir = os.path.abspath(directory)
+    all_files = []
+    for path, dirs, files in os.walk(root_dir):
+        for file in files:
+            full_path = os.path.join(path, file)
+            all_files.append((os.path.relpath(full_path, start=root_dir), full_path))
+    all_files.sort(key=lambda x: x[0])
+    for relative_path, full_path in all_files:
+        hasher.update(relative_path.encode('utf-8'))
+        hasher.update(file_hash_cache.get_file_hash(full_path).encode('utf-8'))
+    return hasher.hexdigest()
+
+
+_DIRECTORIES_AND_FINGERPRINTS_TO_LEGACY_HASHES: Dict[Tuple[str, str], Tuple[str, str]] = {}
+
+
+def get_legacy_directory_hashes(directory) -> Tuple[str, str]:
+    """
+    Return the `directory_hash` and `old_directory_hash` of the directory, used as keys by previous versions.
+    These read all the files, so they are computed only once for each state of the directory.
+    """
+    key = (os.path.abspath(directory), directory_fingerprint(directory))
+    if key not in _DIRECTORIES_AND_FINGERPRINTS_TO_LEGACY_HASHES:
+        _DIRECTORIES_AND_FINGERPRINTS_TO_LEGACY_HASHES[key] = (directory_hash(directory),
+                                                               old_directory_hash(directory))
+    return _DIRECTORIES_AND_FINGERPRINTS_TO_LEGACY_HASHES[key]
+
+
+# (store directory, run directory) pairs in which entries with legacy keys were looked for, and not found.
+# Legacy keys are computed by reading all the files of the run directory, so they are looked for only once for
+# each run directory (rather than on every cache miss, for as long as the store has legacy entries).
+_STORE_AND_RUN_DIRECTORIES_WITHOUT_LEGACY_ENTRIES: Set[Tuple[Path, str]] = set()
+
+
 def _read_file(filename):
     with open(filename, 'rb') as f:
         return f.read()
@@ -97,12 +198,44 @@ class CustomFrameSummary(FrameSummary):
 traceback.FrameSummary = CustomFrameSummary
 
 
+def get_cache_store_directory(cache_filepath: Union[str, Path]) -> Path:
+    """
+    The directory of the indexed cache store that replaces the legacy single-pickle cache file.
+    """
+    cache_filepath = Path(cache_filepath)
+    return cache_filepath.parent / (cache_filepath.stem + '_store')
+
+
+_DIRECTORIES_TO_STORES: Dict[Path, IndexedCacheStore] = {}
+
+
+def get_cache_store(cache_filepath: Union[str, Path]) -> IndexedCacheStore:
+    """
+    Return the cache store for the given cache filepath.
+    Entries of a legacy cache file (a pickled dict) are imported into the store on first use.
+    """
+    directory = get_cache_store_directory(cache_filepath).absolute()
+    store = _DIRECTORIES_TO_STORES.get(directory)
+    if store is None:
+        store = IndexedCacheStore(directory=directory)
+        if not store.index_filepath.exists() and os.path.exists(cache_filepath):
+            print_and_log(f"Importing code-run cache from {cache_filepath}.")
+            with open(cache_filepath, 'rb') as f:
+                store.import_dict(pickle.load(f))
+        _DIRECTORIES_TO_STORES[directory] = store
+    store.max_size = MAX_CODE_RUN_CACHE_SIZE.val
+    return store
+
+
 @dataclass
 class CacheRunToFile:
     """
     A class that caches the results of a 'run' method to a file.
     Also caches the files created during the run.
     Files pre-existing in the run directory are considered part of the run input.
+
+    The cache is kept in an indexed store (see `IndexedCacheStore`) next to `cache_filepath`.
+    A legacy cache file at `cache_filepath` is imported into the store on first use.
     """
     cache_filepath: Union[str, Path] = None  # Path to the cache file, or None to disable caching
 
@@ -110,10 +243,13 @@ class CacheRunToFile:
         return tuple(asdict(self).values())
 
     def _get_run_directory_key(self) -> tuple:
-        return (directory_hash(self._get_run_directory()), )
+        return (directory_fingerprint(self._get_run_directory()), )
 
-    def _get_run_directory_old_key(self) -> tuple:
-        return (old_directory_hash(self._get_run_directory()), )
+    def _get_run_directory_legacy_keys(self) -> Tuple[tuple, ...]:
+        """
+        Keys used by previous versions, from newest to oldest.
+        """
+        return tuple((legacy_hash, ) for legacy_hash in get_legacy_directory_hashes(self._get_run_directory()))
 
     def _get_run_directory(self):
         raise NotImplementedError
@@ -121,18 +257,6 @@ class CacheRunToFile:
     def _run(self, *args, **kwargs):
         raise NotImplementedError
 
-    def _load_cache(self, filename=None):
-        filename = filename or self.cache_filepath
-        if os.path.exists(filename):
-            with open(filename, 'rb') as f:
-                return pickle.load(f)
-        return {}
-
-    def _dump_cache(self, cache, filename=None):
-        filename = filename or self.cache_filepath
-        with open(filename, 'wb') as f:
-            pickle.dump(cache, f)
-
     def run(self, *args, **kwargs):
         """
         Cache the results of a call to _run().
@@ -140,23 +264,29 @@ class CacheRunToFile:
         if self.cache_filepath is None:
             return self._run(*args, **kwargs)
 
-        cache = self._load_cache()
+        store = get_cache_store(self.cache_filepath)
         key = self._get_instance_key() + self._get_run_directory_key() \
             + tuple(args) + tuple(kwargs.items())
 
-        old_key = self._get_instance_key() + self._get_run_directory_old_key() \
-            + tuple(args) + tuple(kwargs.items())
-
-        if old_key in cache:
-            # replace old key with new key
-            print(f"{self.__class__.__name__}: Replacing old key with new key.")
-            cache[key] = cache.pop(old_key)
-            self._dump_cache(cache)
-
-        if key in cache:
+        store_and_run_directory = (store.directory, os.path.abspath(self._get_run_directory()))
+        if key not in store and store_and_run_directory not in _STORE_AND_RUN_DIRECTORIES_WITHOUT_LEGACY_ENTRIES \
+                and store.has_legacy_entries():
+            # One-time migration of entries cached with old-style keys:
+            for run_directory_legacy_key in self._get_run_directory_legacy_keys():
+                old_key = self._get_instance_key() + run_directory_legacy_key \
+                    + tuple(args) + tuple(kwargs.items())
+                if old_key in store:
+                    # replace old key with new key
+                    print(f"{self.__class__.__name__}: Replacing old key with new key.")
+                    store.rename_key(old_key, key)
+                    break
+            else:
+                _STORE_AND_RUN_DIRECTORIES_WITHOUT_LEGACY_ENTRIES.add(store_and_run_directory)
+
+        if key in store:
             print_and_log(f"{self.__class__.__name__}: Using cached output.")
             time.sleep(DELAY_CODE_RUN_CACHE_RETRIEVAL.val)
-            results, filenames = cache[key]
+            results, filenames = store.get(key)
             with run_in_directory(self._get_run_directory()):
                 _write_files(filenames)
             return results
@@ -169,8 +299,7 @@ class CacheRunToFile:
             file_contents = _read_files(created_files)
 
         # Update cache
-        cache[key] = (results, file_contents)
-        self._dump_cache(cache)
+        store.put(key, results, file_contents)
 
         return results
 
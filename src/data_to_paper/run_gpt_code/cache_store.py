@@ -0,0 +1,260 @@
+import hashlib
+import os
+import pickle
+import time
+
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Tuple, Union
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+
+def _write_file_atomically(filepath: Path, content: bytes):
+    temp_filepath = filepath.with_name(f'{filepath.name}.{os.getpid()}.tmp')
+    with open(temp_filepath, 'wb') as f:
+        f.write(content)
+    os.replace(temp_filepath, filepath)
+
+
+def get_content_hash(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def get_key_hash(key: tuple) -> str:
+    return hashlib.sha256(pickle.dumps(key)).hexdigest()
+
+
+@dataclass
+class CacheEntry:
+    """
+    The index record of a single cached run.
+    The results are stored in their own blob file; created files are stored content-addressed.
+    """
+    filenames_to_hashes: Dict[str, str]
+    size: int  # bytes: results blob + created files
+    last_access: float = field(default_factory=time.time)
+    is_legacy_key: bool = False  # keys created by an older key scheme, which should be migrated on access
+
+
+@dataclass
+class IndexedCacheStore:
+    """
+    An on-disk cache store with a small index and one blob file per entry.
+
+    directory/
+        index.pkl           {key_hash: CacheEntry}
+        blobs/<key_hash>    pickled results of the entry
+        files/<sha256>      content of created files (shared among entries)
+
+        index.lock          lock file serializing changes of the index among processes
+
+    Only the index and the blob of the retrieved entry are loaded.
+    If `max_size` (bytes) is set, least-recently-used entries are evicted to keep the store within the limit.
+
+    Each change of the index is a read-modify-write of the index file under an exclusive lock.
+    Access times of retrieved entries are kept in memory and are written with the next change of the index,
+    or at most once every `LAST_ACCESS_DUMP_INTERVAL` seconds.
+    """
+    directory: Union[str, Path]
+    max_size: Optional[int] = None
+    _index: Optional[Dict[str, CacheEntry]] = None
+    _index_mtime: Optional[int] = None
+    _total_size: int = 0
+    _key_hashes_to_last_accesses: Dict[str, float] = field(default_factory=dict)  # not yet written to the index
+    _last_dump_time: float = 0.
+
+    INDEX_FILENAME = 'index.pkl'
+    LOCK_FILENAME = 'index.lock'
+    LAST_ACCESS_DUMP_INTERVAL = 60.  # seconds
+
+    def __post_init__(self):
+        self.directory = Path(self.directory)
+
+    @property
+    def index_filepath(self) -> Path:
+        return self.directory / self.INDEX_FILENAME
+
+    def _get_blob_filepath(self, key_hash: str) -> Path:
+        return self.directory / 'blobs' / key_hash
+
+    def _get_file_filepath(self, content_hash: str) -> Path:
+        return self.directory / 'files' / content_hash
+
+    def _get_index_file_mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self.index_filepath).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    @property
+    def index(self) -> Dict[str, CacheEntry]:
+        """
+        The index, reloaded if it was changed on disk (e.g. by another process).
+        """
+        mtime = self._get_index_file_mtime()
+        if self._index is None or mtime != self._index_mtime:
+            if mtime is None:
+                self._index = {}
+            else:
+                with open(self.index_filepath, 'rb') as f:
+                    self._index = pickle.load(f)
+            self._index_mtime = mtime
+            self._total_size = sum(entry.size for entry in self._index.values())
+            for key_hash, last_access in self._key_hashes_to_last_accesses.items():
+                if key_hash in self._index:
+                    self._index[key_hash].last_access = max(self._index[key_hash].last_access, last_access)
+        return self._index
+
+    @contextmanager
+    def _lock(self):
+        """
+        Lock the index against changes by other processes.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.directory / self.LOCK_FILENAME, 'ab') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _dump_index(self):
+        """
+        Write the index. Should be called under `_lock()`, after changing the (reloaded) index.
+        """
+        _write_file_atomically(self.index_filepath, pickle.dumps(self._index))
+        self._index_mtime = self._get_index_file_mtime()
+        self._key_hashes_to_last_accesses.clear()
+        self._last_dump_time = time.time()
+
+    def dump_last_accesses(self):
+        """
+        Write the access times of the entries retrieved since the last change of the index.
+        """
+        if not self._key_hashes_to_last_accesses:
+            return
+        with self._lock():
+            self.index  # reload, with the access times re-applied, if changed by another process
+            self._dump_index()
+
+    def __contains__(self, key: tuple) -> bool:
+        return get_key_hash(key) in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def get_total_size(self) -> int:
+        self.index  # reload if changed on disk
+        return self._total_size
+
+    def get(self, key: tuple) -> Tuple[Any, Dict[str, bytes]]:
+        """
+        Return the results and the created files (filename -> content) of the entry.
+        Raises KeyError if the key is not in the cache.
+        """
+        key_hash = get_key_hash(key)
+        entry = self.index[key_hash]
+        with open(self._get_blob_filepath(key_hash), 'rb') as f:
+            results = pickle.load(f)
+        file_contents = {}
+        for filename, content_hash in entry.filenames_to_hashes.items():
+            with open(self._get_file_filepath(content_hash), 'rb') as f:
+                file_contents[filename] = f.read()
+        entry.last_access = self._key_hashes_to_last_accesses[key_hash] = time.time()
+        if entry.last_access - self._last_dump_time > self.LAST_ACCESS_DUMP_INTERVAL:
+            self.dump_last_accesses()
+        return results, file_contents
+
+    def has_legacy_entries(self) -> bool:
+        return any(entry.is_legacy_key for entry in self.index.values())
+
+    def put(self, key: tuple, results: Any, file_contents: Dict[str, bytes], is_legacy_key: bool = False):
+        with self._lock():
+            key_hash = self._put_entry(key, results, file_contents, is_legacy_key)
+            self._evict_if_needed(keep=key_hash)
+            self._dump_index()
+
+    def _put_entry(self, key: tuple, results: Any, file_contents: Dict[str, bytes], is_legacy_key: bool) -> str:
+        key_hash = get_key_hash(key)
+        index = self.index
+        blob = pickle.dumps(results)
+        self._get_blob_filepath(key_hash).parent.mkdir(parents=True, exist_ok=True)
+        self._get_file_filepath('').mkdir(parents=True, exist_ok=True)
+        _write_file_atomically(self._get_blob_filepath(key_hash), blob)
+        filenames_to_hashes = {}
+        for filename, content in file_contents.items():
+            content_hash = get_content_hash(content)
+            filepath = self._get_file_filepath(content_hash)
+            if not filepath.exists():
+                _write_file_atomically(filepath, content)
+            filenames_to_hashes[filename] = content_hash
+        old_entry = index.get(key_hash)
+        entry = index[key_hash] = CacheEntry(
+            filenames_to_hashes=filenames_to_hashes,
+            size=len(blob) + sum(len(content) for content in file_contents.values()),
+            is_legacy_key=is_legacy_key,
+        )
+        self._total_size += entry.size
+        if old_entry is not None:
+            self._total_size -= old_entry.size
+            self._remove_unused_files(set(old_entry.filenames_to_hashes.values()) -
+                                      set(filenames_to_hashes.values()))
+        return key_hash
+
+    def rename_key(self, old_key: tuple, new_key: tuple):
+        old_hash, new_hash = get_key_hash(old_key), get_key_hash(new_key)
+        with self._lock():
+            index = self.index
+            if old_hash not in index:  # already renamed by another process
+                return
+            index[new_hash] = index.pop(old_hash)
+            index[new_hash].is_legacy_key = False
+            if old_hash in self._key_hashes_to_last_accesses:
+                self._key_hashes_to_last_accesses[new_hash] = self._key_hashes_to_last_accesses.pop(old_hash)
+            os.replace(self._get_blob_filepath(old_hash), self._get_blob_filepath(new_hash))
+            self._dump_index()
+
+    def _evict_if_needed(self, keep: Optional[str] = None):
+        if self.max_size is None or self._total_size <= self.max_size:
+            return
+        index = self.index
+        evicted_hashes = set()
+        for key_hash in sorted(index, key=lambda k: index[k].last_access):
+            if self._total_size <= self.max_size:
+                break
+            if key_hash == keep:
+                continue
+            entry = index.pop(key_hash)
+            self._total_size -= entry.size
+            evicted_hashes.update(entry.filenames_to_hashes.values())
+            self._get_blob_filepath(key_hash).unlink(missing_ok=True)
+        self._remove_unused_files(evicted_hashes)
+
+    def _remove_unused_files(self, content_hashes: Iterable[str]):
+        """
+        Remove the contents of created files, among the given ones, that are no longer referenced by any entry.
+        """
+        content_hashes = set(content_hashes)
+        if not content_hashes:
+            return
+        content_hashes -= {content_hash for entry in self.index.values()
+                           for content_hash in entry.filenames_to_hashes.values()}
+        for content_hash in content_hashes:
+            self._get_file_filepath(content_hash).unlink(missing_ok=True)
+
+    def import_dict(self, cache: Dict[tuple, Tuple[Any, Dict[str, bytes]]]):
+        """
+        Import entries from the legacy cache format: a dict of {key: (results, file_contents)}.
+        """
+        with self._lock():
+            for key, (results, file_contents) in cache.items():
+                self._put_entry(key, results, file_contents, is_legacy_key=True)
+            self._evict_if_needed()
+            self._dump_index()
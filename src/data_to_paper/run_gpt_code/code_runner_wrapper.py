@@ -1,24 +1,22 @@
-import os
-import pickle
 import threading
 import multiprocessing
-import tempfile
-import uuid
 
 from dataclasses import dataclass, field
+from multiprocessing.connection import Connection
 from pathlib import Path
 from typing import Optional, Tuple, Any
 
-from data_to_paper.env import MAX_EXEC_TIME
+from data_to_paper.env import MAX_EXEC_TIME, RUN_CODE_IN_WORKER_POOL
 from data_to_paper.utils.mutable import Mutable
+from data_to_paper.utils.multi_process import send_result, receive_result
 from data_to_paper.run_gpt_code.code_runner import CodeRunner, is_serializable
 from data_to_paper.utils.types import ListBasedSet
 
 from .base_run_contexts import MultiRunContext
 from .cache_runs import CacheRunToFile
 from .exceptions import FailedRunningCode, CodeTimeoutException
+from .worker_pool import get_sandbox_worker_pool
 
-# process.queue fails on Mac OS X with large objects. Use file-based transfer instead.
 RUN_CACHE_FILEPATH = Mutable(None)
 
 USE_THREADING = False
@@ -59,8 +57,9 @@ class CodeRunnerWrapper(CacheRunToFile):
         Run the provided code in a separate process and report exceptions or specific warnings.
         Calls `run_in_provided_process` which is a wrapper for `run`.
         """
-        queue_or_filepath = f"subprocess_output_{uuid.uuid4()}_{os.getpid()}.pkl"
-        queue_or_filepath = os.path.join(tempfile.gettempdir(), queue_or_filepath)
+        if RUN_CODE_IN_WORKER_POOL and not USE_THREADING:
+            return self.run_code_in_worker_pool()
+        receiver, connection = multiprocessing.Pipe(duplex=False)
         if USE_THREADING:
             process_cls = threading.Thread
         else:
@@ -68,7 +67,7 @@ class CodeRunnerWrapper(CacheRunToFile):
         try:
             process = process_cls(
                 target=self._run_code_and_put_result_in_queue,
-                args=(queue_or_filepath, ),
+                args=(connection, ),
             )
         except (AttributeError, TypeError):
             for k, v in self.__dict__.items():
@@ -76,33 +75,59 @@ class CodeRunnerWrapper(CacheRunToFile):
                     print(f'Attribute {k} is not serializable.')
             raise
         process.start()
-        process.join(self.timeout_sec)
-        if process.is_alive():
-            if not USE_THREADING:
-                process.terminate()  # Terminate the process if it's still alive after timeout
-            process.join()
-            result = (
-                None,
-                [],
-                MultiRunContext(),
-                FailedRunningCode(exception=CodeTimeoutException(self.timeout_sec))
-            )
-        else:
-            with open(queue_or_filepath, 'rb') as f:
-                result = pickle.load(f)
-            os.remove(queue_or_filepath)
-            if isinstance(result, Exception):
-                raise result
+        if not USE_THREADING:
+            connection.close()  # so that we get EOFError if the process dies without sending a result
+        try:
+            if receiver.poll(self.timeout_sec):
+                try:
+                    result = receive_result(receiver)
+                except EOFError:
+                    raise RuntimeError(f'The code-running process terminated without returning a result '
+                                       f'(exit code: {getattr(process, "exitcode", None)}).')
+                process.join(self.timeout_sec)
+                if not USE_THREADING and process.is_alive():
+                    process.terminate()  # e.g. non-daemon threads left running by the code
+                    process.join()
+                if isinstance(result, Exception):
+                    raise result
+            else:
+                if not USE_THREADING:
+                    process.terminate()  # Terminate the process if it's still alive after timeout
+                process.join()
+                result = self._get_timeout_result()
+        finally:
+            receiver.close()
         return result
 
-    def _run_code_and_put_result_in_queue(self, queue_or_filepath):
+    def run_code_in_worker_pool(self) \
+            -> Tuple[Any, ListBasedSet[str], MultiRunContext, Optional[FailedRunningCode]]:
+        """
+        Run the provided code in one of the pre-warmed processes of the sandbox worker pool.
+        The worker is recycled if the code times out.
+        """
+        is_timeout, result = get_sandbox_worker_pool().run(
+            self.code_runner.run, kwargs=dict(code=self.code), timeout_sec=self.timeout_sec)
+        if is_timeout:
+            return self._get_timeout_result()
+        if isinstance(result, BaseException):
+            raise result
+        return result
+
+    def _get_timeout_result(self) -> Tuple[Any, ListBasedSet[str], MultiRunContext, Optional[FailedRunningCode]]:
+        return (
+            None,
+            [],
+            MultiRunContext(),
+            FailedRunningCode(exception=CodeTimeoutException(self.timeout_sec))
+        )
+
+    def _run_code_and_put_result_in_queue(self, connection: Connection):
         """
-        Run the provided code and put the result in the queue.
+        Run the provided code and send the result back through the pipe.
         """
         code_runner = self.code_runner
         try:
             result = code_runner.run(code=self.code)
         except Exception as e:
             result = e
-        with open(queue_or_filepath, 'wb') as f:
-            pickle.dump(result, f)
+        send_result(connection, result)
@@ -174,10 +174,22 @@ class PValue(OperatorValue):
         return self.reconstruction, (self.value, self.created_by, self.var_name)
 
 
+def _is_numeric_non_bool_dtype(dtype) -> bool:
+    return pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype) \
+        and not pd.api.types.is_complex_dtype(dtype)
+
+
 def convert_to_p_value(value, created_by: str = None, var_name: str = None,
                        raise_on_nan: bool = True, raise_on_one: bool = True,
                        func_call_str: str = None, context: RunContext = None):
-    if is_p_value(value):
+    """
+    Convert p-values to PValue objects.
+    Numeric Series are converted to a Series of PValueArray (see `pvalue_dtype`), which shares its memory with
+    the input Series (the p-values are not copied).
+    Numpy arrays remain numpy arrays (of PValue objects), so that ndarray methods keep working on them.
+    """
+    from .statsmodels.pvalue_dtype import PValueArray
+    if is_p_value(value) or isinstance(value, PValueArray) or is_p_value_series(value):
         return value
     kwargs = dict(created_by=created_by, var_name=var_name,
                   raise_on_nan=raise_on_nan, raise_on_one=raise_on_one,
@@ -187,6 +199,14 @@ def convert_to_p_value(value, created_by: str = None, var_name: str = None,
     if isinstance(value, np.ndarray):
         return np.vectorize(convert_to_p_value)(value, **kwargs)
     if isinstance(value, pd.Series):
+        if _is_numeric_non_bool_dtype(value.dtype):
+            kwargs.pop('var_name')
+            if isinstance(value.dtype, np.dtype):
+                floats = value.to_numpy(dtype=float, copy=False)
+            else:  # nullable dtypes (e.g. Float64), whose missing values become NaN
+                floats = value.to_numpy(dtype=float, na_value=np.nan)
+            return pd.Series(PValueArray.from_values(floats, var_names=value.index, **kwargs),
+                             index=value.index, name=value.name)
         value = value.copy()
         kwargs.pop('var_name')
         for i in range(len(value)):
@@ -202,15 +222,27 @@ def is_p_value(value):
     return hasattr(value, 'this_is_a_p_value')
 
 
+def is_p_value_series(value) -> bool:
+    """
+    Whether the value is a Series, or an array, of the PValue dtype (see `pvalue_dtype`).
+    """
+    from .statsmodels.pvalue_dtype import PValueArray, PValueDtype
+    return isinstance(value, PValueArray) or isinstance(value, pd.Series) and isinstance(value.dtype, PValueDtype)
+
+
+def _get_columns(df: pd.DataFrame) -> List[pd.Series]:
+    return [df.iloc[:, i] for i in range(df.shape[1])]
+
+
 def is_containing_p_value(value):
-    if is_p_value(value):
+    if is_p_value(value) or is_p_value_series(value):
         return True
     if isinstance(value, np.ndarray):
-        return np.any(np.vectorize(is_containing_p_value)(value))
+        return value.dtype == object and np.any(np.vectorize(is_containing_p_value)(value))
     if isinstance(value, pd.Series):
-        return value.apply(is_containing_p_value).any()
+        return value.dtype == object and value.apply(is_containing_p_value).any()
     if isinstance(value, pd.DataFrame):
-        return value.applymap(is_containing_p_value).any().any()
+        return any(is_containing_p_value(column) for column in _get_columns(value))
     if isinstance(value, (list, tuple)):
         return any(is_containing_p_value(val) for val in value)
     if isinstance(value, dict):
@@ -219,14 +251,14 @@ def is_containing_p_value(value):
 
 
 def is_only_p_values(value):
-    if is_p_value(value):
+    if is_p_value(value) or is_p_value_series(value):
         return True
     if isinstance(value, np.ndarray):
-        return np.all(np.vectorize(is_only_p_values)(value))
+        return value.size == 0 or value.dtype == object and np.all(np.vectorize(is_only_p_values)(value))
     if isinstance(value, pd.Series):
-        return value.apply(is_only_p_values).all()
+        return len(value) == 0 or value.dtype == object and value.apply(is_only_p_values).all()
     if isinstance(value, pd.DataFrame):
-        return value.applymap(is_only_p_values).all().all()
+        return all(is_only_p_values(column) for column in _get_columns(value))
     if isinstance(value, (list, tuple)):
         return all(is_only_p_values(val) for val in value)
     if isinstance(value, dict):
@@ -235,14 +267,25 @@ def is_only_p_values(value):
 
 
 def convert_p_values_to_floats(value):
+    """
+    Convert PValue objects to floats.
+    Arrays and Series of the PValue dtype are converted without copying.
+    """
     if is_p_value(value):
         return value.value
+    if is_p_value_series(value):
+        if isinstance(value, pd.Series):
+            return pd.Series(value.array.float_values, index=value.index, name=value.name)
+        return value.float_values
     if isinstance(value, np.ndarray):
-        return np.vectorize(convert_p_values_to_floats)(value)
+        return np.vectorize(convert_p_values_to_floats)(value) if value.dtype == object else value
     if isinstance(value, pd.Series):
-        return value.apply(convert_p_values_to_floats)
+        return value.apply(convert_p_values_to_floats) if value.dtype == object else value
     if isinstance(value, pd.DataFrame):
-        return value.applymap(convert_p_values_to_floats)
+        value = value.copy(deep=False)
+        for i, column in enumerate(_get_columns(value)):
+            value.isetitem(i, convert_p_values_to_floats(column))
+        return value
     if isinstance(value, (list, tuple)):
         return type(value)(convert_p_values_to_floats(val) for val in value)
     if isinstance(value, dict):
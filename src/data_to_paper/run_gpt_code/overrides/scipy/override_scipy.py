@@ -17,6 +17,8 @@ class ScipyPValueOverride(SystematicFuncReplacerContext, TrackPValueCreationFunc
     package_names: Iterable[str] = ('scipy', )
     obj_import_str: str = 'scipy'
 
+    INDEXED_PACKAGE = 'scipy'
+
     def _should_replace(self, module, func_name, func) -> bool:
         doc = inspect.getdoc(func)
         if doc and "p-value" in doc:
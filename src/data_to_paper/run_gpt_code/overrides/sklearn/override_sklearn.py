@@ -14,6 +14,7 @@ from ..pvalue import convert_to_p_value, TrackPValueCreationFuncs
 
 @dataclass
 class SklearnFitOverride(SystematicMethodReplacerContext):
+    INDEXED_PACKAGE = 'scikit-learn'
 
     def _get_all_modules(self) -> list:
         # add here all modules that have classes with fit methods:
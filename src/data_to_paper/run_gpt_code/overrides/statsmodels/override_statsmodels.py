@@ -51,6 +51,8 @@ class StatsmodelsFitPValueOverride(SystematicMethodReplacerContext, TrackPValueC
     """
     package_names: Iterable[str] = ('statsmodels', )
 
+    INDEXED_PACKAGE = 'statsmodels'
+
     def _get_all_modules(self) -> list:
         from statsmodels.regression import linear_model
         from statsmodels.genmod import generalized_linear_model
@@ -186,6 +188,8 @@ class StatsmodelsMultitestPValueOverride(SystematicFuncReplacerContext, TrackPVa
     package_names: Iterable[str] = ('statsmodels', )
     obj_import_str: str = 'statsmodels.stats.multitest'
 
+    INDEXED_PACKAGE = 'statsmodels'
+
     def _should_replace(self, module, func_name, func) -> bool:
         return func_name in [func_name for func_name, _ in MULTITEST_FUNCS_AND_PVAL_INDEXES]
 
@@ -215,6 +219,8 @@ class StatsmodelsAnovaPValueOverride(SystematicFuncReplacerContext, TrackPValueC
     package_names: Iterable[str] = ('statsmodels', )
     obj_import_str: str = 'statsmodels.stats.anova'
 
+    INDEXED_PACKAGE = 'statsmodels'
+
     def _should_replace(self, module, func_name, func) -> bool:
         return func_name in ANOVA_FUNCS
 
@@ -1,349 +1,295 @@
-# pragma: no cover
 """
-This file is obsolete. It was used to create a custom p-value dtype for statsmodels to be used with
-PValueFloat which inherits from float.
-We now use a PValue object class instead of the PValueFloat(float) class.
+A pandas extension dtype for arrays of p-values.
+
+A `PValueArray` stores the p-values as a float64 numpy array, rather than as an object array of `PValue` objects.
+Getting an element returns a `PValue`, and operations on the array follow the rules of `PValue`:
+formatting is governed by `PValue.ON_STR`, and operators and conversions that are not allowed on p-values raise.
+Checking whether a Series has p-values is a check of its dtype, and converting to/from floats does not copy.
+Only p-values (or missing values) can be set in the array; setting other values (e.g. a hard-coded float, or a
+string) turns the column into an object column.
 """
 
-
 from __future__ import annotations
 
 import operator
-import re
-from typing import Any, Sequence
+from functools import wraps
+from typing import Any, Optional, Sequence
 
 import numpy as np
 import pandas as pd
-from pandas.core.dtypes.dtypes import PandasExtensionDtype
-from pandas.core.indexers import check_array_indexer
-
+from pandas.api.extensions import ExtensionArray, ExtensionDtype, register_extension_dtype, take
+from pandas.api.indexers import check_array_indexer
+from pandas.api.types import is_integer, is_list_like, is_object_dtype, is_scalar, is_string_dtype
+from pandas.core.arraylike import OpsMixin
+from pandas.core.internals.blocks import ExtensionBlock
 
-class PValueFloat(float):
-    pass
+from data_to_paper.run_gpt_code.base_run_contexts import RunContext
 
+from ..pvalue import PValue, is_p_value
 
-# Based on:
-# https://stackoverflow.com/questions/68893521/simple-example-of-pandas-extensionarray:
 
-@pd.api.extensions.register_extension_dtype
-class PValueDtype(PandasExtensionDtype):
+@register_extension_dtype
+class PValueDtype(ExtensionDtype):
     """
-    An ExtensionDtype for func-aware angular data.
+    The dtype of a `PValueArray`.
     """
-    # Required for all parameterized dtypes
-    _metadata = ('func',)
-    _match = re.compile(pattern=r'(P|p)value\[(?P<func>.+)\]')
     name = 'pvalue'
+    type = PValue
+    na_value = np.nan
 
-    def __init__(self, func=None):
-        self._func = func
-
-    def __str__(self) -> str:
-        return f'pvalue[{self.func}]'
-
-    # TestDtypeTests
-    def __hash__(self) -> int:
-        return hash(str(self))
-
-    # TestDtypeTests
-    def __eq__(self, other: Any) -> bool:
-        if isinstance(other, str):
-            return self.name == other
-        else:
-            return isinstance(other, type(self)) and self.func == other.func
+    def __repr__(self):
+        return 'PValueDtype()'
 
-    # Required for pickle compat (see GH26067)
-    def __setstate__(self, state) -> None:
-        self._func = state['func']
-
-    # Required for all ExtensionDtype subclasses
     @classmethod
     def construct_array_type(cls):
-        """
-        Return the array type associated with this dtype.
-        """
         return PValueArray
 
-    # Required for all ExtensionDtype subclasses
-    @property
-    def type(self):
-        """
-        The scalar type for the array (e.g., int).
-        """
-        return np.float64
 
-    @property
-    def func(self) -> str:
-        """
-        The function used to compute the p-value.
-        """
-        return self._func
+def _get_op_method_name(op) -> str:
+    # `operator.mul` -> '__mul__', `roperator.rmul` -> '__rmul__', `operator.and_` -> '__and__'
+    return f'__{op.__name__.strip("_")}__'
 
 
-class PValueArray(pd.api.extensions.ExtensionArray):
+def _to_floats(value):
     """
-    An ExtensionArray for func-aware p-values.
+    Return the float values of a p-value, or of p-values in an array-like.
     """
+    if isinstance(value, PValueArray):
+        return value.float_values
+    if is_p_value(value):
+        return value.value
+    if isinstance(value, (list, tuple, np.ndarray, ExtensionArray)):
+        value = np.asarray(value)
+        if value.dtype == object:
+            return np.array([v.value if is_p_value(v) else v for v in value], dtype=float)
+    return value
 
-    # Include `copy` param for TestInterfaceTests
-    def __init__(self, data, func=None, copy: bool = False):
-        self._data = np.array(data, copy=copy)
-        self._func = func
-
-    # Required for all ExtensionArray subclasses
-    def __getitem__(self, index: int) -> PValueArray | Any:
-        """
-        Select a subset of self.
-        """
-        if isinstance(index, int):
-            return PValueFloat(self._data[index])
-        else:
-            # Check index for TestGetitemTests
-            index = check_array_indexer(self, index)
-            return type(self)(self._data[index])
-
-    # TestSetitemTests
-    def __setitem__(self, index: int, value: np.generic) -> None:
-        """
-        Set one or more values in-place.
-        """
-        # Check index for TestSetitemTests
-        index = check_array_indexer(self, index)
 
-        # Upcast to value's type (if needed) for TestMethodsTests
-        if self._data.dtype < type(value):
-            self._data = self._data.astype(type(value))
+def _is_p_value_or_na(value) -> bool:
+    return is_p_value(value) or is_scalar(value) and pd.isna(value)
 
-        # TODO: Validate value for TestSetitemTests
-        # value = self._validate_setitem_value(value)
 
-        self._data[index] = value
+class PValueArray(OpsMixin, ExtensionArray):
+    """
+    An array of p-values, backed by a float64 numpy array.
+    """
 
-    # Required for all ExtensionArray subclasses
-    def __len__(self) -> int:
-        """
-        Length of this array.
-        """
-        return len(self._data)
+    def __init__(self, values, created_by: Optional[str] = None, copy: bool = False):
+        self._data = np.array(values, dtype=np.float64, copy=copy)
+        assert self._data.ndim == 1, 'PValueArray must be 1-dimensional'
+        self.created_by = created_by
 
-    # TestUnaryOpsTests
-    def __invert__(self) -> PValueArray:
-        """
-        Element-wise inverse of this array.
-        """
-        data = ~self._data
-        return type(self)(data, func=self.dtype.func)
+    @classmethod
+    def from_values(cls, values, created_by: str = None, var_names: Optional[Sequence] = None, var_name: str = None,
+                    raise_on_nan: bool = True, raise_on_one: bool = True,
+                    func_call_str: str = None, context: RunContext = None) -> PValueArray:
+        """
+        Create a PValueArray from float values, without copying them.
+        Invalid p-values (NaN, 1) are reported as in `PValue.from_value`.
+        """
+        array = cls(values, created_by=created_by)
+        invalid = np.zeros(len(array), dtype=bool)
+        if raise_on_nan:
+            invalid |= np.isnan(array._data)
+        if raise_on_one:
+            invalid |= array._data == 1
+        for index in np.flatnonzero(invalid):
+            PValue.from_value(array._data[index], created_by=created_by,
+                              var_name=var_names[index] if var_names is not None else var_name,
+                              raise_on_nan=raise_on_nan, raise_on_one=raise_on_one,
+                              func_call_str=func_call_str, context=context)
+        return array
 
-    def _apply_operator(self, op, other, recast=False) -> np.ndarray | PValueArray:
+    @property
+    def float_values(self) -> np.ndarray:
         """
-        Helper method to apply an operator `op` between `self` and `other`.
-
-        Some ops require the result to be recast into PValueArray:
-        * Comparison ops: recast=False
-        * Arithmetic ops: recast=True
+        The p-values as floats (a view, not a copy).
         """
-        f = operator.attrgetter(op)
-        data, other = np.array(self), np.array(other)
-        result = f(data)(other)
-        return result if not recast else type(self)(result, func=self.dtype.func)
+        return self._data
 
-    def _apply_operator_if_not_series(self, op, other, recast=False) -> np.ndarray | PValueArray:
-        """
-        Wraps _apply_operator only if `other` is not Series/DataFrame.
+    def _box(self, value) -> PValue:
+        return PValue(float(value), created_by=self.created_by)
 
-        Some ops should return NotImplemented if `other` is a Series/DataFrame:
-        https://github.com/pandas-dev/pandas/blob/e7e7b40722e421ef7e519c645d851452c70a7b7c/pandas/tests/extension/base/ops.py#L115
-        """
-        if isinstance(other, (pd.Series, pd.DataFrame)):
-            return NotImplemented
-        else:
-            return self._apply_operator(op, other, recast=recast)
-
-    # Required for all ExtensionArray subclasses
-    @pd.core.ops.unpack_zerodim_and_defer('__eq__')
-    def __eq__(self, other):
-        return self._apply_operator('__eq__', other, recast=False)
-
-    # TestComparisonOpsTests
-    @pd.core.ops.unpack_zerodim_and_defer('__ne__')
-    def __ne__(self, other):
-        return self._apply_operator('__ne__', other, recast=False)
-
-    # TestComparisonOpsTests
-    @pd.core.ops.unpack_zerodim_and_defer('__lt__')
-    def __lt__(self, other):
-        return self._apply_operator('__lt__', other, recast=False)
-
-    # TestComparisonOpsTests
-    @pd.core.ops.unpack_zerodim_and_defer('__gt__')
-    def __gt__(self, other):
-        return self._apply_operator('__gt__', other, recast=False)
-
-    # TestComparisonOpsTests
-    @pd.core.ops.unpack_zerodim_and_defer('__le__')
-    def __le__(self, other):
-        return self._apply_operator('__le__', other, recast=False)
-
-    # TestComparisonOpsTests
-    @pd.core.ops.unpack_zerodim_and_defer('__ge__')
-    def __ge__(self, other):
-        return self._apply_operator('__ge__', other, recast=False)
-
-    # TestArithmeticOpsTests
-    @pd.core.ops.unpack_zerodim_and_defer('__add__')
-    def __add__(self, other) -> PValueArray:
-        return self._apply_operator_if_not_series('__add__', other, recast=True)
-
-    # TestArithmeticOpsTests
-    @pd.core.ops.unpack_zerodim_and_defer('__sub__')
-    def __sub__(self, other) -> PValueArray:
-        return self._apply_operator_if_not_series('__sub__', other, recast=True)
-
-    # TestArithmeticOpsTests
-    @pd.core.ops.unpack_zerodim_and_defer('__mul__')
-    def __mul__(self, other) -> PValueArray:
-        return self._apply_operator_if_not_series('__mul__', other, recast=True)
-
-    # TestArithmeticOpsTests
-    @pd.core.ops.unpack_zerodim_and_defer('__truediv__')
-    def __truediv__(self, other) -> PValueArray:
-        return self._apply_operator_if_not_series('__truediv__', other, recast=True)
-
-    # Required for all ExtensionArray subclasses
-    @classmethod
-    def _from_sequence(cls, data, dtype=None, copy: bool = False):
-        """
-        Construct a new PValueArray from a sequence of scalars.
-        """
-        if dtype is None:
-            dtype = PValueDtype()
+    def _raise_if_forbidden_func(self, method_name: str):
+        PValue(np.nan, created_by=self.created_by)._raise_if_forbidden_func(method_name)
 
-        if not isinstance(dtype, PValueDtype):
-            msg = f"'{cls.__name__}' only supports 'PValueDtype' dtype"
-            raise ValueError(msg)
-        else:
-            return cls(data, func=dtype.func, copy=copy)
+    # Construction:
 
-    # TestParsingTests
     @classmethod
-    def _from_sequence_of_strings(cls, strings, *, dtype=None, copy: bool = False) -> PValueArray:
-        """
-        Construct a new PValueArray from a sequence of strings.
-        """
-        scalars = pd.to_numeric(strings, errors='raise')
-        return cls._from_sequence(scalars, dtype=dtype, copy=copy)
+    def _from_sequence(cls, scalars, *, dtype=None, copy: bool = False) -> PValueArray:
+        if isinstance(scalars, PValueArray):
+            return cls(scalars._data, created_by=scalars.created_by, copy=copy)
+        if isinstance(scalars, np.ndarray) and scalars.dtype != object:
+            return cls(scalars, copy=copy)
+        scalars = list(scalars)
+        created_by = {scalar.created_by for scalar in scalars if is_p_value(scalar)}
+        return cls([scalar.value if is_p_value(scalar) else scalar for scalar in scalars],
+                   created_by=created_by.pop() if len(created_by) == 1 else None)
 
-    # Required for all ExtensionArray subclasses
     @classmethod
-    def _from_factorized(cls, uniques: np.ndarray, original: PValueArray):
-        """
-        Reconstruct an PValueArray after factorization.
-        """
-        return cls(uniques, func=original.dtype.func)
+    def _from_factorized(cls, uniques, original: PValueArray) -> PValueArray:
+        return cls(uniques, created_by=original.created_by)
 
-    # Required for all ExtensionArray subclasses
     @classmethod
     def _concat_same_type(cls, to_concat: Sequence[PValueArray]) -> PValueArray:
-        """
-        Concatenate multiple AngleArrays.
-        """
-        return cls(np.concatenate(to_concat), func=None)
+        created_by = {array.created_by for array in to_concat}
+        return cls(np.concatenate([array._data for array in to_concat]),
+                   created_by=created_by.pop() if len(created_by) == 1 else None)
+
+    # Array interface:
 
-    # Required for all ExtensionArray subclasses
     @property
-    def dtype(self):
-        """
-        An instance of PValueDtype.
-        """
-        return PValueDtype(self._func)
+    def dtype(self) -> PValueDtype:
+        return PValueDtype()
 
-    # Required for all ExtensionArray subclasses
     @property
     def nbytes(self) -> int:
-        """
-        The number of bytes needed to store this object in memory.
-        """
         return self._data.nbytes
 
-    @property
-    def func(self):
-        return self.dtype.func
-
-    # Test*ReduceTests
-    def all(self) -> bool:
-        return all(self)
-
-    def any(self) -> bool:  # Test*ReduceTests
-        return any(self)
-
-    def sum(self) -> np.generic:  # Test*ReduceTests
-        return self._data.sum()
-
-    def mean(self) -> np.generic:  # Test*ReduceTests
-        return self._data.mean()
-
-    def max(self) -> np.generic:  # Test*ReduceTests
-        return self._data.max()
-
-    def min(self) -> np.generic:  # Test*ReduceTests
-        return self._data.min()
-
-    def prod(self) -> np.generic:  # Test*ReduceTests
-        return self._data.prod()
-
-    def std(self) -> np.generic:  # Test*ReduceTests
-        return pd.Series(self._data).std()
-
-    def var(self) -> np.generic:  # Test*ReduceTests
-        return pd.Series(self._data).var()
-
-    def median(self) -> np.generic:  # Test*ReduceTests
-        return np.median(self._data)
-
-    def skew(self) -> np.generic:  # Test*ReduceTests
-        return pd.Series(self._data).skew()
-
-    def kurt(self) -> np.generic:  # Test*ReduceTests
-        return pd.Series(self._data).kurt()
-
-    # Test*ReduceTests
-    def _reduce(self, name: str, *, skipna: bool = True, **kwargs):
-        """
-        Return a scalar result of performing the reduction operation.
-        """
-        f = operator.attrgetter(name)
-        return f(self)()
-
-    # Required for all ExtensionArray subclasses
-    def isna(self):
-        """
-        A 1-D array indicating if each value is missing.
-        """
-        return pd.isnull(self._data)
-
-    # Required for all ExtensionArray subclasses
-    def copy(self):
-        """
-        Return a copy of the array.
-        """
-        copied = self._data.copy()
-        return type(self)(copied, func=self.func)
-
-    # Required for all ExtensionArray subclasses
-    def take(self, indices, allow_fill=False, fill_value=None):
-        """
-        Take elements from an array.
-        """
-        if allow_fill and fill_value is None:
-            fill_value = self.dtype.na_value
-
-        result = pd.core.algorithms.take(self._data, indices, allow_fill=allow_fill,
-                                         fill_value=fill_value)
-        return self._from_sequence(result)
+    def __len__(self) -> int:
+        return len(self._data)
 
-    # TestMethodsTests
-    def value_counts(self, dropna: bool = True):
-        """
-        Return a Series containing descending counts of unique values (excludes NA values by default).
-        """
-        return pd.core.algorithms.value_counts(self._data, dropna=dropna)
+    def __iter__(self):
+        for value in self._data:
+            yield self._box(value)
+
+    def __getitem__(self, item):
+        if is_integer(item):
+            return self._box(self._data[item])
+        item = check_array_indexer(self, item)
+        return type(self)(self._data[item], created_by=self.created_by)
+
+    def __setitem__(self, key, value):
+        key = check_array_indexer(self, key)
+        if isinstance(value, PValueArray):
+            value = value.float_values
+        elif _is_p_value_or_na(value):
+            value = value.value if is_p_value(value) else np.nan
+        elif is_list_like(value) and all(_is_p_value_or_na(v) for v in value):
+            value = np.array([v.value if is_p_value(v) else np.nan for v in value], dtype=float)
+        else:
+            raise TypeError(f'Only p-values can be set in an array of p-values; got {type(value).__name__}.')
+        self._data[key] = value
+
+    def isna(self) -> np.ndarray:
+        return np.isnan(self._data)
+
+    def copy(self) -> PValueArray:
+        return type(self)(self._data, created_by=self.created_by, copy=True)
+
+    def take(self, indices, allow_fill: bool = False, fill_value=None) -> PValueArray:
+        fill_value = np.nan if fill_value is None else _to_floats(fill_value)
+        return type(self)(take(self._data, indices, allow_fill=allow_fill, fill_value=fill_value),
+                          created_by=self.created_by)
+
+    def unique(self) -> PValueArray:
+        return type(self)(pd.unique(self._data), created_by=self.created_by)
+
+    def value_counts(self, dropna: bool = True) -> pd.Series:
+        counts = pd.Series(self._data).value_counts(dropna=dropna)
+        return pd.Series(counts.to_numpy(),
+                         index=pd.Index(type(self)(counts.index.to_numpy(), created_by=self.created_by)))
+
+    def _values_for_factorize(self):
+        return self._data, np.nan
+
+    def _values_for_argsort(self) -> np.ndarray:
+        return self._data
+
+    # Conversions (converting p-values to floats is only allowed when PValue.BEHAVE_NORMALLY):
+
+    def _to_object_array(self) -> np.ndarray:
+        result = np.empty(len(self), dtype=object)
+        result[:] = list(self)
+        return result
+
+    def astype(self, dtype, copy: bool = True):
+        dtype = pd.api.types.pandas_dtype(dtype)
+        if isinstance(dtype, PValueDtype):
+            return self.copy() if copy else self
+        if is_object_dtype(dtype):
+            return self._to_object_array()
+        if is_string_dtype(dtype):
+            strings = [str(value) for value in self]
+            if isinstance(dtype, ExtensionDtype):
+                return dtype.construct_array_type()._from_sequence(strings, dtype=dtype)
+            return np.array(strings, dtype=dtype)
+        if not PValue.BEHAVE_NORMALLY:
+            self._raise_if_forbidden_func('__float__')
+        return self._data.astype(dtype, copy=copy)
+
+    def __array__(self, dtype=None):
+        if dtype is None or is_object_dtype(dtype):
+            return self._to_object_array()
+        return self.astype(dtype, copy=False)
+
+    # Operators (see PValue):
+
+    def _apply_operator(self, other, op, returning_new_pvalue: bool):
+        method_name = _get_op_method_name(op)
+        is_new_pvalue = method_name in PValue.OPERATORS_RETURNING_NEW_PVALUE
+        if not PValue.BEHAVE_NORMALLY and not is_new_pvalue and method_name not in \
+                PValue.OPERATORS_RETURNING_NORMAL_VALUE:
+            self._raise_if_forbidden_func(method_name)
+        result = op(self._data, _to_floats(other))
+        if returning_new_pvalue and is_new_pvalue and not PValue.BEHAVE_NORMALLY:
+            return type(self)(result, created_by=self.created_by)
+        return result
+
+    def _cmp_method(self, other, op):
+        return self._apply_operator(other, op, returning_new_pvalue=False)
+
+    def _arith_method(self, other, op):
+        return self._apply_operator(other, op, returning_new_pvalue=True)
+
+    def _logical_method(self, other, op):
+        return self._apply_operator(other, op, returning_new_pvalue=False)
+
+    def _unary_op(self, op, method_name: str):
+        if not PValue.BEHAVE_NORMALLY:
+            self._raise_if_forbidden_func(method_name)
+        return op(self._data)
+
+    def __neg__(self):
+        return self._unary_op(operator.neg, '__neg__')
+
+    def __pos__(self):
+        return self._unary_op(operator.pos, '__pos__')
+
+    def __abs__(self):
+        return self._unary_op(operator.abs, '__abs__')
+
+    def __invert__(self):
+        return self._unary_op(operator.invert, '__invert__')
+
+    def round(self, decimals: int = 0, *args, **kwargs):
+        return self._unary_op(lambda data: np.round(data, decimals), '__round__')
+
+    def _reduce(self, name: str, *, skipna: bool = True, **kwargs) -> Any:
+        data = self._data[~np.isnan(self._data)] if skipna else self._data
+        if name in ('min', 'max'):
+            return self._box(getattr(np, name)(data)) if len(data) else self._box(np.nan)
+        if name in ('any', 'all'):
+            return bool(getattr(np, name)(data))
+        if not PValue.BEHAVE_NORMALLY:
+            self._raise_if_forbidden_func(name)
+        return getattr(pd.Series(self._data), name)(skipna=skipna, **kwargs)
+
+
+def _setitem_with_fallback_to_object(setitem):
+    """
+    Setting a value that a PValueArray cannot hold turns the block into an object block, with the value set in it.
+    pandas does so for its own datetime-like and categorical arrays, but raises for other extension arrays.
+    """
+    @wraps(setitem)
+    def wrapper(self, indexer, value, *args, **kwargs):
+        try:
+            return setitem(self, indexer, value, *args, **kwargs)
+        except (TypeError, ValueError):
+            if not isinstance(self.dtype, PValueDtype):
+                raise
+            return self.astype(np.dtype(object)).setitem(indexer, value, *args, **kwargs)
+    return wrapper
+
+
+ExtensionBlock.setitem = _setitem_with_fallback_to_object(ExtensionBlock.setitem)
@@ -1,7 +1,11 @@
 import os
+import sys
 import traceback
+import weakref
 
 from pathlib import Path
+from types import CodeType
+from typing import Dict, Tuple
 
 from data_to_paper.utils.mutable import Flag
 
@@ -11,6 +15,12 @@ module_filename = MODULE_NAME + ".py"
 
 IS_CHECKING = Flag(False)
 
+# Whether a code object belongs to the user script, by the id of the code object.
+# Keyed by id, because equality of code objects ignores their filename (identical code in the user script and in
+# another file would share an entry). Entries are removed when their code objects are released (e.g. of reloaded
+# scripts).
+_CODE_IDS_TO_IS_USER_SCRIPT: Dict[int, Tuple[weakref.ref, bool]] = {}
+
 
 def is_filename_gpt_code(filename: str) -> bool:
     """
@@ -36,13 +46,28 @@ def get_gpt_module_frames(tb: traceback.StackSummary) -> list:
     return frames
 
 
+def _is_code_from_user_script(code: CodeType) -> bool:
+    filename = code.co_filename
+    return is_filename_gpt_code(filename) or is_filename_test(filename)
+
+
 def is_called_from_user_script(offset: int = 3) -> bool:
     """
     Check if the code is called from user script.
+    `offset` counts the frames from the top of the stack: 1 is this function, 2 is its caller, etc.
     """
     if IS_CHECKING:
         return False
-    with IS_CHECKING.temporary_set(True):
-        tb = traceback.extract_stack()  # this can lead to import and invoke recursion (thereby IS_CHECKING))
-        filename = tb[-offset].filename
-        return is_filename_gpt_code(filename) or is_filename_test(filename)
+    # We walk the frames directly and cache the verdict per code object.
+    # (`traceback.extract_stack()` is much slower as it builds the whole stack and reads the source lines)
+    code = sys._getframe(offset - 1).f_code
+    code_id = id(code)
+    try:
+        return _CODE_IDS_TO_IS_USER_SCRIPT[code_id][1]
+    except KeyError:
+        pass
+    with IS_CHECKING.temporary_set(True):  # checking the filename can lead to import and invoke recursion
+        is_user_script = _is_code_from_user_script(code)
+    _CODE_IDS_TO_IS_USER_SCRIPT[code_id] = \
+        (weakref.ref(code, lambda _: _CODE_IDS_TO_IS_USER_SCRIPT.pop(code_id, None)), is_user_script)
+    return is_user_script
@@ -0,0 +1,239 @@
+import atexit
+import importlib
+import multiprocessing
+import os
+import threading
+
+from dataclasses import dataclass, field
+from multiprocessing.connection import Connection
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from data_to_paper import env
+from data_to_paper.utils.multi_process import send_result, receive_result
+from data_to_paper.utils.mutable import Mutable
+
+# Heavy libraries that LLM-written code typically uses. Importing them once, when the worker starts,
+# saves the import cost on every code run.
+PRE_IMPORTED_MODULES = (
+    'numpy',
+    'pandas',
+    'scipy.stats',
+    'statsmodels.api',
+    'sklearn',
+    'matplotlib',
+    'data_to_paper.run_gpt_code.code_runner',
+    'data_to_paper.run_gpt_code.overrides.contexts',
+)
+
+
+class WorkerCrashedError(RuntimeError):
+    """
+    The worker process terminated while running a task.
+    """
+    pass
+
+
+def get_env_values() -> Dict[str, Any]:
+    """
+    The current values of the `Mutable` settings of `env`, to be set in the worker before each run
+    (the worker was started before, so it does not see later changes made in the parent process).
+    """
+    return {name: value.val for name, value in vars(env).items() if isinstance(value, Mutable)}
+
+
+def set_env_values(env_values: Dict[str, Any]):
+    for name, val in env_values.items():
+        getattr(env, name).set(val)
+
+
+def _worker_main(connection: Connection, modules_to_import: Iterable[str]):
+    """
+    The main loop of a sandbox worker process.
+    Receives `(cwd, env_values, func, args, kwargs)` tasks and sends back the result (or the raised exception).
+    A `None` task terminates the worker. So does a `BaseException` which is not an `Exception` (like `SystemExit`),
+    after it is sent back.
+    """
+    for module_name in modules_to_import:
+        try:
+            importlib.import_module(module_name)
+        except ImportError:
+            pass
+    while True:
+        try:
+            task = connection.recv()
+        except (EOFError, OSError):
+            break
+        if task is None:
+            break
+        cwd, env_values, func, args, kwargs = task
+        try:
+            os.chdir(cwd)
+            set_env_values(env_values)
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            result = e
+        send_result(connection, result)
+        if not isinstance(result, Exception) and isinstance(result, BaseException):
+            break
+
+
+@dataclass
+class SandboxWorker:
+    """
+    A single pre-warmed worker process, with the pipe used to send it tasks.
+    """
+    modules_to_import: Iterable[str] = PRE_IMPORTED_MODULES
+    num_runs: int = 0
+    process: Optional[multiprocessing.Process] = None
+    connection: Optional[Connection] = None
+
+    def start(self):
+        self.connection, child_connection = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=_worker_main,
+            args=(child_connection, tuple(self.modules_to_import)),
+            daemon=False,  # daemonic processes cannot create children (e.g., sklearn n_jobs)
+        )
+        self.process.start()
+        child_connection.close()
+        return self
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self.process.pid if self.process is not None else None
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def run(self, func: Callable, args: tuple = (), kwargs: dict = None,
+            timeout_sec: Optional[float] = None) -> Tuple[bool, Any]:
+        """
+        Run `func(*args, **kwargs)` in the worker.
+        Returns (is_timeout, result). On timeout, the worker is terminated.
+        """
+        self.num_runs += 1
+        self.connection.send((os.getcwd(), get_env_values(), func, args, kwargs or {}))
+        if not self.connection.poll(timeout_sec):
+            self.terminate()
+            return True, None
+        try:
+            result = receive_result(self.connection)
+        except (EOFError, OSError):
+            exitcode = self.process.exitcode
+            self.terminate()
+            raise WorkerCrashedError(f'Sandbox worker process terminated unexpectedly (exit code: {exitcode}).')
+        if not isinstance(result, Exception) and isinstance(result, BaseException):
+            self.terminate()  # the worker exits after sending a SystemExit, KeyboardInterrupt, etc.
+        return False, result
+
+    def stop(self, timeout_sec: float = 5):
+        if self.is_alive():
+            try:
+                self.connection.send(None)
+            except (EOFError, OSError):
+                pass
+            self.process.join(timeout_sec)
+        self.terminate()
+
+    def terminate(self):
+        if self.process is not None:
+            if self.process.is_alive():
+                self.process.terminate()
+            self.process.join()
+        if self.connection is not None:
+            self.connection.close()
+        self.process = None
+        self.connection = None
+
+
+@dataclass
+class SandboxWorkerPool:
+    """
+    A pool of pre-warmed sandbox worker processes for running LLM-written code.
+
+    Workers are started ahead of time, with the heavy libraries already imported.
+    A worker is recycled (replaced by a freshly started one) after `max_runs_per_worker` runs,
+    or when a run times out or terminates the process.
+    By default, each worker runs a single code, as state changed by a run (warnings filters, matplotlib state,
+    pandas options, monkeypatches, imported modules) would otherwise carry over to later runs.
+    The replacement is started while the caller handles the result, so it is warm by the next run.
+    """
+    num_workers: int = 1
+    max_runs_per_worker: int = 1
+    modules_to_import: Iterable[str] = PRE_IMPORTED_MODULES
+    _idle_workers: List[SandboxWorker] = field(default_factory=list)
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def _start_worker(self) -> SandboxWorker:
+        return SandboxWorker(modules_to_import=self.modules_to_import).start()
+
+    def start(self):
+        with self._lock:
+            while len(self._idle_workers) < self.num_workers:
+                self._idle_workers.append(self._start_worker())
+        return self
+
+    def _checkout_worker(self) -> SandboxWorker:
+        with self._lock:
+            while self._idle_workers:
+                worker = self._idle_workers.pop(0)
+                if worker.is_alive():
+                    return worker
+                worker.terminate()
+        return self._start_worker()
+
+    def _return_worker(self, worker: SandboxWorker):
+        if not worker.is_alive() or worker.num_runs >= self.max_runs_per_worker:
+            worker.stop()
+            worker = self._start_worker()  # pre-warm the replacement while the caller is busy with the result
+        with self._lock:
+            if len(self._idle_workers) < self.num_workers:
+                self._idle_workers.append(worker)
+                return
+        worker.stop()
+
+    def run(self, func: Callable, args: tuple = (), kwargs: dict = None,
+            timeout_sec: Optional[float] = None) -> Tuple[bool, Any]:
+        """
+        Run `func(*args, **kwargs)` in one of the workers.
+        Returns (is_timeout, result).
+        `func`, its arguments and its result must be serializable.
+        """
+        worker = self._checkout_worker()
+        try:
+            return worker.run(func, args, kwargs, timeout_sec)
+        finally:
+            self._return_worker(worker)
+
+    def get_worker_pids(self) -> List[int]:
+        with self._lock:
+            return [worker.pid for worker in self._idle_workers]
+
+    def shutdown(self):
+        with self._lock:
+            workers, self._idle_workers = self._idle_workers, []
+        for worker in workers:
+            worker.stop()
+
+
+_POOL: Optional[SandboxWorkerPool] = None
+
+
+def get_sandbox_worker_pool() -> SandboxWorkerPool:
+    """
+    Return the process-wide pool, creating and pre-warming it on first use.
+    """
+    global _POOL
+    if _POOL is None:
+        _POOL = SandboxWorkerPool().start()
+    return _POOL
+
+
+def shutdown_sandbox_worker_pool():
+    global _POOL
+    if _POOL is not None:
+        _POOL.shutdown()
+        _POOL = None
+
+
+atexit.register(shutdown_sandbox_worker_pool)
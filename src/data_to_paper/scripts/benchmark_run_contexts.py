@@ -0,0 +1,54 @@
+"""
+This script measures the time it takes to enter and exit the run contexts of the `CodeRunner`.
+
+Each repetition creates the contexts anew, as they are created for each run of a GPT code.
+The first repetition includes one-time costs (imports, discovery of the overridden functions and methods);
+later repetitions show the cost paid per run of a code.
+"""
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+from data_to_paper.research_types.hypothesis_testing.coding.utils import create_pandas_and_stats_contexts
+from data_to_paper.run_gpt_code.base_run_contexts import MultiRunContext
+from data_to_paper.run_gpt_code.code_runner import CodeRunner
+
+NUM_REPETITIONS = 10
+
+
+def get_leaf_contexts(contexts: Dict[str, object], prefix: str = '') -> Dict[str, object]:
+    leaf_contexts = {}
+    for name, context in contexts.items():
+        if isinstance(context, MultiRunContext):
+            sub_contexts = context.contexts if isinstance(context.contexts, dict) else \
+                {type(sub_context).__name__: sub_context for sub_context in context.contexts}
+            leaf_contexts.update(get_leaf_contexts(sub_contexts, prefix=f'{prefix}{name}.'))
+        else:
+            leaf_contexts[prefix + name] = context
+    return leaf_contexts
+
+
+def benchmark_run_contexts(num_repetitions: int = NUM_REPETITIONS) -> Dict[str, List[float]]:
+    """
+    Return the times (in seconds) of entering and exiting each of the run contexts, in each repetition.
+    """
+    names_to_times = defaultdict(list)
+    for _ in range(num_repetitions):
+        code_runner = CodeRunner(additional_contexts=create_pandas_and_stats_contexts())
+        contexts = get_leaf_contexts(code_runner._get_or_create_multi_context().contexts)
+        for name, context in contexts.items():
+            start = time.perf_counter()
+            with context:
+                pass
+            names_to_times[name].append(time.perf_counter() - start)
+    return dict(names_to_times)
+
+
+if __name__ == '__main__':
+    names_to_times = benchmark_run_contexts()
+    print(f'{"context":<60}{"first (ms)":>12}{"later (ms)":>12}')
+    for name, times in sorted(names_to_times.items(), key=lambda item: -item[1][0]):
+        later = sum(times[1:]) / len(times[1:]) if len(times) > 1 else float('nan')
+        print(f'{name:<60}{times[0] * 1000:>12.2f}{later * 1000:>12.2f}')
+    print(f'{"total":<60}{sum(times[0] for times in names_to_times.values()) * 1000:>12.2f}'
+          f'{sum(sum(times[1:]) / max(len(times) - 1, 1) for times in names_to_times.values()) * 1000:>12.2f}')
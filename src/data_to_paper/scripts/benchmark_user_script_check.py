@@ -0,0 +1,112 @@
+"""
+This script measures the cost of `is_called_from_user_script` when running a pandas-heavy LLM code.
+
+The run contexts check, on every intercepted call (DataFrame `__getitem__`/`__setitem__`, statsmodels `fit`,
+PValue creation, ...), whether the call comes from the user script.
+The code is run with the frame-based check, and with the original, traceback-based, check.
+A first, untimed, run imports the modules used by the code.
+"""
+import time
+import traceback
+from contextlib import contextmanager
+from typing import Callable, Dict
+
+from data_to_paper.research_types.hypothesis_testing.coding.utils import create_pandas_and_stats_contexts
+from data_to_paper.run_gpt_code import base_run_contexts, user_script_name
+from data_to_paper.run_gpt_code.code_runner import CodeRunner
+from data_to_paper.run_gpt_code.overrides import types
+from data_to_paper.run_gpt_code.user_script_name import IS_CHECKING, is_filename_gpt_code, is_filename_test
+
+NUM_REPETITIONS = 3
+
+PANDAS_HEAVY_CODE = """
+import numpy as np
+import pandas as pd
+import statsmodels.formula.api as smf
+from scipy import stats
+
+rng = np.random.default_rng(0)
+df = pd.DataFrame({
+    'age': rng.integers(20, 80, 2000),
+    'bmi': rng.normal(25, 4, 2000),
+    'group': rng.choice(['a', 'b', 'c'], 2000),
+})
+for i in range(200):
+    df['age_sq'] = df['age'] ** 2
+    df['bmi_z'] = (df['bmi'] - df['bmi'].mean()) / df['bmi'].std()
+    df['is_old'] = df['age'] > 60
+    summary = df.groupby('group')['bmi'].agg(['mean', 'std'])
+    subset = df[df['is_old']][['age', 'bmi']]
+for group in ['a', 'b', 'c']:
+    stats.ttest_ind(df[df['group'] == group]['bmi'], df[df['group'] != group]['bmi'])
+model = smf.ols('bmi ~ age + age_sq + C(group)', data=df).fit()
+"""
+
+
+def is_called_from_user_script_by_traceback(offset: int = 3) -> bool:
+    """
+    The original, traceback-based, implementation of `is_called_from_user_script`.
+    """
+    if IS_CHECKING:
+        return False
+    with IS_CHECKING.temporary_set(True):
+        tb = traceback.extract_stack()
+        filename = tb[-offset].filename
+        return is_filename_gpt_code(filename) or is_filename_test(filename)
+
+
+@contextmanager
+def use_user_script_check(func: Callable, calls: Dict[str, int]):
+    """
+    Use `func` as `is_called_from_user_script` in the run contexts, and count its calls.
+    """
+    def counted_func(offset: int = 3) -> bool:
+        calls['num_calls'] += 1
+        return func(offset=offset + 1)
+
+    modules = [base_run_contexts, types]
+    originals = [module.is_called_from_user_script for module in modules]
+    for module in modules:
+        module.is_called_from_user_script = counted_func
+    try:
+        yield
+    finally:
+        for module, original in zip(modules, originals):
+            module.is_called_from_user_script = original
+
+
+def run_code():
+    code_runner = CodeRunner(additional_contexts=create_pandas_and_stats_contexts(
+        allow_dataframes_to_change_existing_series=True))
+    *_, exception = code_runner.run(PANDAS_HEAVY_CODE)
+    if exception is not None:
+        raise exception
+
+
+def benchmark_user_script_check(num_repetitions: int = NUM_REPETITIONS) -> Dict[str, Dict[str, float]]:
+    """
+    Return, for each implementation, the number of checks and the time (in seconds) of running the code.
+    """
+    names_to_funcs = {
+        'frame': user_script_name.is_called_from_user_script,
+        'traceback': is_called_from_user_script_by_traceback,
+    }
+    names_to_results = {}
+    run_code()
+    for name, func in names_to_funcs.items():
+        calls = {'num_calls': 0}
+        times = []
+        with use_user_script_check(func, calls):
+            for _ in range(num_repetitions):
+                start = time.perf_counter()
+                run_code()
+                times.append(time.perf_counter() - start)
+        names_to_results[name] = {'num_calls': calls['num_calls'] / num_repetitions, 'time': min(times)}
+    return names_to_results
+
+
+if __name__ == '__main__':
+    names_to_results = benchmark_user_script_check()
+    print(f'{"check":<12}{"calls per run":>16}{"run time (ms)":>16}')
+    for name, results in names_to_results.items():
+        print(f'{name:<12}{results["num_calls"]:>16.0f}{results["time"] * 1000:>16.1f}')
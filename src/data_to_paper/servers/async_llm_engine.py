@@ -0,0 +1,197 @@
+import asyncio
+import atexit
+import threading
+import time
+
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import aiohttp
+import openai
+
+from data_to_paper.env import MAX_CONCURRENT_LLM_REQUESTS, LIMIT_LLM_REQUEST_RATES
+from data_to_paper.utils.print_to_file import print_and_log_red
+
+from .model_engine import ModelEngine
+from .types import InvalidAPIKeyError, ServerErrorException
+
+TIME_LIMIT_FOR_OPENAI_CALL = 300  # seconds
+MAX_NUM_LLM_ATTEMPTS = 5
+
+
+@dataclass
+class TokenBucket:
+    """
+    A token bucket holding up to `capacity` units, refilled continuously at a rate of `capacity` per `period` seconds.
+    """
+    capacity: float
+    period: float = 60.  # seconds
+    _level: float = field(init=False)
+    _last_time: float = field(init=False)
+
+    def __post_init__(self):
+        self._level = self.capacity
+        self._last_time = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._level = min(self.capacity, self._level + (now - self._last_time) * self.capacity / self.period)
+        self._last_time = now
+
+    def get_wait_time(self, amount: float) -> float:
+        """
+        Return the time (seconds) until `amount` units are available; 0 if available now.
+        Amounts larger than the capacity are treated as the full capacity.
+        """
+        self._refill()
+        amount = min(amount, self.capacity)
+        return max(0., (amount - self._level) * self.period / self.capacity)
+
+    def consume(self, amount: float):
+        self._refill()
+        self._level -= min(amount, self.capacity)
+
+
+@dataclass
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute limits of a model engine.
+    Requests are admitted in the order in which they were submitted.
+    """
+    requests_per_minute: int
+    tokens_per_minute: int
+    _request_bucket: TokenBucket = field(init=False)
+    _token_bucket: TokenBucket = field(init=False)
+    _lock: Optional[asyncio.Lock] = field(default=None, init=False)
+
+    def __post_init__(self):
+        self._request_bucket = TokenBucket(self.requests_per_minute)
+        self._token_bucket = TokenBucket(self.tokens_per_minute)
+
+    def get_wait_time(self, num_tokens: int) -> float:
+        return max(self._request_bucket.get_wait_time(1), self._token_bucket.get_wait_time(num_tokens))
+
+    async def acquire(self, num_tokens: int):
+        """
+        Wait until a request of `num_tokens` tokens (prompt and expected response) is allowed.
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            wait_time = self.get_wait_time(num_tokens)
+            while wait_time > 0:
+                await asyncio.sleep(wait_time)
+                wait_time = self.get_wait_time(num_tokens)
+            self._request_bucket.consume(1)
+            self._token_bucket.consume(num_tokens)
+
+
+@dataclass
+class AsyncLLMEngine:
+    """
+    Sends LLM requests from an asyncio event loop, running in a background thread.
+
+    Requests are submitted from synchronous code, with `submit`, which returns a `concurrent.futures.Future`.
+    Submitted requests run concurrently (up to `MAX_CONCURRENT_LLM_REQUESTS`), subject to the rate limits of
+    their model engine (if `LIMIT_LLM_REQUEST_RATES`), and share a single http session (connection reuse).
+    A request is cancelled by cancelling its future.
+    """
+    _loop: Optional[asyncio.AbstractEventLoop] = None
+    _thread: Optional[threading.Thread] = None
+    _session: Optional[aiohttp.ClientSession] = None
+    _semaphore: Optional[asyncio.Semaphore] = None
+    _rate_limiters: Dict[ModelEngine, RateLimiter] = field(default_factory=dict)
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def _start(self):
+        with self._lock:
+            if self._loop is not None:
+                return
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, name='AsyncLLMEngine', daemon=True)
+            self._thread.start()
+
+    def get_rate_limiter(self, model_engine: ModelEngine) -> RateLimiter:
+        if model_engine not in self._rate_limiters:
+            self._rate_limiters[model_engine] = RateLimiter(*model_engine.rate_limits)
+        return self._rate_limiters[model_engine]
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession()
+        return self._session
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(MAX_CONCURRENT_LLM_REQUESTS.val)
+        return self._semaphore
+
+    async def _create_chat_completion(self, messages: List[dict], model_engine: ModelEngine, **kwargs):
+        openai.aiosession.set(self._get_session())  # context-local; applies to this request only
+        async with self._get_semaphore():
+            return await asyncio.wait_for(
+                openai.ChatCompletion.acreate(
+                    model=model_engine.value,
+                    messages=messages,
+                    api_key=model_engine.api_key.key,
+                    api_base=model_engine.base_url,
+                    **kwargs,
+                ),
+                timeout=TIME_LIMIT_FOR_OPENAI_CALL,
+            )
+
+    async def _request(self, messages: List[dict], model_engine: ModelEngine, num_tokens: int, **kwargs) -> str:
+        for attempt in range(MAX_NUM_LLM_ATTEMPTS):
+            if LIMIT_LLM_REQUEST_RATES:
+                await self.get_rate_limiter(model_engine).acquire(num_tokens)
+            try:
+                response = await self._create_chat_completion(messages, model_engine, **kwargs)
+                return response['choices'][0]['message']['content']
+            except openai.error.InvalidRequestError as e:
+                raise ServerErrorException(server=model_engine.server_name, response=e)
+            except (openai.error.AuthenticationError, openai.error.PermissionError) as e:
+                raise InvalidAPIKeyError(server=model_engine.server_name, response=e, api_key=model_engine.api_key)
+            except (openai.error.OpenAIError, asyncio.TimeoutError) as e:
+                sleep_time = 1.0 * 2 ** attempt
+                print_and_log_red(f'Unexpected OPENAI error:\n{type(e)}\n{e}\n'
+                                  f'Going to sleep for {sleep_time} seconds before trying again.',
+                                  should_log=False)
+                await asyncio.sleep(sleep_time)
+                print_and_log_red(f'Retrying to call openai (attempt {attempt + 1}/{MAX_NUM_LLM_ATTEMPTS}) ...',
+                                  should_log=False)
+        raise ServerErrorException(
+            server=model_engine.server_name,
+            response=ConnectionError(f'Failed to get server response after {MAX_NUM_LLM_ATTEMPTS} attempts.'))
+
+    def submit(self, messages: List[dict], model_engine: ModelEngine, num_tokens: int, **kwargs) -> Future:
+        """
+        Submit a chat-completion request.
+        `num_tokens` is the number of tokens charged to the rate limiter (prompt and expected response).
+        Returns a future of the content of the response.
+        """
+        self._start()
+        return asyncio.run_coroutine_threadsafe(
+            self._request(messages, model_engine, num_tokens, **kwargs), self._loop)
+
+    def shutdown(self):
+        with self._lock:
+            if self._loop is None:
+                return
+            if self._session is not None:
+                asyncio.run_coroutine_threadsafe(self._session.close(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._loop = self._thread = self._session = self._semaphore = None
+            self._rate_limiters = {}
+
+
+_ENGINE = AsyncLLMEngine()
+
+
+def get_async_llm_engine() -> AsyncLLMEngine:
+    return _ENGINE
+
+
+atexit.register(_ENGINE.shutdown)
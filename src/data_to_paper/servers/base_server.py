@@ -1,13 +1,16 @@
 import functools
+import json
 import os
 import pickle
 import time
 from abc import ABC
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Union, Optional
+from typing import Union, Optional, List, Tuple
 
 from data_to_paper.env import CHOSEN_APP, DELAY_SERVER_CACHE_RETRIEVAL
 from .json_dump import dump_to_json, load_from_json
+from .shared_cache import get_shared_response_cache
 from .serialize_exceptions import (
     serialize_exception,
     is_exception,
@@ -46,6 +49,7 @@ class ServerCaller(ABC):
 
     name: str = None
     file_extension: str = None
+    use_journal: bool = False  # append new records to a journal file, instead of re-saving all records
 
     def __init__(self, fail_if_not_all_responses_used=True):
 
@@ -74,6 +78,15 @@ class ServerCaller(ABC):
         """
         raise NotImplementedError()
 
+    @classmethod
+    def _get_server_responses(cls, requests: List[Tuple[tuple, dict]]) -> list:
+        """
+        actual calls to the server, for a batch of independent requests, each given as (args, kwargs).
+        returns the raw responses in the order of the requests.
+        can be overridden to send the requests concurrently.
+        """
+        return [cls._get_server_response(*args, **kwargs) for args, kwargs in requests]
+
     @staticmethod
     def _post_process_response(response, args, kwargs):
         """
@@ -93,6 +106,70 @@ class ServerCaller(ABC):
         """
         raise NotImplementedError()
 
+    def _get_journal_entry(self, args, kwargs, response) -> dict:
+        """
+        returns a json-serializable entry describing a new record, to be appended to the journal file.
+        """
+        raise NotImplementedError()
+
+    def _add_journal_entry_to_records(self, records, entry: dict):
+        """
+        adds a record described by a journal entry to the records.
+        """
+        raise NotImplementedError()
+
+    def _count_records(self, records) -> int:
+        raise NotImplementedError()
+
+    @staticmethod
+    def get_journal_file_path(file_path) -> str:
+        return str(file_path) + '.journal'
+
+    def _get_new_journal_entry(self, args, kwargs, response) -> dict:
+        """
+        returns the journal entry of a response that was just added to the new records.
+        """
+        entry = self._get_journal_entry(args, kwargs, response)
+        # The number of records including this one, so that entries already compacted into the main file are skipped
+        entry['n'] = self._count_records(self.old_records) + self._count_records(self.new_records)
+        return entry
+
+    def _save_new_records(self, journal_entries: List[dict]):
+        """
+        saves newly recorded responses.
+        With a journal, the entries are appended to the journal file (which is compacted into the main file by
+        `save_records`). Otherwise, all the records are re-saved.
+        """
+        if not self.use_journal:
+            self.save_records()
+            return
+        Path(os.path.dirname(self.file_path)).mkdir(parents=True, exist_ok=True)
+        with open(self.get_journal_file_path(self.file_path), 'a') as file:
+            file.write(''.join(json.dumps(entry) + '\n' for entry in journal_entries))
+
+    def _append_new_record_to_file(self, args, kwargs, response):
+        """
+        saves a newly recorded response.
+        """
+        self._save_new_records([self._get_new_journal_entry(args, kwargs, response)] if self.use_journal else [])
+
+    def _load_records_and_journal(self, file_path):
+        """
+        loads the records from the file, and then adds the records of the journal file, if exists.
+        """
+        records = self._load_records(file_path) if os.path.isfile(file_path) else self.empty_records
+        journal_file_path = self.get_journal_file_path(file_path)
+        if self.use_journal and os.path.isfile(journal_file_path):
+            with open(journal_file_path, 'r') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        break  # a partially written last line
+                    if entry.pop('n') > self._count_records(records):
+                        self._add_journal_entry_to_records(records, entry)
+        return records
+
     def get_server_response(self, *args, **kwargs):
         """
         returns the response from the server after post-processing. allows recording and replaying.
@@ -102,6 +179,17 @@ class ServerCaller(ABC):
             raise response
         return self._post_process_response(response, args, kwargs)
 
+    def get_server_responses(self, requests: List[Tuple[tuple, dict]]) -> list:
+        """
+        returns the responses for a batch of independent requests, each given as (args, kwargs).
+        Requests that are not in the records are sent to the server together (see `_get_server_responses`).
+        Responses are recorded, and replayed, in the order of the requests, regardless of the order in which they
+        arrive. Exceptions returned by the server are returned in place of the responses (rather than raised).
+        """
+        responses = self._get_raw_server_responses(requests)
+        return [response if isinstance(response, Exception) else self._post_process_response(response, args, kwargs)
+                for response, (args, kwargs) in zip(responses, requests)]
+
     def _get_response_from_records(self, args, kwargs):
         """
         returns the response from the records, if exists.
@@ -114,27 +202,71 @@ class ServerCaller(ABC):
         """
         raise NotImplementedError()
 
+    def _get_single_server_response(self, args, kwargs):
+        """
+        returns the raw response to a single request.
+        A failed request is raised (like in the batch, it is not recorded), so that it is sent again when the run is
+        repeated.
+        """
+        response = self._get_server_responses([(args, kwargs)])[0]
+        if isinstance(response, Exception):
+            raise response
+        return response
+
     def _get_raw_server_response(self, *args, **kwargs):
         """
         returns the raw response from the server, allows recording and replaying.
         """
         if not self.is_playing_or_recording:
-            return self._get_server_response(*args, **kwargs)
+            return self._get_single_server_response(args, kwargs)
         response = self._get_response_from_records(args, kwargs)
         if response is not None and CHOSEN_APP is not None:
             time.sleep(DELAY_SERVER_CACHE_RETRIEVAL.val)
         if response is None:
             if not self.record_more_if_needed:
                 raise NoMoreResponsesToMockError()
-            response = self._get_server_response(*args, **kwargs)
+            response = self._get_single_server_response(args, kwargs)
             self._add_response_to_new_records(args, kwargs, response)
             if self.should_save:
-                self.save_records()
+                self._append_new_record_to_file(args, kwargs, response)
         self.args_kwargs_response_history.append(
             (args, kwargs, response)
         )  # for debugging and testing
         return response
 
+    def _get_raw_server_responses(self, requests: List[Tuple[tuple, dict]]) -> list:
+        """
+        returns the raw responses for a batch of requests, allows recording and replaying.
+        """
+        if not self.is_playing_or_recording:
+            return self._get_server_responses(requests)
+        responses = [self._get_response_from_records(args, kwargs) for args, kwargs in requests]
+        missing_indices = [i for i, response in enumerate(responses) if response is None]
+        if len(missing_indices) < len(requests) and CHOSEN_APP is not None:
+            time.sleep(DELAY_SERVER_CACHE_RETRIEVAL.val)
+        if missing_indices:
+            if not self.record_more_if_needed:
+                raise NoMoreResponsesToMockError()
+            missing_requests = [requests[i] for i in missing_indices]
+            journal_entries = []
+            is_recording = True
+            for i, (args, kwargs), response in zip(
+                    missing_indices, missing_requests, self._get_server_responses(missing_requests)):
+                responses[i] = response
+                # Responses are recorded up to the first failed request, so that replay stays in request order,
+                # and the failed request (and those following it) are sent again when the run is repeated.
+                is_recording = is_recording and not isinstance(response, Exception)
+                if is_recording:
+                    self._add_response_to_new_records(args, kwargs, response)
+                    if self.should_save and self.use_journal:
+                        journal_entries.append(self._get_new_journal_entry(args, kwargs, response))
+            if self.should_save:
+                self._save_new_records(journal_entries)  # once for the whole batch
+        self.args_kwargs_response_history.extend(
+            (args, kwargs, response) for (args, kwargs), response in zip(requests, responses)
+        )  # for debugging and testing
+        return responses
+
     def __enter__(self):
         self.new_records = self.empty_records
         self.is_playing_or_recording = True
@@ -173,6 +305,9 @@ class ServerCaller(ABC):
         # create the directory if not exist
         Path(os.path.dirname(file_path)).mkdir(parents=True, exist_ok=True)
         self._save_records(self.all_records, file_path)
+        if self.use_journal and os.path.isfile(self.get_journal_file_path(file_path)):
+            # the journal is now compacted into the main file
+            os.remove(self.get_journal_file_path(file_path))
 
     def mock_with_file(
         self,
@@ -185,8 +320,9 @@ class ServerCaller(ABC):
         Returns a context-manager to mock the server responses from a specified file.
         """
         # load the old records from the file if exist
-        if os.path.isfile(file_path):
-            old_records = self._load_records(file_path)
+        if os.path.isfile(file_path) or \
+                self.use_journal and os.path.isfile(self.get_journal_file_path(file_path)):
+            old_records = self._load_records_and_journal(file_path)
         else:
             old_records = []
 
@@ -249,9 +385,10 @@ class OrderedServerCaller(ServerCaller, ABC):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.index_in_old_records = 0
+        self._old_records_as_list = None
 
     def are_more_records_available(self):
-        return self.index_in_old_records < len(self._get_old_records_as_list())
+        return self.index_in_old_records < len(self._get_cached_old_records_as_list())
 
     def reset_index(self):
         self.index_in_old_records = 0
@@ -262,12 +399,29 @@ class OrderedServerCaller(ServerCaller, ABC):
         """
         raise NotImplementedError()
 
+    def _get_cached_old_records_as_list(self):
+        """
+        Return the list of old records, built once (rather than on each lookup).
+        Must be invalidated, with `invalidate_old_records_as_list`, when the old records are changed.
+        """
+        if self._old_records_as_list is None:
+            self._old_records_as_list = self._get_old_records_as_list()
+        return self._old_records_as_list
+
+    def invalidate_old_records_as_list(self):
+        self._old_records_as_list = None
+
+    def mock(self, *args, **kwargs):
+        result = super().mock(*args, **kwargs)
+        self.invalidate_old_records_as_list()
+        return result
+
     def _get_response_from_a_record(self, record, args, kwargs):
         return record
 
     def _get_response_from_records(self, args, kwargs):
         if self.are_more_records_available():
-            record = self._get_old_records_as_list()[self.index_in_old_records]
+            record = self._get_cached_old_records_as_list()[self.index_in_old_records]
             response = self._get_response_from_a_record(record, args, kwargs)
             self.index_in_old_records += 1
             return response
@@ -303,11 +457,21 @@ class ListServerCaller(OrderedServerCaller):
     A base class for calling a remote server, while allowing recording and replaying server responses.
     Records are saved as a sequence of responses and can be replayed in the same order (regardless of the arguments).
     """
+    use_journal = True
 
     @property
     def empty_records(self) -> list:
         return []
 
+    def _get_journal_entry(self, args, kwargs, response) -> dict:
+        return {'value': self._serialize_record(response)}
+
+    def _add_journal_entry_to_records(self, records, entry: dict):
+        records.append(self._deserialize_record(entry['value']))
+
+    def _count_records(self, records) -> int:
+        return len(records)
+
     @property
     def all_records(self):
         return self.old_records + self.new_records
@@ -333,11 +497,21 @@ class OrderedKeyToListServerCaller(OrderedServerCaller):
     A class for calling a remote server, while allowing recording and replaying server responses.
     Records are saved as dictionary (key order preserving) of responses with ordered lists as values.
     """
+    use_journal = True
 
     @property
     def empty_records(self) -> dict:
         return {}
 
+    def _get_journal_entry(self, args, kwargs, response) -> dict:
+        return {'key': self._generate_key(args, kwargs), 'value': self._serialize_record(response)}
+
+    def _add_journal_entry_to_records(self, records, entry: dict):
+        records.setdefault(entry['key'], []).append(self._deserialize_record(entry['value']))
+
+    def _count_records(self, records) -> int:
+        return sum(len(values) for values in records.values())
+
     @property
     def all_records(self):
         records = self.old_records.copy()
@@ -393,6 +567,7 @@ class OrderedKeyToListServerCaller(OrderedServerCaller):
             if isinstance(old_records, dict)
             else {"GENERAL": old_records} if (old_records) else self.empty_records
         )
+        self.invalidate_old_records_as_list()
         return result
 
 
@@ -402,6 +577,9 @@ class ParameterizedQueryServerCaller(ServerCaller, ABC):
     Records are saved as a dictionary of responses and can be replayed by the arguments and keyword arguments.
     """
 
+    max_concurrent_requests: int = 1  # for batches of requests (see `get_server_responses`)
+    shared_cache_namespace: Optional[str] = None  # if set, responses are also kept in the shared response cache
+
     @property
     def empty_records(self) -> dict:
         return {}
@@ -410,6 +588,50 @@ class ParameterizedQueryServerCaller(ServerCaller, ABC):
     def all_records(self):
         return self.old_records | self.new_records
 
+    @classmethod
+    def _get_server_responses(cls, requests: List[Tuple[tuple, dict]]) -> list:
+        """
+        Identical requests are sent only once.
+        Requests found in the shared response cache (if used; see `get_shared_response_cache`) are not sent.
+        The shared cache is below the record/replay layer: responses retrieved from it are recorded as any other.
+        """
+        keys = [convert_args_kwargs_to_tuple(args, kwargs) for args, kwargs in requests]
+        keys_to_requests = dict(zip(keys, requests))
+        shared_cache = get_shared_response_cache() if cls.shared_cache_namespace is not None else None
+        keys_to_responses = {}
+        if shared_cache is not None:
+            for key in keys_to_requests:
+                response = shared_cache.get(cls.shared_cache_namespace, key)
+                if response is not None:
+                    keys_to_responses[key] = response
+        keys_to_send = [key for key in keys_to_requests if key not in keys_to_responses]
+        new_responses = cls._get_server_responses_for_distinct_requests([keys_to_requests[key] for key in keys_to_send])
+        for key, response in zip(keys_to_send, new_responses):
+            keys_to_responses[key] = response
+            if shared_cache is not None and not isinstance(response, Exception):
+                shared_cache.put(cls.shared_cache_namespace, key, response)
+        return [keys_to_responses[key] for key in keys]
+
+    @classmethod
+    def _get_server_responses_for_distinct_requests(cls, requests: List[Tuple[tuple, dict]]) -> list:
+        """
+        Requests are sent concurrently, by up to `max_concurrent_requests` threads.
+        A request that fails is returned as its exception, in place of its response.
+        """
+        if len(requests) == 1:  # a single request raises, as in `get_server_response`
+            return [cls._get_server_response(*requests[0][0], **requests[0][1])]
+        if cls.max_concurrent_requests > 1 and len(requests) > 1:
+            with ThreadPoolExecutor(min(cls.max_concurrent_requests, len(requests))) as executor:
+                futures = [executor.submit(cls._get_server_response, *args, **kwargs) for args, kwargs in requests]
+                return [future.exception() or future.result() for future in futures]
+        responses = []
+        for args, kwargs in requests:
+            try:
+                responses.append(cls._get_server_response(*args, **kwargs))
+            except Exception as e:
+                responses.append(e)
+        return responses
+
     def _get_response_from_records(self, args, kwargs):
         tuple_args_and_kwargs = convert_args_kwargs_to_tuple(args, kwargs)
         return self.all_records.get(tuple_args_and_kwargs, None)
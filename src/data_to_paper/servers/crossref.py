@@ -1,13 +1,12 @@
-import time
 from typing import List, Mapping, Any
 
-import requests
 from unidecode import unidecode
 
 from data_to_paper.utils.nice_list import NiceList
 
 from .base_server import ParameterizedQueryServerCaller
-from .custom_types import Citation
+from .custom_types import Citation, cached_citation_property
+from .http_session import request_with_retries
 from .types import ServerErrorException
 
 from data_to_paper.utils.print_to_file import print_and_log_red
@@ -131,7 +130,7 @@ class CrossrefCitation(Citation):
     def bibtex_type(self) -> str:
         return get_type_from_crossref(self)
 
-    @property
+    @cached_citation_property
     def bibtex(self) -> str:
         # create a mapping for article and inproceedings
         bibtex_type = get_type_from_crossref(self)
@@ -158,7 +157,7 @@ class CrossrefCitation(Citation):
             type=self.bibtex_type, id=self.bibtex_id, fields=",\n".join(fields)
         )
 
-    @property
+    @cached_citation_property
     def bibtex_id(self) -> str:
         """
         Get the bibtex id for this citation.
@@ -326,6 +325,8 @@ class CrossrefServerCaller(ParameterizedQueryServerCaller):
 
     name = "Crossref"
     file_extension = "_crossref.bin"
+    max_concurrent_requests = 4
+    shared_cache_namespace = "crossref"
 
     @staticmethod
     def crossref_item_to_citation(item: dict) -> dict:
@@ -386,21 +387,9 @@ class CrossrefServerCaller(ParameterizedQueryServerCaller):
             "editor,ISBN",
         }
         print_and_log_red(f'QUERYING Crossref FOR: "{query}"', should_log=False)
-        for attempt in range(3):
-            response = requests.get(CROSSREF_URL, headers=HEADERS, params=params)
-            if response.status_code not in (504, 429):
-                break
-            wait_time = 2**attempt  # Exponential backoff
-            print_and_log_red(
-                f"ERROR: Server timed out or too many requests. "
-                f"We wait for {wait_time} sec and try again.",
-                should_log=False,
-            )
-            time.sleep(wait_time)
-        else:
-            raise ServerErrorException(
-                server=cls.name, response=response
-            )  # if we failed all attempts
+        response = request_with_retries(
+            "GET", CROSSREF_URL, server_name=cls.name, headers=HEADERS, params=params
+        )
 
         if response.status_code != 200:  # 200 is the success code
             raise ServerErrorException(server=cls.name, response=response)
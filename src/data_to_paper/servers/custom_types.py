@@ -1,3 +1,5 @@
+import functools
+
 from typing import Iterable, Optional, Union, Set
 
 import numpy as np
@@ -17,16 +19,90 @@ FIELDS_TO_NAMES = {
 }
 
 
+CACHED_PROPERTY_PREFIX = '_cached_'
+
+
+def cached_citation_property(func):
+    """
+    A property of a Citation that is computed from the content of the citation.
+    The value is cached, until the content of the citation (its items, or its attributes) is changed.
+    """
+    attr = CACHED_PROPERTY_PREFIX + func.__name__
+
+    @property
+    @functools.wraps(func)
+    def wrapper(self):
+        try:
+            return self.__dict__[attr]
+        except KeyError:
+            value = self.__dict__[attr] = func(self)
+            return value
+
+    return wrapper
+
+
 class Citation(dict):
     """
     A citation of a paper.
     """
 
+    # attributes describing the search that found the citation, rather than the citation itself:
+    SEARCH_ATTRIBUTES = ('search_rank', 'query')
+
     def __init__(self, *args, search_rank: int = None, query: Union[str, Set[str]] = None, **kwargs):
         super().__init__(*args, **kwargs)
         self.search_rank = search_rank
         self.query = query
 
+    def __copy__(self):
+        # keep the cached properties (copy.copy sets the items after the attributes, which would clear them):
+        citation = self.__class__.__new__(self.__class__)
+        dict.update(citation, self)
+        citation.__dict__.update(self.__dict__)
+        return citation
+
+    def _clear_cached_properties(self):
+        for attr in [attr for attr in self.__dict__ if attr.startswith(CACHED_PROPERTY_PREFIX)]:
+            del self.__dict__[attr]
+
+    def __setattr__(self, key, value):
+        super().__setattr__(key, value)
+        if key not in self.SEARCH_ATTRIBUTES and not key.startswith(CACHED_PROPERTY_PREFIX):
+            self._clear_cached_properties()
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._clear_cached_properties()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._clear_cached_properties()
+
+    def __ior__(self, other):
+        result = super().__ior__(other)
+        self._clear_cached_properties()
+        return result
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._clear_cached_properties()
+
+    def setdefault(self, key, default=None):
+        self._clear_cached_properties()
+        return super().setdefault(key, default)
+
+    def pop(self, *args):
+        self._clear_cached_properties()
+        return super().pop(*args)
+
+    def popitem(self):
+        self._clear_cached_properties()
+        return super().popitem()
+
+    def clear(self):
+        super().clear()
+        self._clear_cached_properties()
+
     def __key(self):
         return self.bibtex_id
 
@@ -88,16 +164,19 @@ class Citation(dict):
                     fields: Iterable[str] = ('bibtex_id', 'title', 'journal_and_year', 'tldr', 'influence'),
                     is_html: bool = False,
                     embedding_target: float = None,
+                    embedding_similarity: Optional[float] = None,
                     ) -> str:
         """
         Get a pretty representation of the citation.
         Allows specifying which fields to include.
+        The embedding similarity is calculated from `embedding_target`, unless provided as `embedding_similarity`.
         """
         s = ''
         for field in fields:
             name = FIELDS_TO_NAMES[field]
             if field == 'embedding_similarity':
-                value = self.get_embedding_similarity(embedding_target)
+                value = embedding_similarity if embedding_similarity is not None \
+                    else self.get_embedding_similarity(embedding_target)
                 value = None if value is None else round(value, 2)
             else:
                 value = getattr(self, field, field)
@@ -0,0 +1,90 @@
+import threading
+import time
+
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from data_to_paper.utils.print_to_file import print_and_log_red
+
+from .types import ServerErrorException
+
+RETRY_STATUS_CODES = (504, 429)  # server timed out, too many requests
+MAX_CONNECTIONS_PER_HOST = 16
+
+_SESSION: Optional[requests.Session] = None
+_SESSION_LOCK = threading.Lock()
+
+
+def get_http_session() -> requests.Session:
+    """
+    Return the process-wide http session, so that connections to the servers are kept alive and reused.
+    """
+    global _SESSION
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            _SESSION = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_CONNECTIONS_PER_HOST)
+            _SESSION.mount('https://', adapter)
+            _SESSION.mount('http://', adapter)
+        return _SESSION
+
+
+@dataclass
+class BackoffLimiter:
+    """
+    Back-off shared by all the threads calling a server.
+    When the server responds with "too many requests" (or times out), all requests to the server wait,
+    rather than only the request that got the response.
+    """
+    _blocked_until: float = 0.
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def wait(self):
+        with self._lock:
+            wait_time = self._blocked_until - time.monotonic()
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+    def block_for(self, seconds: float):
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+
+_SERVER_NAMES_TO_BACKOFF_LIMITERS: Dict[str, BackoffLimiter] = {}
+
+
+def get_backoff_limiter(server_name: str) -> BackoffLimiter:
+    return _SERVER_NAMES_TO_BACKOFF_LIMITERS.setdefault(server_name, BackoffLimiter())
+
+
+def _get_retry_after(response: requests.Response) -> Optional[float]:
+    try:
+        return float(response.headers['Retry-After'])
+    except (KeyError, ValueError, TypeError):
+        return None
+
+
+def request_with_retries(method: str, url: str, server_name: str, max_attempts: int = 3,
+                         **kwargs) -> requests.Response:
+    """
+    Send a request through the shared session, retrying (with exponential back-off, or as requested by the server's
+    Retry-After header) if the server timed out or had too many requests.
+    Raises ServerErrorException if all attempts failed.
+    """
+    limiter = get_backoff_limiter(server_name)
+    for attempt in range(max_attempts):
+        limiter.wait()
+        response = get_http_session().request(method, url, **kwargs)
+        if response.status_code not in RETRY_STATUS_CODES:
+            return response
+        wait_time = _get_retry_after(response) or 2 ** attempt  # Exponential backoff
+        print_and_log_red(
+            f"ERROR: Server timed out or too many requests. "
+            f"We wait for {wait_time} sec and try again.",
+            should_log=False,
+        )
+        limiter.block_for(wait_time)
+    raise ServerErrorException(server=server_name, response=response)  # if we failed all attempts
@@ -1,6 +1,8 @@
 from __future__ import annotations
 
-import time
+import functools
+
+from concurrent.futures import Future
 from dataclasses import dataclass
 from typing import List, Union, Callable, Tuple, Optional
 from typing import TYPE_CHECKING
@@ -14,16 +16,15 @@ from data_to_paper.utils.print_to_file import print_and_log_red
 from data_to_paper.utils.serialize import SerializableValue, deserialize_serializable_value
 from data_to_paper.conversation.stage import Stage, delete_all_stages_following_stage
 
+from .async_llm_engine import get_async_llm_engine, TIME_LIMIT_FOR_OPENAI_CALL, MAX_NUM_LLM_ATTEMPTS  # noqa
 from .base_server import OrderedKeyToListServerCaller
 from .model_engine import ModelEngine
 from .serialize_exceptions import serialize_exception, is_exception, de_serialize_exception
-from .types import InvalidAPIKeyError, ServerErrorException, MissingAPIKeyError
+from .types import MissingAPIKeyError
 
 if TYPE_CHECKING:
     from data_to_paper.conversation.message import Message
 
-TIME_LIMIT_FOR_OPENAI_CALL = 300  # seconds
-MAX_NUM_LLM_ATTEMPTS = 5
 DEFAULT_EXPECTED_TOKENS_IN_RESPONSE = 500
 OPENAI_MAX_CONTENT_LENGTH_MESSAGE_CONTAINS = 'maximum context length'
 
@@ -117,6 +118,38 @@ class LLMServerCaller(OrderedKeyToListServerCaller):
             self._log_api_usage_cost(action.value, args[0], kwargs['model_engine'])
         return action
 
+    def get_server_responses(self, requests: List[Tuple[tuple, dict]]
+                             ) -> List[Union[LLMResponse, HumanAction, Exception]]:
+        """
+        returns the responses to a batch of independent requests, sent concurrently. allows recording and replaying.
+        """
+        actions = super().get_server_responses(requests)
+        actions = [LLMResponse(action) if isinstance(action, str) else action for action in actions]
+        for action, (args, kwargs) in zip(actions, requests):
+            if args[0] and self.should_log_api_cost and not isinstance(action, Exception):
+                self._log_api_usage_cost(action.value, args[0], kwargs['model_engine'])
+        return actions
+
+    @classmethod
+    def _submit_llm_request(cls, messages: List[Message], model_engine: ModelEngine, **kwargs) -> Future:
+        """
+        Submit a request to the async LLM engine. Returns a future of the response content.
+        """
+        print_and_log_red('Calling the LLM-API for real.', should_log=False)
+        if model_engine.api_key.key is None:
+            raise MissingAPIKeyError(server=cls.name, api_key=model_engine.api_key)
+        num_tokens = count_number_of_tokens_in_message(messages, model_engine) + \
+            (kwargs.get('max_tokens') or DEFAULT_EXPECTED_TOKENS_IN_RESPONSE)
+        return get_async_llm_engine().submit(
+            [message.to_llm_dict() for message in messages], model_engine, num_tokens, **kwargs)
+
+    @classmethod
+    def _get_llm_response_from_future(cls, future: Future, messages: List[Message], model_engine: ModelEngine,
+                                      **kwargs) -> LLMResponse:
+        content = future.result()
+        cls._check_after_spending_money(content, messages, model_engine)
+        return LLMResponse(content)
+
     @classmethod
     def _get_server_response(cls, messages: List[Message], model_engine: Union[ModelEngine, Callable], **kwargs
                              ) -> Union[LLMResponse, HumanAction, Exception]:
@@ -126,42 +159,34 @@ class LLMServerCaller(OrderedKeyToListServerCaller):
         if not isinstance(model_engine, ModelEngine):
             # human action:
             return model_engine(messages, **kwargs)
-        print_and_log_red('Calling the LLM-API for real.', should_log=False)
-
-        if model_engine.api_key.key is None:
-            raise MissingAPIKeyError(server=cls.name, api_key=model_engine.api_key)
+        future = cls._submit_llm_request(messages, model_engine, **kwargs)
+        return cls._get_llm_response_from_future(future, messages, model_engine, **kwargs)
 
-        openai.api_key = model_engine.api_key.key
-        openai.api_base = model_engine.base_url
-        for attempt in range(MAX_NUM_LLM_ATTEMPTS):
+    @classmethod
+    def _get_server_responses(cls, requests: List[Tuple[tuple, dict]]
+                              ) -> List[Union[LLMResponse, HumanAction, Exception]]:
+        """
+        Send the LLM requests concurrently, and wait for their responses in order.
+        A request that fails is returned as its exception, so the responses to the other requests are kept.
+        """
+        if any(not isinstance(kwargs.get('model_engine'), ModelEngine) for args, kwargs in requests):
+            # human actions are requested one at a time:
+            return super()._get_server_responses(requests)
+        futures = []
+        for args, kwargs in requests:
             try:
-                # TODO: Need to implement timeout. Our current timeout_context() is not working on a Worker of Qt.
-                response = openai.ChatCompletion.create(
-                    model=model_engine.value,
-                    messages=[message.to_llm_dict() for message in messages],
-                    **kwargs,
-                )
-                break
-            except openai.error.InvalidRequestError as e:
-                raise ServerErrorException(server=model_engine.server_name, response=e)
-            except (openai.error.AuthenticationError, openai.error.PermissionError) as e:
-                raise InvalidAPIKeyError(server=model_engine.server_name, response=e, api_key=model_engine.api_key)
-            except (openai.error.OpenAIError, TimeoutError) as e:
-                sleep_time = 1.0 * 2 ** attempt
-                print_and_log_red(f'Unexpected OPENAI error:\n{type(e)}\n{e}\n'
-                                  f'Going to sleep for {sleep_time} seconds before trying again.',
-                                  should_log=False)
-                time.sleep(sleep_time)
-                print_and_log_red(f'Retrying to call openai (attempt {attempt + 1}/{MAX_NUM_LLM_ATTEMPTS}) ...',
-                                  should_log=False)
-        else:
-            raise ServerErrorException(
-                server=model_engine.server_name,
-                response=ConnectionError(f'Failed to get server response after {MAX_NUM_LLM_ATTEMPTS} attempts.'))
-
-        content = response['choices'][0]['message']['content']
-        cls._check_after_spending_money(content, messages, model_engine)
-        return LLMResponse(content)
+                futures.append(cls._submit_llm_request(*args, **kwargs))
+            except Exception as e:
+                futures.append(e)
+        responses = []
+        for future, (args, kwargs) in zip(futures, requests):
+            try:
+                if isinstance(future, Exception):
+                    raise future
+                responses.append(cls._get_llm_response_from_future(future, *args, **kwargs))
+            except Exception as e:
+                responses.append(e)
+        return responses
 
     def reset_to_stage(self, stage: Stage):
         """
@@ -169,6 +194,7 @@ class LLMServerCaller(OrderedKeyToListServerCaller):
         """
         delete_all_stages_following_stage(self.old_records, stage)
         delete_all_stages_following_stage(self.new_records, stage)
+        self.invalidate_old_records_as_list()
         self.save_records()
 
     @staticmethod
@@ -193,19 +219,80 @@ class LLMServerCaller(OrderedKeyToListServerCaller):
 OPENAI_SERVER_CALLER = LLMServerCaller()
 
 
-def count_number_of_tokens_in_message(messages: Union[List[Message], str], model_engine: ModelEngine) -> int:
+@functools.lru_cache(maxsize=None)
+def _get_encoding_for_model(model: str) -> tiktoken.Encoding:
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.encoding_for_model(ModelEngine.GPT35_TURBO.value)
+
+
+def get_encoding_for_model_engine(model_engine: Optional[ModelEngine]) -> tiktoken.Encoding:
     """
-    Count number of tokens in message using tiktoken.
+    Return the tiktoken encoding of the model engine. Encodings are created once per process.
     """
     if model_engine is None:
         model_engine = ModelEngine.DEFAULT
-    try:
-        encoding = tiktoken.encoding_for_model(model_engine.value)
-    except KeyError:
-        encoding = tiktoken.encoding_for_model(ModelEngine.GPT35_TURBO.value)
-    if not isinstance(messages, str):
-        messages = '\n'.join([message.content for message in messages])
-    return len(encoding.encode(messages))
+    return _get_encoding_for_model(model_engine.value)
+
+
+def count_number_of_tokens_in_text(text: str, model_engine: Optional[ModelEngine]) -> int:
+    return len(get_encoding_for_model_engine(model_engine).encode(text))
+
+
+def _is_tokenized_apart_from_preceding_newline(content: str) -> bool:
+    """
+    Whether the tokens of `content` are the same when it follows a newline, as when it stands alone.
+    The tokenizers join a newline with following whitespace, or newlines (and, in some encodings, with '/').
+    """
+    return content[:1] not in ('', '/') and not content[:1].isspace()
+
+
+def count_number_of_tokens_in_message(messages: Union[List[Message], str], model_engine: ModelEngine) -> int:
+    """
+    Count number of tokens in message using tiktoken.
+    A list of messages is counted as the messages joined by newlines. When the tokens of each message do not
+    merge with the preceding newline, this is the sum of the (memoised) token counts of the messages, each but the
+    last followed by its newline. So only new, or changed, messages are encoded.
+    """
+    if isinstance(messages, str):
+        return count_number_of_tokens_in_text(messages, model_engine)
+    if not messages:
+        return 0
+    if not all(_is_tokenized_apart_from_preceding_newline(message.content) for message in messages[1:]):
+        return count_number_of_tokens_in_text('\n'.join(message.content for message in messages), model_engine)
+    return sum(message.get_number_of_tokens(model_engine, with_trailing_newline=True) for message in messages[:-1]) \
+        + messages[-1].get_number_of_tokens(model_engine)
+
+
+def _check_number_of_tokens(messages: List[Message], model_engine: ModelEngine, expected_tokens_in_response: int
+                            ) -> Optional[TooManyTokensInMessageError]:
+    tokens = count_number_of_tokens_in_message(messages, model_engine)
+    if tokens + expected_tokens_in_response > model_engine.max_tokens:
+        return TooManyTokensInMessageError(tokens, expected_tokens_in_response, model_engine)
+    if SHOW_LLM_CONTEXT:
+        print_and_log_red(f'Using {model_engine} (max {model_engine.max_tokens} tokens) '
+                          f'for {tokens} context tokens and {expected_tokens_in_response} expected tokens.')
+    else:
+        print_and_log_red(f'Using {model_engine}.')
+    return None
+
+
+def _get_content_of_llm_action(action: Union[LLMResponse, HumanAction]) -> str:
+    if isinstance(action, HumanAction):
+        err = 'Human action retrieved, instead of LLM response.'
+        if CHOSEN_APP == None:  # noqa (Mutable)
+            err += '\nRuns recorded without human actions should be replayed with the same settings\n' \
+                   '(set CHOSEN_APP to value other than None)'
+        raise ValueError(err)
+    assert isinstance(action, LLMResponse)
+    return action.value
+
+
+def _is_exception_addressable_by_reducing_tokens(e: Exception) -> bool:
+    # TODO: add here any other exception that can be addressed by changing the number of tokens
+    #     or bump up the model engine
+    return isinstance(e, openai.error.InvalidRequestError) and OPENAI_MAX_CONTENT_LENGTH_MESSAGE_CONTAINS in str(e)
 
 
 def try_get_llm_response(messages: List[Message],
@@ -225,28 +312,14 @@ def try_get_llm_response(messages: List[Message],
         model_engine = ModelEngine.DEFAULT
     if expected_tokens_in_response is None:
         expected_tokens_in_response = DEFAULT_EXPECTED_TOKENS_IN_RESPONSE
-    tokens = count_number_of_tokens_in_message(messages, model_engine)
-    if tokens + expected_tokens_in_response > model_engine.max_tokens:
-        return TooManyTokensInMessageError(tokens, expected_tokens_in_response, model_engine)
-    if SHOW_LLM_CONTEXT:
-        print_and_log_red(f'Using {model_engine} (max {model_engine.max_tokens} tokens) '
-                          f'for {tokens} context tokens and {expected_tokens_in_response} expected tokens.')
-    else:
-        print_and_log_red(f'Using {model_engine}.')
+    too_many_tokens_error = _check_number_of_tokens(messages, model_engine, expected_tokens_in_response)
+    if too_many_tokens_error is not None:
+        return too_many_tokens_error
     try:
         action = OPENAI_SERVER_CALLER.get_server_response(messages, model_engine=model_engine, **kwargs)
-        if isinstance(action, HumanAction):
-            err = 'Human action retrieved, instead of LLM response.'
-            if CHOSEN_APP == None:  # noqa (Mutable)
-                err += '\nRuns recorded without human actions should be replayed with the same settings\n' \
-                       '(set CHOSEN_APP to value other than None)'
-            raise ValueError(err)
-        assert isinstance(action, LLMResponse)
-        return action.value
+        return _get_content_of_llm_action(action)
     except openai.error.InvalidRequestError as e:
-        # TODO: add here any other exception that can be addressed by changing the number of tokens
-        #     or bump up the model engine
-        if OPENAI_MAX_CONTENT_LENGTH_MESSAGE_CONTAINS in str(e):
+        if _is_exception_addressable_by_reducing_tokens(e):
             return e
         else:
             raise
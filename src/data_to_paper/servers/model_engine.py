@@ -57,6 +57,14 @@ class ModelEngine(IndexOrderedEnum):
         """
         return MODEL_ENGINE_TO_MAX_TOKENS_AND_IN_OUT_DOLLAR[self][1:]
 
+    @property
+    def rate_limits(self) -> Tuple[int, int]:
+        """
+        Return the rate limits for the model engine.
+        (requests_per_minute, tokens_per_minute)
+        """
+        return MODEL_ENGINE_TO_RATE_LIMITS[self]
+
     @property
     def allows_json_mode(self):
         return self in MODEL_ENGINES_ALLOWING_JSON_MODE
@@ -102,6 +110,19 @@ MODEL_ENGINE_TO_MAX_TOKENS_AND_IN_OUT_DOLLAR: Dict[ModelEngine, Tuple[int, float
     ModelEngine.CODELLAMA: (4096, 0.0006, 0.0006),
 }
 
+# (requests_per_minute, tokens_per_minute). Conservative defaults; adjust to the limits of your API account.
+# Used only if LIMIT_LLM_REQUEST_RATES is set.
+MODEL_ENGINE_TO_RATE_LIMITS: Dict[ModelEngine, Tuple[int, int]] = {
+    ModelEngine.GPT35_TURBO: (3500, 200000),
+    ModelEngine.GPT4: (500, 10000),
+    ModelEngine.GPT4_TURBO: (500, 30000),
+    ModelEngine.GPT4o_MINI: (500, 200000),
+    ModelEngine.GPT4o: (500, 30000),
+    ModelEngine.LLAMA_2_7b: (200, 1000000),
+    ModelEngine.LLAMA_2_70b: (200, 1000000),
+    ModelEngine.CODELLAMA: (200, 1000000),
+}
+
 MODEL_ENGINES_ALLOWING_JSON_MODE = {ModelEngine.GPT4o_MINI, ModelEngine.GPT4o}
 
 OPENAI_API_BASE = "https://api.openai.com/v1"
@@ -1,7 +1,4 @@
-import time
-
 import numpy as np
-import requests
 import re
 
 from dataclasses import dataclass
@@ -15,7 +12,8 @@ from data_to_paper.utils.print_to_file import print_and_log_red
 from data_to_paper.utils.nice_list import NiceList
 
 from .base_server import ParameterizedQueryServerCaller
-from .custom_types import Citation
+from .custom_types import Citation, cached_citation_property
+from .http_session import get_http_session, request_with_retries
 from .types import (
     ServerErrorException,
     InvalidAPIKeyError,
@@ -35,6 +33,8 @@ def remove_word(string, word):
 
 PAPER_SEARCH_URL = "https://api.semanticscholar.org/graph/v1/paper/search"
 EMBEDDING_URL = "https://model-apis.semanticscholar.org/specter/v1/invoke"
+MAX_PAPERS_PER_EMBEDDING_REQUEST = 16
+MAX_EMBEDDING_REQUEST_SIZE = 100_000  # characters of title and abstract
 
 
 get_bibtex_id_from_bibtex = lambda bibtex: bibtex.split("{", 1)[1].split(",\n", 1)[0]
@@ -42,11 +42,7 @@ get_bibtex_id_from_bibtex = lambda bibtex: bibtex.split("{", 1)[1].split(",\n",
 
 class SemanticCitation(Citation):
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self._bibtex_id = None
-
-    @property
+    @cached_citation_property
     def bibtex(self) -> str:
         bibtex = self["citationStyles"]["bibtex"]
 
@@ -82,12 +78,9 @@ class SemanticCitation(Citation):
 
         return bibtex
 
-    @property
+    @cached_citation_property
     def bibtex_id(self) -> str:
-        if self._bibtex_id is None:
-            bibtex_id = get_bibtex_id_from_bibtex(self.bibtex)
-            self._bibtex_id = bibtex_id
-        return self._bibtex_id
+        return get_bibtex_id_from_bibtex(self.bibtex)
 
     @property
     def title(self) -> Optional[str]:
@@ -143,6 +136,8 @@ class SemanticScholarPaperServerCaller(ParameterizedQueryServerCaller):
 
     name = "Semantic Scholar"
     file_extension = "_semanticscholar_paper.bin"
+    max_concurrent_requests = 4
+    shared_cache_namespace = "semantic_scholar_paper"
 
     @classmethod
     def _get_server_response(cls, query, rows=25) -> List[dict]:
@@ -193,23 +188,9 @@ class SemanticScholarPaperServerCaller(ParameterizedQueryServerCaller):
                 if SEMANTIC_SCHOLAR_API_KEY.key
                 else {}
             )
-            for attempt in range(3):
-                response = requests.get(
-                    PAPER_SEARCH_URL, headers=headers, params=params
-                )
-                if response.status_code not in (504, 429):
-                    break
-                wait_time = 2**attempt  # Exponential backoff
-                print_and_log_red(
-                    f"ERROR: Server timed out or too many requests. "
-                    f"We wait for {wait_time} sec and try again.",
-                    should_log=False,
-                )
-                time.sleep(wait_time)
-            else:
-                raise ServerErrorException(
-                    server=cls.name, response=response
-                )  # if we failed all attempts
+            response = request_with_retries(
+                "GET", PAPER_SEARCH_URL, server_name=cls.name, headers=headers, params=params
+            )
 
             if response.status_code != 200:  # 200 is the success code
                 if response.reason == "Forbidden":
@@ -298,6 +279,25 @@ class SemanticScholarPaperServerCaller(ParameterizedQueryServerCaller):
         return citations
 
 
+def split_papers_into_batches(papers: List[Dict[str, str]],
+                              max_papers: int = MAX_PAPERS_PER_EMBEDDING_REQUEST,
+                              max_size: int = MAX_EMBEDDING_REQUEST_SIZE) -> List[List[Dict[str, str]]]:
+    """
+    Split the papers into batches, each with at most `max_papers` papers and at most `max_size` characters of
+    title and abstract (a paper larger than `max_size` is sent in a batch of its own).
+    """
+    batches = []
+    batch_size = 0
+    for paper in papers:
+        paper_size = len(paper.get("title") or "") + len(paper.get("abstract") or "")
+        if not batches or len(batches[-1]) >= max_papers or batch_size + paper_size > max_size:
+            batches.append([])
+            batch_size = 0
+        batches[-1].append(paper)
+        batch_size += paper_size
+    return batches
+
+
 class SemanticScholarEmbeddingServerCaller(ParameterizedQueryServerCaller):
     """
     Embed "paper" (title + abstract) using SPECTER Semantic Scholar API.
@@ -305,30 +305,72 @@ class SemanticScholarEmbeddingServerCaller(ParameterizedQueryServerCaller):
 
     name = "Semantic Scholar Embedding"
     file_extension = "_semanticscholar_embedding.bin"
+    shared_cache_namespace = "semantic_scholar_embedding"
 
     @classmethod
-    def _get_server_response(cls, paper: Dict[str, str]) -> np.ndarray:
+    def _get_embeddings_from_server(cls, papers: List[Dict[str, str]]) -> List[np.ndarray]:
         """
-        Send the paper to the SPECTER Semantic Scholar API and get the embedding.
+        Send the papers to the SPECTER Semantic Scholar API, in batches, and get their embeddings.
         """
-        # check that the paper has id, title and abstract attributes, if not raise an error
-        if not all(key in paper for key in ["paper_id", "title", "abstract"]):
-            raise ValueError(
-                "Paper must have 'paper_id', 'title' and 'abstract' attributes."
-            )
+        # check that the papers have id, title and abstract attributes, if not raise an error
+        for paper in papers:
+            if not all(key in paper for key in ["paper_id", "title", "abstract"]):
+                raise ValueError(
+                    "Paper must have 'paper_id', 'title' and 'abstract' attributes."
+                )
 
-        print_and_log_red(
-            f'GETTING SEMANTIC SCHOLAR EMBEDDING FOR: "{paper["title"]}"',
-            should_log=False,
-        )
-        response = requests.post(EMBEDDING_URL, json=[paper])
+        embeddings = []
+        for batch in split_papers_into_batches(papers):
+            if len(batch) == 1:
+                print_and_log_red(
+                    f'GETTING SEMANTIC SCHOLAR EMBEDDING FOR: "{batch[0]["title"]}"',
+                    should_log=False,
+                )
+            else:
+                print_and_log_red(
+                    f"GETTING SEMANTIC SCHOLAR EMBEDDINGS FOR {len(batch)} PAPERS",
+                    should_log=False,
+                )
+            response = get_http_session().post(EMBEDDING_URL, json=batch)
 
-        if response.status_code != 200:
-            raise ServerErrorException(server=cls.name, response=response)
+            if response.status_code != 200:
+                raise ServerErrorException(server=cls.name, response=response)
 
-        paper_embedding = response.json()["preds"][0]["embedding"]
+            preds = response.json()["preds"]
+            if len(preds) != len(batch):
+                raise ServerErrorException(
+                    server=cls.name,
+                    response=ValueError(f"Got {len(preds)} embeddings for {len(batch)} papers."),
+                )
+            embeddings.extend(np.array(pred["embedding"]) for pred in preds)
+        return embeddings
 
-        return np.array(paper_embedding)
+    @classmethod
+    def _get_server_response(cls, paper: Dict[str, str]) -> np.ndarray:
+        """
+        Send the paper to the SPECTER Semantic Scholar API and get the embedding.
+        """
+        return cls._get_embeddings_from_server([paper])[0]
+
+    @classmethod
+    def _get_server_responses_for_distinct_requests(cls, requests: List[Tuple[tuple, dict]]) -> List[np.ndarray]:
+        """
+        Send all the papers together, in batches, rather than one paper per request.
+        """
+        papers = [args[0] if args else kwargs["paper"] for args, kwargs in requests]
+        return cls._get_embeddings_from_server(papers)
+
+    def get_embeddings(self, papers: List[Dict[str, str]]) -> List[np.ndarray]:
+        """
+        Get the embeddings of multiple papers.
+        Papers that are not in the records are sent to the server in batches. The embedding of each paper is
+        recorded, and replayed, individually (as with `get_server_response(paper)`).
+        """
+        embeddings = self.get_server_responses([((paper,), {}) for paper in papers])
+        for embedding in embeddings:
+            if isinstance(embedding, Exception):
+                raise embedding
+        return embeddings
 
 
 SEMANTIC_SCHOLAR_SERVER_CALLER = SemanticScholarPaperServerCaller()
@@ -0,0 +1,211 @@
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from contextlib import closing
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+from data_to_paper.env import SHARED_RESPONSE_CACHE_FILEPATH, SHARED_RESPONSE_CACHE_TTL, \
+    SHARED_RESPONSE_CACHE_MAX_SIZE
+
+
+@dataclass
+class CacheStatistics:
+    hits: int = 0
+    misses: int = 0
+    expired: int = 0  # misses due to entries older than the ttl
+    puts: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> Optional[float]:
+        num_gets = self.hits + self.misses
+        return self.hits / num_gets if num_gets else None
+
+
+def normalize_key(key: Any) -> Any:
+    """
+    Normalize a key (a tuple of args and kwargs; see `convert_args_kwargs_to_tuple`), so that requests that differ
+    only by whitespace share the same cache entry.
+    """
+    if isinstance(key, tuple):
+        return tuple(normalize_key(item) for item in key)
+    if isinstance(key, str):
+        return ' '.join(key.split())
+    return key
+
+
+def get_key_hash(key: Any) -> str:
+    return hashlib.sha256(repr(normalize_key(key)).encode()).hexdigest()
+
+
+@dataclass
+class SharedResponseCache:
+    """
+    A cache of server responses, shared by all runs and projects on the machine, stored in an SQLite file.
+
+    Entries are stored per namespace (e.g. the name of the server) and key (the request).
+    Entries older than `ttl` (seconds) are not used. If `max_size` (bytes) is set, least-recently-used entries are
+    evicted to keep the cache within the limit.
+    The cache can be used concurrently from multiple threads and processes (each operation uses its own
+    connection; the database is in WAL mode).
+    The total size of the entries is kept, by triggers, in the `total_size` table, so that a put needs to evict
+    (and to lock the database) only if the cache is over `max_size` or has entries older than `ttl`.
+    """
+    filepath: Union[str, Path]
+    ttl: Optional[float] = None
+    max_size: Optional[int] = None
+    statistics: CacheStatistics = field(default_factory=CacheStatistics)
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
+    TIMEOUT = 30  # seconds to wait for a lock held by another process
+
+    def __post_init__(self):
+        self.filepath = Path(self.filepath)
+        self.filepath.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('BEGIN IMMEDIATE')  # create the tables and the initial total size atomically
+            try:
+                connection.execute(
+                    'CREATE TABLE IF NOT EXISTS responses ('
+                    'namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, size INTEGER NOT NULL, '
+                    'created REAL NOT NULL, last_access REAL NOT NULL, PRIMARY KEY (namespace, key))')
+                connection.execute('CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)')
+                connection.execute('CREATE INDEX IF NOT EXISTS responses_created ON responses (created)')
+                connection.execute(
+                    'CREATE TABLE IF NOT EXISTS total_size ('
+                    'id INTEGER PRIMARY KEY CHECK (id = 0), size INTEGER NOT NULL)')
+                connection.execute(
+                    'INSERT OR IGNORE INTO total_size (id, size) SELECT 0, COALESCE(SUM(size), 0) FROM responses')
+                connection.execute(
+                    'CREATE TRIGGER IF NOT EXISTS responses_insert AFTER INSERT ON responses BEGIN '
+                    'UPDATE total_size SET size = size + new.size WHERE id = 0; END')
+                connection.execute(
+                    'CREATE TRIGGER IF NOT EXISTS responses_update AFTER UPDATE OF size ON responses BEGIN '
+                    'UPDATE total_size SET size = size + new.size - old.size WHERE id = 0; END')
+                connection.execute(
+                    'CREATE TRIGGER IF NOT EXISTS responses_delete AFTER DELETE ON responses BEGIN '
+                    'UPDATE total_size SET size = size - old.size WHERE id = 0; END')
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.filepath, timeout=self.TIMEOUT, isolation_level=None)  # autocommit
+
+    def _count(self, statistic: str, n: int = 1):
+        with self._lock:
+            setattr(self.statistics, statistic, getattr(self.statistics, statistic) + n)
+
+    def _is_expired(self, created: float, now: float) -> bool:
+        return self.ttl is not None and now - created > self.ttl
+
+    def get(self, namespace: str, key: Any) -> Optional[Any]:
+        """
+        Return the cached response, or None if not in the cache (or expired).
+        """
+        key_hash = get_key_hash(key)
+        now = time.time()
+        with closing(self._connect()) as connection:
+            row = connection.execute(
+                'SELECT value, created FROM responses WHERE namespace = ? AND key = ?', (namespace, key_hash)
+            ).fetchone()
+            if row is not None and self._is_expired(row[1], now):
+                self._count('expired')
+                row = None
+            if row is None:
+                self._count('misses')
+                return None
+            connection.execute(
+                'UPDATE responses SET last_access = ? WHERE namespace = ? AND key = ?', (now, namespace, key_hash))
+        try:
+            value = pickle.loads(row[0])
+        except Exception:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return value
+
+    def put(self, namespace: str, key: Any, value: Any):
+        data = pickle.dumps(value)
+        now = time.time()
+        with closing(self._connect()) as connection:
+            # an upsert, rather than INSERT OR REPLACE, so that the replaced entry fires the update trigger:
+            connection.execute(
+                'INSERT INTO responses (namespace, key, value, size, created, last_access) '
+                'VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (namespace, key) DO UPDATE SET '
+                'value = excluded.value, size = excluded.size, created = excluded.created, '
+                'last_access = excluded.last_access', (namespace, get_key_hash(key), data, len(data), now, now))
+            self._count('puts')
+            if self._is_eviction_needed(connection, now):
+                self._evict(connection, now)
+
+    @staticmethod
+    def _get_total_size(connection: sqlite3.Connection) -> int:
+        return connection.execute('SELECT size FROM total_size WHERE id = 0').fetchone()[0]
+
+    def _is_eviction_needed(self, connection: sqlite3.Connection, now: float) -> bool:
+        if self.max_size is not None and self._get_total_size(connection) > self.max_size:
+            return True
+        if self.ttl is not None:
+            oldest_created = connection.execute('SELECT MIN(created) FROM responses').fetchone()[0]
+            return oldest_created is not None and oldest_created < now - self.ttl
+        return False
+
+    def _evict(self, connection: sqlite3.Connection, now: float):
+        connection.execute('BEGIN IMMEDIATE')  # evict atomically with respect to other processes
+        try:
+            num_evicted = 0
+            if self.ttl is not None:
+                num_evicted += connection.execute(
+                    'DELETE FROM responses WHERE created < ?', (now - self.ttl,)).rowcount
+            if self.max_size is not None:
+                total_size = self._get_total_size(connection)
+                if total_size > self.max_size:
+                    to_delete = []
+                    for namespace, key_hash, size in connection.execute(
+                            'SELECT namespace, key, size FROM responses ORDER BY last_access'):
+                        if total_size <= self.max_size:
+                            break
+                        to_delete.append((namespace, key_hash))
+                        total_size -= size
+                    connection.executemany('DELETE FROM responses WHERE namespace = ? AND key = ?', to_delete)
+                    num_evicted += len(to_delete)
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        self._count('evictions', num_evicted)
+
+    def get_total_size(self) -> int:
+        with closing(self._connect()) as connection:
+            return self._get_total_size(connection)
+
+    def __len__(self):
+        with closing(self._connect()) as connection:
+            return connection.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+
+_FILEPATHS_TO_CACHES: Dict[str, SharedResponseCache] = {}
+
+
+def get_shared_response_cache() -> Optional[SharedResponseCache]:
+    """
+    Return the shared cache specified in env, or None if the shared cache is not used.
+    """
+    if SHARED_RESPONSE_CACHE_FILEPATH.val is None:
+        return None
+    filepath = os.path.abspath(SHARED_RESPONSE_CACHE_FILEPATH.val)
+    cache = _FILEPATHS_TO_CACHES.get(filepath)
+    if cache is None:
+        cache = _FILEPATHS_TO_CACHES[filepath] = SharedResponseCache(filepath)
+    cache.ttl = SHARED_RESPONSE_CACHE_TTL.val
+    cache.max_size = SHARED_RESPONSE_CACHE_MAX_SIZE.val
+    return cache
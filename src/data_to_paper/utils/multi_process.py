@@ -2,8 +2,83 @@ import multiprocessing
 import os
 import pickle
 import tempfile
+import time
 import uuid
 
+from dataclasses import dataclass
+from multiprocessing.connection import Connection
+from typing import Any
+
+from data_to_paper.utils.mutable import Mutable
+
+# Results are sent back from the subprocess through a pipe.
+# Results whose pickle is larger than this (bytes) are transferred through a temporary file instead.
+# (process.queue fails on Mac OS X with large objects.)
+MAX_PIPE_TRANSFER_SIZE = Mutable(256 * 1024 ** 2)
+
+
+@dataclass
+class TransferMetrics:
+    """
+    Size metrics of the results transferred back from subprocesses.
+    """
+    num_transfers: int = 0
+    num_file_transfers: int = 0
+    total_bytes: int = 0
+    max_bytes: int = 0
+    total_receive_time: float = 0.
+
+    def add(self, num_bytes: int, via_file: bool, receive_time: float):
+        self.num_transfers += 1
+        self.num_file_transfers += via_file
+        self.total_bytes += num_bytes
+        self.max_bytes = max(self.max_bytes, num_bytes)
+        self.total_receive_time += receive_time
+
+
+RESULT_TRANSFER_METRICS = TransferMetrics()
+
+
+def _get_temp_filepath() -> str:
+    return os.path.join(tempfile.gettempdir(), f"subprocess_output_{uuid.uuid4()}_{os.getpid()}.pkl")
+
+
+def send_result(connection: Connection, result: Any):
+    """
+    Send the result over the pipe; used in the subprocess.
+    If the result cannot be pickled, the pickling exception is sent instead.
+    """
+    try:
+        data = pickle.dumps(result)
+    except Exception as e:
+        data = pickle.dumps(e)
+    if len(data) > MAX_PIPE_TRANSFER_SIZE.val:
+        filepath = _get_temp_filepath()
+        with open(filepath, 'wb') as f:
+            f.write(data)
+        connection.send(('file', len(data), filepath))
+    else:
+        connection.send(('pipe', len(data), None))
+        connection.send_bytes(data)
+
+
+def receive_result(connection: Connection) -> Any:
+    """
+    Receive a result sent with `send_result`; used in the parent process.
+    Raises EOFError if the subprocess terminated without sending a result.
+    """
+    start_time = time.time()
+    transport, num_bytes, filepath = connection.recv()
+    if transport == 'file':
+        with open(filepath, 'rb') as f:
+            data = f.read()
+        os.remove(filepath)
+    else:
+        data = connection.recv_bytes()
+    result = pickle.loads(data)
+    RESULT_TRANSFER_METRICS.add(num_bytes, via_file=transport == 'file', receive_time=time.time() - start_time)
+    return result
+
 
 def process_func(queue, func, *args, **kwargs):
     exception = None
@@ -13,9 +88,10 @@ def process_func(queue, func, *args, **kwargs):
         exception = e
         result = None
     result_exception = (result, exception)
-    if isinstance(queue, str):
-        with open(queue, 'wb') as f:
-            pickle.dump(result_exception, f)
+    if queue is None:
+        return result_exception
+    if isinstance(queue, Connection):
+        send_result(queue, result_exception)
     else:
         queue.put(result_exception)
 
@@ -23,20 +99,27 @@ def process_func(queue, func, *args, **kwargs):
 def run_func_in_separate_process(func, *args, in_separate_process=True,
                                  use_file_instead_of_queue=True,
                                  **kwargs):
+    """
+    Run `func` in a separate process and return (result, exception).
+    use_file_instead_of_queue:
+        True: the result is sent back through a pipe (with a file fallback for large results).
+        False: the result is sent back through a multiprocessing.Queue.
+    """
     if not in_separate_process:
         return process_func(None, func, *args, **kwargs)
     if use_file_instead_of_queue:
-        queue_or_filepath = f"subprocess_output_{uuid.uuid4()}_{os.getpid()}.pkl"
-        queue_or_filepath = os.path.join(tempfile.gettempdir(), queue_or_filepath)
+        receiver, queue_or_connection = multiprocessing.Pipe(duplex=False)
     else:
-        queue_or_filepath = multiprocessing.Queue()
-    process = multiprocessing.Process(target=process_func, args=(queue_or_filepath, func, *args), kwargs=kwargs)
+        receiver, queue_or_connection = None, multiprocessing.Queue()
+    process = multiprocessing.Process(target=process_func, args=(queue_or_connection, func, *args), kwargs=kwargs)
     process.start()
-    process.join()
     if use_file_instead_of_queue:
-        with open(queue_or_filepath, 'rb') as f:
-            result_exception = pickle.load(f)
-        os.remove(queue_or_filepath)
+        queue_or_connection.close()
+        try:
+            result_exception = receive_result(receiver)
+        finally:
+            receiver.close()
     else:
-        result_exception = queue_or_filepath.get()
+        result_exception = queue_or_connection.get()
+    process.join()
     return result_exception
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from data_to_paper.base_steps.literature_search import LiteratureSearch, get_indices_of_top_values
+from data_to_paper.servers.custom_types import Citation
+
+
+class EmbeddedCitation(Citation):
+    @property
+    def bibtex_id(self) -> str:
+        return self['id']
+
+    @property
+    def embedding(self):
+        return self.get('embedding')
+
+
+def _create_citations(query, num_citations, seed):
+    random = np.random.default_rng(seed)
+    return [EmbeddedCitation(id=f'{query}{i}', embedding=random.normal(size=8) if i % 5 else None,
+                             search_rank=i, query=query)
+            for i in range(num_citations)]
+
+
+@pytest.fixture
+def literature_search():
+    literature_search = LiteratureSearch(api_source='Semantic Scholar',
+                                         embedding_target=np.random.default_rng(0).normal(size=8))
+    literature_search['dataset'] = {'q1': _create_citations('q1', 30, 1), 'q2': _create_citations('q2', 20, 2)}
+    literature_search['questions'] = {'q3': _create_citations('q3', 25, 3)}
+    return literature_search
+
+
+@pytest.mark.parametrize('k', [None, 0, 1, 3, 5, 10])
+def test_get_indices_of_top_values_is_stable(k):
+    values = np.array([0.5, 0.2, 0.5, 0.9, 0.2, 0.5, 0.])
+    expected = sorted(range(len(values)), key=lambda i: values[i], reverse=True)[:k]
+    assert get_indices_of_top_values(values, k).tolist() == expected
+
+
+@pytest.mark.parametrize('scope, query, total', [
+    ('dataset', 'q1', None),
+    ('dataset', 'q1', 7),
+    ('dataset', None, 12),
+    (None, None, 20),
+    (None, None, -5),
+])
+def test_sort_by_similarity_matches_per_citation_similarity(literature_search, scope, query, total):
+    citations = literature_search.get_citations(scope=scope, query=query, total=total, sort_by_similarity=True)
+    all_citations = literature_search.get_citations(scope=scope, query=query, sort_by_similarity=False)
+    expected = sorted(all_citations, reverse=True,
+                      key=lambda c: c.get_embedding_similarity(literature_search.embedding_target))
+    expected = expected[total:] if total is not None and total < 0 else expected[:total]
+    assert [c.bibtex_id for c in citations] == [c.bibtex_id for c in expected]
+
+
+def test_embedding_index_is_rebuilt_only_when_citations_are_added(literature_search):
+    literature_search.get_citations(sort_by_similarity=True, total=10)
+    index = literature_search._embedding_index
+    literature_search.pretty_repr(total=10, sort_by_similarity=True, style='print')
+    assert literature_search._embedding_index is index
+    literature_search['background'] = {'q4': _create_citations('q4', 5, 4)}
+    assert literature_search._embedding_index is None
+    citations = literature_search.get_citations(scope='background', sort_by_similarity=True)
+    assert len(citations) == 5
+    assert 'q41' in literature_search._embedding_index.bibtex_ids_to_rows
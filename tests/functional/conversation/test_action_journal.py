@@ -0,0 +1,104 @@
+import pickle
+
+from data_to_paper import Role
+from data_to_paper.conversation.action_journal import ActionJournal, ActionJournalReader, is_action_journal
+from data_to_paper.conversation.actions_and_conversations import Actions, Conversations
+from data_to_paper.conversation.conversation_actions import AppendMessage, AppendLLMResponse, Message
+
+
+def _create_actions(conversations, num_responses):
+    actions = []
+    context = [Message(role=Role.SYSTEM, content='you are a calculator')]
+    for i in range(num_responses):
+        question = Message(role=Role.USER, content=f'what is {i} + 1 ?')
+        context = context + [question]
+        answer = Message(role=Role.ASSISTANT, content=f'the answer is {i + 1}', context=context)
+        context = context + [answer]
+        actions.append(AppendMessage(conversations=conversations, conversation_name='default', message=question))
+        actions.append(AppendLLMResponse(conversations=conversations, conversation_name='default', message=answer))
+    return actions
+
+
+def test_action_journal_round_trip(tmpdir, conversations):
+    actions = _create_actions(conversations, 3)
+    journal = ActionJournal(tmpdir.join('actions.pkl'))
+    for action in actions:
+        journal.append(action)
+    journal.close()
+
+    new_conversations = Conversations()
+    read_actions = list(ActionJournalReader(tmpdir.join('actions.pkl'), conversations=new_conversations))
+    assert read_actions == actions
+    assert all(action.conversations is new_conversations for action in read_actions)
+
+
+def test_action_journal_stores_each_message_once(tmpdir, conversations):
+    num_responses = 10
+    journal = ActionJournal(tmpdir.join('actions.pkl'))
+    for action in _create_actions(conversations, num_responses):
+        journal.append(action)
+    journal.close()
+
+    reader = ActionJournalReader(tmpdir.join('actions.pkl'))
+    read_actions = list(reader)
+    assert len(reader.messages) == 1 + 2 * num_responses
+    first_question = read_actions[0].message
+    assert all(action.message.context[1] is first_question for action in read_actions[1::2])
+
+
+def test_action_journal_can_be_tailed(tmpdir, conversations):
+    actions = _create_actions(conversations, 2)
+    journal = ActionJournal(tmpdir.join('actions.pkl'))
+    reader = ActionJournalReader(tmpdir.join('actions.pkl'))
+    journal.append(actions[0])
+    assert list(reader) == actions[:1]
+    for action in actions[1:]:
+        journal.append(action)
+    assert list(reader) == actions[1:]
+    assert list(reader) == []
+    journal.close()
+
+
+def test_action_journal_reader_skips_incomplete_record(tmpdir, conversations):
+    actions = _create_actions(conversations, 1)
+    journal = ActionJournal(tmpdir.join('actions.pkl'))
+    journal.append(actions[0])
+    journal.close()
+    with open(tmpdir.join('actions.pkl'), 'ab') as f:
+        f.write(pickle.dumps(('action', 'a record that is still being written'))[:-5])
+    assert list(ActionJournalReader(tmpdir.join('actions.pkl'))) == actions[:1]
+
+
+def test_actions_are_journaled_when_applied(tmpdir, actions, conversations):
+    actions.apply_action(AppendMessage(conversations=conversations, conversation_name=None,
+                                       message=Message(role=Role.USER, content='before'), should_print=False))
+    with actions.journal_to_file(tmpdir.join('actions.pkl')):
+        actions.apply_action(AppendMessage(conversations=conversations, conversation_name=None,
+                                           message=Message(role=Role.USER, content='during'), should_print=False))
+    actions.apply_action(AppendMessage(conversations=conversations, conversation_name=None,
+                                       message=Message(role=Role.USER, content='after'), should_print=False))
+
+    assert is_action_journal(tmpdir.join('actions.pkl'))
+    assert [action.message.content for action in ActionJournalReader(tmpdir.join('actions.pkl'))] == \
+        ['before', 'during']
+
+
+def test_load_actions_from_journal_attaches_them_to_given_empty_conversations(tmpdir, conversations):
+    journal = ActionJournal(tmpdir.join('actions.pkl'))
+    for action in _create_actions(conversations, 2):
+        journal.append(action)
+    journal.close()
+    new_conversations = Conversations()
+    loaded_actions = Actions().load_actions_from_file(tmpdir.join('actions.pkl'), conversations=new_conversations)
+    assert len(loaded_actions) == 4
+    assert all(action.conversations is new_conversations for action in loaded_actions)
+
+
+def test_load_actions_from_legacy_pickle(tmpdir, conversations):
+    actions = Actions()
+    actions.extend(_create_actions(conversations, 2))
+    with open(tmpdir.join('actions.pkl'), 'wb') as f:
+        pickle.dump(actions, f)
+
+    assert not is_action_journal(tmpdir.join('actions.pkl'))
+    assert Actions().load_actions_from_file(tmpdir.join('actions.pkl')) == actions
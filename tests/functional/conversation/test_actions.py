@@ -95,3 +95,29 @@ def test_replace_last_response(conversations, conversation, assistant_message):
     print('\n' + action.pretty_repr())
     action.apply()
     assert conversation == expected
+
+
+def test_repeated_printed_content_is_detected(actions, conversations, conversation, user_message):
+    action = AppendMessage(conversations=conversations, conversation_name=conversation.conversation_name,
+                           message=user_message)
+    assert not actions.is_repeated_printed_content(user_message.content)
+    actions.apply_action(action)
+    assert actions.is_repeated_printed_content(user_message.content)
+    assert not actions.is_repeated_printed_content('How much is 2 + 4 ?')
+
+
+def test_repeated_printed_content_ignores_unprinted_messages(actions, conversations, conversation, user_message):
+    actions.apply_action(AppendMessage(conversations=conversations, conversation_name=conversation.conversation_name,
+                                       message=user_message, should_print=False))
+    assert not actions.is_repeated_printed_content(user_message.content)
+
+
+def test_repeated_printed_content_index_follows_list_changes(actions, conversations, conversation, user_message):
+    action = AppendMessage(conversations=conversations, conversation_name=conversation.conversation_name,
+                           message=user_message)
+    actions.append(action)
+    assert actions.is_repeated_printed_content(user_message.content)
+    actions.clear()
+    assert not actions.is_repeated_printed_content(user_message.content)
+    actions.extend([action])
+    assert actions.is_repeated_printed_content(user_message.content)
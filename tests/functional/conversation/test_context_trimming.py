@@ -0,0 +1,56 @@
+from dataclasses import dataclass
+
+from data_to_paper import Role, Message
+from data_to_paper.conversation.context_trimming import plan_context_trimming, get_models_with_more_context
+from data_to_paper.servers.model_engine import ModelEngine
+
+
+@dataclass
+class MessageWithKnownTokens(Message):
+    num_tokens: int = 0
+
+    def get_number_of_tokens(self, model_engine: ModelEngine = None, with_trailing_newline: bool = False) -> int:
+        return self.num_tokens + with_trailing_newline
+
+
+def _get_indices_and_messages(*num_tokens):
+    return [(i, MessageWithKnownTokens(Role.USER, f'message {i}', num_tokens=n)) for i, n in enumerate(num_tokens)]
+
+
+def test_get_models_with_more_context():
+    assert get_models_with_more_context(ModelEngine.GPT4) == \
+        [ModelEngine.GPT4, ModelEngine.GPT4_TURBO, ModelEngine.GPT4o]
+    assert get_models_with_more_context(ModelEngine.GPT4o) == [ModelEngine.GPT4o]
+    assert get_models_with_more_context(ModelEngine.LLAMA_2_7b) == [ModelEngine.LLAMA_2_7b]
+
+
+def test_plan_context_trimming_when_messages_fit():
+    plan = plan_context_trimming(_get_indices_and_messages(100, 200, 300), ModelEngine.GPT4, 500)
+    assert plan.is_trivial()
+    assert plan.model_engine is ModelEngine.GPT4
+    assert plan.num_tokens == 602
+
+
+def test_plan_context_trimming_bumps_model():
+    plan = plan_context_trimming(_get_indices_and_messages(100, 5000, 3000), ModelEngine.GPT4, 500)
+    assert plan.model_engine is ModelEngine.GPT4_TURBO
+    assert plan.hidden_indices == []
+    assert plan.fits
+
+
+def test_plan_context_trimming_hides_minimal_messages_from_top():
+    # LLAMA_2_7b has 4096 tokens and no model with more context:
+    indices_and_messages = _get_indices_and_messages(100, 1200, 1200, 1200, 1200, 300)
+    plan = plan_context_trimming(indices_and_messages, ModelEngine.LLAMA_2_7b, 500)
+    assert plan.model_engine is ModelEngine.LLAMA_2_7b
+    assert plan.hidden_indices == [1, 2]
+    assert plan.num_hidden_tokens == 2400
+    assert plan.num_tokens == 2803
+    assert plan.fits
+    assert 'hiding 2 messages (2400 tokens): [1, 2]' in plan.pretty_repr()
+
+
+def test_plan_context_trimming_keeps_system_message():
+    plan = plan_context_trimming(_get_indices_and_messages(5000, 100), ModelEngine.LLAMA_2_7b, 500)
+    assert plan.hidden_indices == [1]
+    assert not plan.fits
@@ -1,9 +1,10 @@
 import pytest
 from pytest import fixture
 
-from data_to_paper.conversation.conversation_actions import ReplaceLastMessage
+from data_to_paper.conversation.conversation_actions import ReplaceLastMessage, FailedLLMResponse
 from data_to_paper.conversation.conversation_manager import ConversationManager
 from data_to_paper.servers.llm_call import OPENAI_SERVER_CALLER
+from data_to_paper.servers.model_engine import ModelEngine
 from data_to_paper.conversation.message_designation import RangeMessageDesignation
 
 
@@ -125,3 +126,18 @@ def test_conversation_manager_adds_python_header(manager):
     ]):
         content = manager.get_and_append_assistant_message(is_code=True).content
     assert content == 'the code is:\n```python\nprint("hello world")\n```\n\nthe output is:\n```\nhello world\n```\n'
+
+
+def test_conversation_manager_trims_context_before_calling_llm(manager, actions):
+    with OPENAI_SERVER_CALLER.mock([
+        'The answer is 4',
+    ]):
+        manager.append_user_message('word ' * 5000, comment='This message is too long for the model')
+        manager.append_surrogate_message('Hi, this is a predefined assistant response.')
+        manager.append_user_message('How much is 2 + 2', tag='math question')
+        manager.get_and_append_assistant_message(tag='math answer', model_engine=ModelEngine.LLAMA_2_7b)
+
+    assert manager.conversation.get_last_response() == 'The answer is 4'
+    assert actions[-1].hidden_messages == [1]
+    assert len(actions[-1].message.context) == 3
+    assert not any(isinstance(action, FailedLLMResponse) for action in actions)
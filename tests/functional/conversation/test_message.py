@@ -3,6 +3,8 @@ import pytest
 from pytest import fixture
 
 from data_to_paper import Role, Message
+from data_to_paper.servers.llm_call import count_number_of_tokens_in_message
+from data_to_paper.servers.model_engine import ModelEngine
 from data_to_paper.text.highlighted_text import python_to_highlighted_text
 
 
@@ -47,3 +49,23 @@ def test_message_repr_with_code_and_non_code_blocks():
     pretty = message.pretty_content(text_color=colorama.Fore.CYAN, width=100)
     assert colorama.Fore.LIGHTCYAN_EX in pretty
     assert python_to_highlighted_text("print('hello')", color=colorama.Fore.CYAN)[:-1] in pretty
+
+
+def test_message_number_of_tokens_is_memoised_and_updated_on_content_change():
+    message = Message(Role.USER, 'hello world')
+    num_tokens = message.get_number_of_tokens(ModelEngine.GPT4)
+    assert num_tokens == count_number_of_tokens_in_message('hello world', ModelEngine.GPT4)
+    assert message.get_number_of_tokens(ModelEngine.GPT4) == num_tokens
+    message.content = 'hello world, hello world'
+    assert message.get_number_of_tokens(ModelEngine.GPT4) > num_tokens
+
+
+@pytest.mark.parametrize('contents', [
+    ['hello world', 'hello'],
+    ['{"a": 1}', '}', 'end.'],  # '}\n' is a single token
+    ['hello \n', 'world\n\n', '\n\nhello', ' world', '', '/path', 'x'],  # newlines merging with neighbours
+])
+def test_count_number_of_tokens_in_messages_counts_joined_messages(contents):
+    messages = [Message(Role.USER, content) for content in contents]
+    assert count_number_of_tokens_in_message(messages, ModelEngine.GPT4) == \
+        count_number_of_tokens_in_message('\n'.join(contents), ModelEngine.GPT4)
@@ -0,0 +1,97 @@
+import pickle
+
+import pytest
+
+from data_to_paper import Role, Message
+from data_to_paper.conversation.action_journal import ActionJournal, ActionJournalReader
+from data_to_paper.conversation.actions_and_conversations import Actions
+from data_to_paper.conversation.conversation import Conversation
+from data_to_paper.conversation.conversation_actions import AppendLLMResponse, AppendMessage
+from data_to_paper.conversation.message_context import MessageContext, MessageStore
+
+
+@pytest.fixture()
+def messages():
+    return [Message(Role.USER, f'message {i}') for i in range(6)]
+
+
+def test_message_context_behaves_as_list(messages):
+    store = MessageStore()
+    context = MessageContext.from_messages(messages[:2] + messages[3:], store)
+    expected = messages[:2] + messages[3:]
+    assert len(context) == 5
+    assert list(context) == expected
+    assert context == expected
+    assert [context[i] for i in range(-5, 5)] == expected * 2
+    assert context[1:3] == expected[1:3]
+    with pytest.raises(IndexError):
+        context[5]
+
+
+def test_message_context_stores_runs_of_interned_messages(messages):
+    store = MessageStore()
+    first_context = MessageContext.from_messages(messages[:4], store)
+    second_context = MessageContext.from_messages(messages, store)
+    hidden_context = MessageContext.from_messages(messages[:2] + messages[3:], store)
+    assert len(store) == 6
+    assert first_context.runs == ((0, 4),)
+    assert second_context.runs == ((0, 6),)
+    assert hidden_context.runs == ((0, 2), (3, 6))
+
+
+def test_message_contexts_of_conversation_share_the_store(messages):
+    conversation = Conversation(messages)
+    contexts = [conversation.get_context(conversation[:i]) for i in range(1, len(conversation) + 1)]
+    assert all(context.store is conversation.message_store for context in contexts)
+    assert len(conversation.message_store) == len(conversation)
+
+    unpickled_contexts = pickle.loads(pickle.dumps(contexts))
+    assert unpickled_contexts == contexts
+    assert unpickled_contexts[0].store is unpickled_contexts[-1].store
+
+
+def test_pickle_size_of_contexts_grows_linearly():
+    def get_pickle_size(num_messages):
+        conversation = Conversation()
+        for i in range(num_messages):
+            conversation.append(Message(Role.ASSISTANT, f'message {i}', context=conversation.get_context(conversation)))
+        return len(pickle.dumps(conversation))
+
+    assert get_pickle_size(400) < 2.5 * get_pickle_size(200)
+
+
+def test_action_journal_records_message_stores_incrementally(tmpdir, conversations):
+    conversation = conversations.get_or_create_conversation('default')
+    journal = ActionJournal(tmpdir.join('actions.pkl'))
+    actions = []
+    for i in range(5):
+        message = Message(Role.ASSISTANT, f'message {i}', context=conversation.get_context(conversation))
+        conversation.append(message)
+        action = AppendLLMResponse(conversations=conversations, conversation_name='default', message=message)
+        journal.append(action)
+        actions.append(action)
+    journal.close()
+
+    reader = ActionJournalReader(tmpdir.join('actions.pkl'))
+    read_actions = list(reader)
+    assert read_actions == actions
+    assert len(reader.stores) == 1
+    assert len(reader.messages) == 5
+    assert read_actions[-1].message.context[0] is read_actions[0].message
+
+
+def test_actions_with_message_contexts_can_be_saved_and_loaded(tmpdir, conversations):
+    conversation = conversations.get_or_create_conversation('default')
+    actions = Actions()
+    for i in range(3):
+        question = Message(Role.USER, f'question {i}')
+        conversation.append(question)
+        actions.append(AppendMessage(conversations=conversations, conversation_name='default', message=question))
+        answer = Message(Role.ASSISTANT, f'answer {i}', context=conversation.get_context(conversation))
+        conversation.append(answer)
+        actions.append(AppendLLMResponse(conversations=conversations, conversation_name='default', message=answer))
+    actions.save_actions_to_file(tmpdir.join('actions.pkl'))
+
+    loaded_actions = Actions().load_actions_from_file(tmpdir.join('actions.pkl'))
+    assert loaded_actions == actions
+    assert loaded_actions[-1].message.context[0] is loaded_actions[0].message
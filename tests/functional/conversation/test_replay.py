@@ -1,6 +1,7 @@
 from data_to_paper import Role
 from data_to_paper.conversation.conversation_actions import AppendMessage, Message, AppendLLMResponse
 from data_to_paper.conversation.conversation_manager import ConversationManager
+from data_to_paper.conversation.actions_and_conversations import Actions
 from data_to_paper.conversation.replay import replay_actions
 
 
@@ -38,3 +39,36 @@ def test_replay_actions(tmpdir, actions, conversations, actions_and_conversation
     actions.clear()
 
     replay_actions(tmpdir.join('actions.pkl'))
+
+
+def test_load_actions_rebuilds_printed_content_index(tmpdir, actions, conversations):
+    actions.append(AppendMessage(
+        conversations=conversations,
+        conversation_name='default',
+        message=Message(role=Role.USER, content='what is 2 + 3 ?')))
+    actions.save_actions_to_file(tmpdir.join('actions.pkl'))
+
+    loaded_actions = Actions()
+    loaded_actions.append(AppendMessage(
+        conversations=conversations,
+        conversation_name='default',
+        message=Message(role=Role.USER, content='what is 10 - 3 ?')))
+    assert loaded_actions.is_repeated_printed_content('what is 10 - 3 ?')
+    loaded_actions.load_actions_from_file(tmpdir.join('actions.pkl'))
+    assert loaded_actions.is_repeated_printed_content('what is 2 + 3 ?')
+    assert not loaded_actions.is_repeated_printed_content('what is 10 - 3 ?')
+
+
+def test_replay_abbreviates_only_repeated_content(tmpdir, actions, actions_and_conversations, capsys):
+    conversation_manager = ConversationManager(actions_and_conversations=actions_and_conversations,
+                                               conversation_name='conversation1')
+    conversation_manager.create_conversation()
+    conversation_manager.append_user_message('what is 2 + 3 ?')
+    conversation_manager.append_user_message('what is 2 + 3 ?')
+    actions.save_actions_to_file(tmpdir.join('actions.pkl'))
+    capsys.readouterr()
+
+    replayed_actions = replay_actions(tmpdir.join('actions.pkl'), is_color=False)
+    assert replayed_actions == actions
+    # only the first of the two identical messages is printed in full:
+    assert capsys.readouterr().out.count('----- USER') == 1
@@ -1,12 +1,21 @@
 import os
+import subprocess
+from pathlib import Path
 
+import fitz
 import pytest
 from pytest import fixture
 
 from data_to_paper.latex.clean_latex import process_latex_text_and_math
 from data_to_paper.latex.exceptions import LatexCompilationError
 from data_to_paper.latex.latex_doc import LatexDocument
-from data_to_paper.latex.latex_to_pdf import evaluate_latex_num_command, save_latex_and_compile_to_pdf
+from data_to_paper.env import LATEX_FORMATS_FOLDER
+from data_to_paper.latex import latex_to_pdf
+from data_to_paper.latex.latex_to_pdf import evaluate_latex_num_command, save_latex_and_compile_to_pdf, \
+    get_precompiled_format_file, OUTPUT_DIRECTORIES_AND_FILE_STEMS_TO_COMPILATION_FOLDERS, \
+    _get_hash_of_auxiliary_files, LATEX_COMPILATION_CACHE_DIRECTORY, END_OF_PRECOMPILED_PREAMBLE, \
+    is_latex_compilation_cached
+from data_to_paper.utils.file_utils import run_in_directory
 from data_to_paper.servers.crossref import CrossrefCitation
 
 
@@ -136,6 +145,88 @@ def test_latex_to_pdf_with_bibtex(tmpdir, latex_content_with_citations, citation
     assert not os.path.exists(os.path.join(tmpdir.strpath, file_name + '.log'))
 
 
+def test_latex_to_pdf_reruns_only_changed_passes(tmpdir, latex_content_with_citations, citations):
+    save_latex_and_compile_to_pdf(latex_content_with_citations, file_name, tmpdir.strpath, citations)
+    compilation_folder = OUTPUT_DIRECTORIES_AND_FILE_STEMS_TO_COMPILATION_FOLDERS[(tmpdir.strpath, file_name)]
+    assert compilation_folder.passes == ['pdflatex', 'bibtex', 'pdflatex', 'pdflatex']
+
+    save_latex_and_compile_to_pdf(latex_content_with_citations.replace('Hello', 'Hi'), file_name, tmpdir.strpath,
+                                  citations)
+    assert compilation_folder.passes == ['pdflatex']
+    assert os.path.exists(os.path.join(tmpdir.strpath, file_name + '.pdf'))
+
+
+def test_hash_of_auxiliary_files_ignores_page_count(tmpdir):
+    with run_in_directory(tmpdir):
+        no_aux_hash = _get_hash_of_auxiliary_files('paper')
+        with open('paper.aux', 'w') as f:
+            f.write('\\relax \n\\gdef \\@abspage@last{1}\n')
+        assert _get_hash_of_auxiliary_files('paper') == no_aux_hash
+        with open('paper.aux', 'a') as f:
+            f.write('\\newlabel{sec:intro}{{1}{1}}\n')
+        assert _get_hash_of_auxiliary_files('paper') != no_aux_hash
+
+
+def test_latex_compilation_cache_restores_saved_files(tmpdir, monkeypatch, latex_content):
+    compiled_contents = []
+
+    def compile_to_pdf(latex_content, file_stem, output_directory, *args):
+        compiled_contents.append(latex_content)
+        for extension in ['.tex', '.pdf']:
+            with open(os.path.join(output_directory, file_stem + extension), 'w') as f:
+                f.write(latex_content + extension)
+        return 'Table width: 100.0pt', None
+
+    monkeypatch.setattr(latex_to_pdf, '_save_latex_and_compile_to_pdf', compile_to_pdf)
+    with LATEX_COMPILATION_CACHE_DIRECTORY.temporary_set(tmpdir.join('cache')):
+        compilation = save_latex_and_compile_to_pdf(latex_content, file_name, tmpdir.strpath)
+        os.remove(os.path.join(tmpdir.strpath, file_name + '.pdf'))
+        assert save_latex_and_compile_to_pdf(latex_content, file_name, tmpdir.strpath) == compilation
+        save_latex_and_compile_to_pdf(latex_content + '%', file_name, tmpdir.strpath)
+
+    assert compiled_contents == [latex_content, latex_content + '%']
+    with open(os.path.join(tmpdir.strpath, file_name + '.pdf')) as f:
+        assert f.read() == latex_content + '%.pdf'
+
+
+def test_latex_compilation_cache_raises_cached_errors(tmpdir, monkeypatch, wrong_latex_content):
+    num_compilations = 0
+
+    def compile_to_pdf(latex_content, *args):
+        nonlocal num_compilations
+        num_compilations += 1
+        raise LatexCompilationError(latex_content=latex_content, pdflatex_output='! Misplaced alignment tab')
+
+    monkeypatch.setattr(latex_to_pdf, '_save_latex_and_compile_to_pdf', compile_to_pdf)
+    with LATEX_COMPILATION_CACHE_DIRECTORY.temporary_set(tmpdir.join('cache')):
+        for _ in range(2):
+            with pytest.raises(LatexCompilationError) as e:
+                save_latex_and_compile_to_pdf(wrong_latex_content, file_name)
+            assert e.value.latex_content == wrong_latex_content
+    assert num_compilations == 1
+
+
+def test_latex_compilation_cache_does_not_persist_errors(tmpdir, monkeypatch, wrong_latex_content):
+    num_compilations = 0
+
+    def compile_to_pdf(latex_content, *args):
+        nonlocal num_compilations
+        num_compilations += 1
+        raise LatexCompilationError(latex_content=latex_content, pdflatex_output='! LaTeX Error: File missing.sty')
+
+    monkeypatch.setattr(latex_to_pdf, '_save_latex_and_compile_to_pdf', compile_to_pdf)
+    with LATEX_COMPILATION_CACHE_DIRECTORY.temporary_set(tmpdir.join('cache')):
+        with pytest.raises(LatexCompilationError):
+            save_latex_and_compile_to_pdf(wrong_latex_content, file_name)
+        assert is_latex_compilation_cached(wrong_latex_content)
+        monkeypatch.setattr(latex_to_pdf, '_LATEX_COMPILATION_KEYS_TO_ERRORS', {})  # a new process
+        monkeypatch.setattr(latex_to_pdf, '_DIRECTORIES_TO_LATEX_COMPILATION_STORES', {})
+        assert not is_latex_compilation_cached(wrong_latex_content)
+        with pytest.raises(LatexCompilationError):
+            save_latex_and_compile_to_pdf(wrong_latex_content, file_name)
+    assert num_compilations == 2
+
+
 def test_latex_to_pdf_error_handling(tmpdir, latex_content_with_unescaped_characters):
     save_latex_and_compile_to_pdf(
         process_latex_text_and_math(latex_content_with_unescaped_characters), file_name, tmpdir.strpath, )
@@ -151,6 +242,23 @@ def test_latex_to_pdf_with_hyperlinks(tmpdir, latex_content_with_hyperlinks):
     assert os.path.exists(os.path.join(tmpdir.strpath, file_name + '.pdf'))
 
 
+def test_precompiled_format_is_not_used_when_disabled():
+    with LATEX_FORMATS_FOLDER.temporary_set(None):
+        assert get_precompiled_format_file(LatexDocument().get_preamble()) is None
+
+
+def test_latex_document_compiles_with_precompiled_preamble(tmpdir):
+    latex_document = LatexDocument()
+    with LATEX_FORMATS_FOLDER.temporary_set(tmpdir.join('formats')):
+        latex_document.compile_document(content='Hello World!', file_stem=file_name, output_directory=tmpdir.strpath)
+        format_file = get_precompiled_format_file(latex_document.get_preamble())
+        # the format is not built if mylatexformat is not installed:
+        assert format_file is None or format_file.exists()
+        with pytest.raises(LatexCompilationError) as e:
+            latex_document.compile_document(content='Hello & World!', file_stem=file_name)
+    assert 'Hello & World!' in e.value._get_erroneous_lines()
+
+
 @pytest.mark.parametrize('latex, expected', [
     ('Hello & World!', r'Hello \& World!'),
     ('Hello % World!', r'Hello \% World!'),
@@ -179,3 +287,66 @@ def test_evaluate_latex_expression(latex, expected):
     assert latex == expected[0]
     assert num_dict == expected[1]
     LatexDocument().compile_document(latex, file_stem='test')
+
+
+def test_precompiled_format_marker_is_not_saved(tmpdir, monkeypatch):
+    format_file = tmpdir.join('formats', 'preamble.fmt')
+    format_file.write('fake format', ensure=True)
+    monkeypatch.setattr(latex_to_pdf, 'get_precompiled_format_file', lambda preamble: Path(format_file.strpath))
+    compiled_contents = []
+
+    def run(args, **kwargs):
+        with open(args[-1]) as f:
+            compiled_contents.append(f.read())
+        if 'fail' in compiled_contents[-1]:
+            raise subprocess.CalledProcessError(1, args, output=b'! Undefined control sequence.')
+        doc = fitz.open()
+        doc.new_page()
+        doc.save(args[-1][:-4] + '.pdf')
+        return subprocess.CompletedProcess(args, 0, stdout=b'')
+
+    monkeypatch.setattr(latex_to_pdf.subprocess, 'run', run)
+    preamble = '\\documentclass{article}\n'
+    latex_content = preamble + '\\begin{document}\nHello\n\\end{document}\n'
+    save_latex_and_compile_to_pdf(latex_content, file_name, tmpdir.strpath, preamble=preamble)
+    assert compiled_contents[-1] == preamble + END_OF_PRECOMPILED_PREAMBLE + latex_content[len(preamble):]
+    with open(os.path.join(tmpdir.strpath, file_name + '.tex')) as f:
+        assert f.read() == latex_content
+
+    wrong_latex_content = latex_content.replace('Hello', 'fail')
+    with pytest.raises(LatexCompilationError) as e:
+        save_latex_and_compile_to_pdf(wrong_latex_content, file_name, tmpdir.strpath, preamble=preamble)
+    assert e.value.latex_content == wrong_latex_content
+    with open(os.path.join(tmpdir.strpath, file_name + '.tex')) as f:
+        assert f.read() == wrong_latex_content
+
+
+def test_compilation_folder_keeps_only_current_figures_and_returns_first_pass_output(tmpdir, monkeypatch):
+    figures_folder = tmpdir.mkdir('figures')
+    figures_folder.join('a.png').write('a')
+    figures_folder.join('b.png').write('b')
+    output_directory = tmpdir.mkdir('output')
+    figures_in_compilation = []
+
+    def run(args, **kwargs):
+        num_passes = len(figures_in_compilation)
+        figures_in_compilation.append(sorted(os.listdir('.')))
+        with open(file_name + '.aux', 'w') as f:
+            f.write(f'\\newlabel{{pass}}{{{min(num_passes, 1)}}}\n')  # changes only after the first pass
+        doc = fitz.open()
+        doc.new_page()
+        doc.save(file_name + '.pdf')
+        return subprocess.CompletedProcess(args, 0, stdout=f'pass {num_passes}'.encode())
+
+    monkeypatch.setattr(latex_to_pdf.subprocess, 'run', run)
+    latex_content = '\\documentclass{article}\n\\begin{document}\nHello\n\\end{document}\n'
+    pdflatex_output, _ = save_latex_and_compile_to_pdf(latex_content, file_name, output_directory.strpath,
+                                                       figures_folder=Path(figures_folder.strpath))
+    assert pdflatex_output == 'pass 0'
+    assert {'a.png', 'b.png'} <= set(figures_in_compilation[-1])
+
+    figures_folder.join('b.png').remove()
+    save_latex_and_compile_to_pdf(latex_content + '%', file_name, output_directory.strpath,
+                                  figures_folder=Path(figures_folder.strpath))
+    assert 'a.png' in figures_in_compilation[-1]
+    assert 'b.png' not in figures_in_compilation[-1]
@@ -1,11 +1,14 @@
 import os
+import re
+
 import pandas as pd
 import pytest
 from pytest import fixture
 
-from data_to_paper.latex.latex_doc import LatexDocument
+from data_to_paper.latex.latex_doc import LatexDocument, get_table_widths_from_pdflatex_output
 from data_to_paper.llm_coding_utils.df_to_latex import df_to_latex
 from data_to_paper.research_types.hypothesis_testing.check_df_to_funcs.abbreviations import is_unknown_abbreviation
+from data_to_paper.text import dedent_triple_quote_str
 
 THIS_FOLDER = os.path.dirname(os.path.abspath(__file__))
 
@@ -26,6 +29,58 @@ def test_df_to_latex(df_table):
     assert 0.1 < width < 0.2
 
 
+def test_compile_tables_in_a_batch(df_table):
+    latex = df_to_latex(df_table, 'test', caption='test caption', note='this is a note')
+    latex = latex.replace('@@<', '').replace('>@@', '')
+    latex_document = LatexDocument()
+    wrong_latex = latex.replace('test caption', r'test \caption{')
+    # The broken table is first, so that a group it leaves open would affect the widths of the following tables:
+    widths = latex_document.compile_tables([wrong_latex, latex, latex])
+    assert widths[0] is None
+    assert 0.1 < widths[1] < 0.2
+    assert widths[2] == widths[1]
+    assert latex_document.compile_table(latex) == widths[1]
+
+
+def test_compile_tables_recompiles_tables_after_a_broken_table(df_table, monkeypatch):
+    latex = df_to_latex(df_table, 'test', caption='test caption', note='this is a note')
+    latex = latex.replace('@@<', '').replace('>@@', '')
+    wrong_latex = latex.replace('test caption', r'test \caption{')
+    batches = []
+
+    def compile_document(self, content, **kwargs):
+        # a broken table stops the typesetting of the tables that follow it:
+        indices = [int(index) for index in re.findall(r'Start of table (\d+)', content)]
+        batches.append(indices)
+        output = 'Page margin width: 400.0pt\n'
+        for index in indices:
+            output += f'Start of table {index}\n'
+            if index == 1:
+                return None, output + '! Paragraph ended before \\@caption was complete.\n', None
+            output += f'Width of table {index}: 100.0pt\n'
+        return None, output, None
+
+    monkeypatch.setattr(LatexDocument, 'compile_document', compile_document)
+    widths = LatexDocument().compile_tables([latex, wrong_latex, latex + '%', latex + '%%'])
+    assert widths == [0.25, None, 0.25, 0.25]
+    assert batches == [[0, 1, 2, 3], [2, 3]]
+
+
+def test_get_table_widths_from_pdflatex_output():
+    pdflatex_output = dedent_triple_quote_str("""
+        Page margin width: 400.0pt
+        Start of table 0
+        Width of table 0: 100.0pt
+        Start of table 1
+        ! Undefined control sequence.
+        l.25 \\badcommand
+        Width of table 1: 50.0pt
+        Start of table 3
+        Width of table 3: 200.0pt
+        """)
+    assert get_table_widths_from_pdflatex_output(pdflatex_output, 4) == [0.25, None, None, 0.5]
+
+
 def test_table_with_list():
     df = pd.DataFrame({
         'a': [[1, 2.3578523523523, 3], [4, 5, 6]],
@@ -1,10 +1,14 @@
 import pickle
 
-from pytest import fixture
+import numpy as np
+from pytest import fixture, raises
 from pandas.core.dtypes.inference import is_list_like
-from pandas import DataFrame
+from pandas import DataFrame, Series
 
-from data_to_paper.run_gpt_code.overrides.pvalue import PValue, is_p_value
+from data_to_paper.run_gpt_code.overrides.pvalue import PValue, is_p_value, convert_to_p_value, \
+    is_containing_p_value, is_only_p_values, convert_p_values_to_floats, OnStr, OnStrPValue
+from data_to_paper.run_gpt_code.overrides.statsmodels.pvalue_dtype import PValueDtype
+from data_to_paper.run_gpt_code.run_issues import RunIssue
 
 
 @fixture()
@@ -42,3 +46,97 @@ def test_pvalue_unique():
     data_unique = data.unique()
     assert len(data_unique) == 2
     assert isinstance(data_unique[0], PValue)
+
+
+@fixture()
+def pvalue_series():
+    return convert_to_p_value(Series([0.01, 0.2, 1e-9], index=['a', 'b', 'c']), created_by='OLS')
+
+
+def test_convert_series_to_pvalue_dtype_without_copying():
+    floats = Series([0.01, 0.2, 1e-9], index=['a', 'b', 'c'])
+    pvalues = convert_to_p_value(floats, created_by='OLS')
+    assert isinstance(pvalues.dtype, PValueDtype)
+    assert np.shares_memory(pvalues.array.float_values, floats.to_numpy())
+    assert is_p_value(pvalues['a'])
+    assert pvalues['a'].created_by == 'OLS'
+    assert np.shares_memory(convert_p_values_to_floats(pvalues).to_numpy(), floats.to_numpy())
+
+
+def test_pvalue_dtype_is_detected_in_dataframe(pvalue_series):
+    df = DataFrame({'coef': [1., 2., 3.], 'p': pvalue_series})
+    assert is_containing_p_value(df)
+    assert is_only_p_values(df['p'])
+    assert not is_containing_p_value(df['coef'])
+    assert convert_p_values_to_floats(df)['p'].dtype == float
+
+
+def test_pvalue_dtype_operators(pvalue_series):
+    assert (pvalue_series < 0.05).tolist() == [True, False, True]
+    assert isinstance((pvalue_series * 2).dtype, PValueDtype)
+    with raises(RunIssue):
+        pvalue_series + 1
+    with raises(RunIssue):
+        pvalue_series.astype(float)
+    with PValue.BEHAVE_NORMALLY.temporary_set(True):
+        assert (pvalue_series + 1).tolist() == [1.01, 1.2, 1 + 1e-9]
+
+
+def test_pvalue_dtype_formatting(pvalue_series):
+    with OnStrPValue(OnStr.SMALLER_THAN):
+        assert '<1e-06' in DataFrame({'p': pvalue_series}).to_latex()
+    with raises(RunIssue):
+        str(pvalue_series)
+
+
+def test_pvalue_dtype_pickleability(pvalue_series):
+    df = DataFrame({'p': pvalue_series})
+    unpickled_df = pickle.loads(pickle.dumps(df))
+    assert isinstance(unpickled_df['p'].dtype, PValueDtype)
+    assert unpickled_df['p'].array.created_by == 'OLS'
+    assert unpickled_df['p'].array.float_values.tolist() == [0.01, 0.2, 1e-9]
+
+
+def test_pvalue_dtype_keeps_p_values_set_in_it(pvalue_series):
+    df = DataFrame({'coef': [1., 2., 3.], 'p': pvalue_series})
+    df.loc['a', 'p'] = PValue(0.03, created_by='OLS')
+    assert isinstance(df['p'].dtype, PValueDtype)
+    assert df['p'].array.float_values.tolist() == [0.03, 0.2, 1e-9]
+
+
+def test_pvalue_dtype_becomes_object_when_a_float_is_set(pvalue_series):
+    df = DataFrame({'coef': [1., 2., 3.], 'p': pvalue_series})
+    df.loc['a', 'p'] = 0.001
+    assert df['p'].dtype == object
+    assert not is_only_p_values(df)
+    assert type(df.loc['a', 'p']) is float
+    assert is_p_value(df.loc['b', 'p'])
+
+
+def test_pvalue_dtype_becomes_object_when_a_string_is_set(pvalue_series):
+    df = DataFrame({'coef': [1., 2., 3.], 'p': pvalue_series})
+    df.loc['a', 'p'] = '-'
+    assert df['p'].dtype == object
+    assert df.loc['a', 'p'] == '-'
+    assert is_p_value(df.loc['b', 'p'])
+
+
+def test_convert_series_to_pvalue_dtype_reports_nan():
+    with raises(RunIssue, match='`y`'):
+        convert_to_p_value(Series([0.1, np.nan], index=['x', 'y']))
+
+
+def test_convert_nullable_series_to_pvalue_dtype_reports_missing_values():
+    with raises(RunIssue, match='`y`'):
+        convert_to_p_value(Series([0.1, None], index=['x', 'y'], dtype='Float64'))
+
+
+def test_convert_array_to_pvalue_keeps_ndarray():
+    pvalues = convert_to_p_value(np.array([0.01, 0.2, 1e-9]), created_by='ttest')
+    assert isinstance(pvalues, np.ndarray)
+    assert is_p_value(pvalues[0])
+    assert pvalues[0].created_by == 'ttest'
+    assert pvalues.reshape(3, 1).shape == (3, 1)
+    assert all(is_p_value(value) for value in pvalues.flatten())
+    with raises(RunIssue):
+        pvalues.mean()
@@ -1,8 +1,13 @@
 import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
 
-from data_to_paper.run_gpt_code.cache_runs import CacheRunToFile
+from data_to_paper.run_gpt_code import cache_runs
+from data_to_paper.run_gpt_code.cache_runs import CacheRunToFile, get_cache_store_directory, directory_hash, \
+    directory_fingerprint, FileHashCache
+from data_to_paper.run_gpt_code.cache_store import IndexedCacheStore, get_key_hash
 
 
 @dataclass
@@ -76,3 +81,126 @@ def test_cache_method_output_to_file_with_created_files(tmpdir):
     # check that the file was written:
     with open('output/result.txt') as f:
         assert f.read() == 'hello'
+
+
+def test_cache_is_stored_in_indexed_store(tmpdir):
+    os.chdir(tmpdir)
+    os.mkdir('cache')
+    os.mkdir('output')
+    get_runner('hello', write_files=True).run()
+    get_runner('world', write_files=True).run()
+    store = IndexedCacheStore(get_cache_store_directory(Path('cache').joinpath('cache.pkl')))
+    assert len(store) == 2
+    assert len(os.listdir(store.directory / 'blobs')) == 2
+    assert len(os.listdir(store.directory / 'files')) == 2
+
+
+def test_cache_imports_legacy_cache_file(tmpdir):
+    os.chdir(tmpdir)
+    os.mkdir('cache')
+    os.mkdir('output')
+    with open('output/data.csv', 'w') as f:
+        f.write('a,b\n1,2\n')
+    runner = get_runner('hello', write_files=True)
+    legacy_key = runner._get_instance_key() + (directory_hash(runner.run_directory), )
+    new_key = runner._get_instance_key() + runner._get_run_directory_key()
+    with open('cache/cache.pkl', 'wb') as f:
+        pickle.dump({legacy_key: ('cached hello', {'result.txt': b'cached hello'})}, f)
+    assert runner.run() == 'cached hello'
+    assert runner.called_count == 0
+    with open('output/result.txt') as f:
+        assert f.read() == 'cached hello'
+    # the entry was migrated to the new key:
+    store = IndexedCacheStore(get_cache_store_directory(runner.cache_filepath))
+    assert new_key in store
+    assert not store.has_legacy_entries()
+
+
+def test_cache_looks_for_legacy_keys_once_per_run_directory(tmpdir, monkeypatch):
+    os.chdir(tmpdir)
+    os.mkdir('cache')
+    os.mkdir('output')
+    with open('cache/cache.pkl', 'wb') as f:
+        pickle.dump({('other', 'legacy hash'): ('other', {})}, f)
+    num_legacy_lookups = []
+
+    def get_legacy_directory_hashes(directory):
+        num_legacy_lookups.append(directory)
+        return 'legacy hash 1', 'legacy hash 2'
+
+    monkeypatch.setattr(cache_runs, 'get_legacy_directory_hashes', get_legacy_directory_hashes)
+    for result in ['hello', 'world', 'again']:
+        assert get_runner(result, write_files=True).run() == result
+    assert len(num_legacy_lookups) == 1
+    assert IndexedCacheStore(get_cache_store_directory(Path('cache/cache.pkl'))).has_legacy_entries()
+
+
+def test_cache_store_evicts_least_recently_used(tmpdir):
+    store = IndexedCacheStore(Path(tmpdir) / 'store', max_size=250)
+    store.put(('a', ), 'a' * 100, {'a.txt': b'a'})
+    store.put(('b', ), 'b' * 100, {'b.txt': b'b'})
+    store.get(('a', ))
+    store.put(('c', ), 'c' * 100, {})
+    assert ('a', ) in store
+    assert ('b', ) not in store
+    assert ('c', ) in store
+    assert store.get(('a', )) == ('a' * 100, {'a.txt': b'a'})
+    assert len(os.listdir(store.directory / 'files')) == 1
+    assert store.get_total_size() == sum(entry.size for entry in store.index.values())
+
+
+def test_cache_store_writes_access_times_with_the_next_change_of_the_index(tmpdir):
+    store = IndexedCacheStore(Path(tmpdir) / 'store')
+    store.put(('a', ), 'a', {})
+    index_mtime = os.stat(store.index_filepath).st_mtime_ns
+    store.get(('a', ))
+    access_time = store.index[get_key_hash(('a', ))].last_access
+    assert os.stat(store.index_filepath).st_mtime_ns == index_mtime
+
+    # a change of the index by another process does not lose the access time:
+    IndexedCacheStore(store.directory).put(('b', ), 'b', {})
+    assert store.index[get_key_hash(('a', ))].last_access == access_time
+    store.put(('c', ), 'c', {})
+    assert IndexedCacheStore(store.directory).index[get_key_hash(('a', ))].last_access == access_time
+
+
+def _put_entries_to_store(directory, name):
+    store = IndexedCacheStore(directory, max_size=10 ** 6)
+    for i in range(20):
+        store.put((name, i), name * 10, {f'{name}.txt': name.encode()})
+
+
+def test_cache_store_does_not_lose_entries_put_by_concurrent_processes(tmpdir):
+    directory = Path(tmpdir) / 'store'
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        list(executor.map(_put_entries_to_store, [directory] * 4, ['a', 'b', 'c', 'd']))
+    store = IndexedCacheStore(directory)
+    assert len(store) == 80
+    assert store.get_total_size() == sum(entry.size for entry in store.index.values())
+
+
+def test_file_hash_cache_rehashes_only_changed_files(tmpdir):
+    filepath = str(Path(tmpdir) / 'data.csv')
+    with open(filepath, 'w') as f:
+        f.write('a,b\n1,2\n')
+    os.utime(filepath, ns=(0, 0))  # an old file
+    file_hash_cache = FileHashCache()
+    file_hash = file_hash_cache.get_file_hash(filepath)
+    assert file_hash_cache.get_file_hash(filepath) == file_hash
+    assert file_hash_cache.num_hashed_files == 1
+    with open(filepath, 'w') as f:
+        f.write('a,b\n1,3\n')
+    os.utime(filepath, ns=(10 ** 9, 10 ** 9))
+    assert file_hash_cache.get_file_hash(filepath) != file_hash
+    assert file_hash_cache.num_hashed_files == 2
+
+
+def test_directory_fingerprint_depends_on_algorithm_and_content(tmpdir):
+    with open(Path(tmpdir) / 'data.csv', 'w') as f:
+        f.write('a,b\n1,2\n')
+    fingerprint = directory_fingerprint(tmpdir)
+    assert directory_fingerprint(tmpdir) == fingerprint
+    assert directory_fingerprint(tmpdir, algorithm='blake2b') != fingerprint
+    with open(Path(tmpdir) / 'data.csv', 'w') as f:
+        f.write('a,b\n1,3\n')
+    assert directory_fingerprint(tmpdir) != fingerprint
@@ -8,6 +8,8 @@ from scipy.stats._stats_py import TtestResult
 from statsmodels.genmod.generalized_linear_model import GLM
 from statsmodels.stats.anova import anova_lm
 
+from data_to_paper.env import OVERRIDES_TARGETS_INDEX_FOLDER
+from data_to_paper.run_gpt_code.attr_replacers import save_targets_index, _INDEX_FILE_PATHS_TO_TARGETS
 from data_to_paper.run_gpt_code.code_runner import CodeRunner
 from data_to_paper.run_gpt_code.overrides.contexts import OverrideStatisticsPackages
 from data_to_paper.run_gpt_code.overrides.sklearn.override_sklearn import SklearnFitOverride
@@ -307,6 +309,58 @@ def test_scipy_raise_on_pvalue_nan():
             stats.ttest_1samp(data, popmean)
 
 
+def test_scipy_override_indexes_the_replaced_functions(tmpdir):
+    with OVERRIDES_TARGETS_INDEX_FOLDER.temporary_set(tmpdir):
+        discovered_targets = ScipyPValueOverride()._get_all_targets()
+        index_file_path = ScipyPValueOverride()._get_targets_index_file_path()
+        assert index_file_path.exists()
+        _INDEX_FILE_PATHS_TO_TARGETS.pop(index_file_path)  # read the index from the file
+        indexed_targets = ScipyPValueOverride()._get_all_targets()
+    assert indexed_targets == discovered_targets
+    assert (scipy_stats, 'ttest_1samp') in indexed_targets
+
+
+def test_scipy_override_rediscovers_functions_if_index_is_stale(tmpdir):
+    with OVERRIDES_TARGETS_INDEX_FOLDER.temporary_set(tmpdir):
+        index_file_path = ScipyPValueOverride()._get_targets_index_file_path()
+        save_targets_index(index_file_path, [('scipy.stats', '', 'not_a_function')])
+        targets = ScipyPValueOverride()._get_all_targets()
+    assert (scipy_stats, 'ttest_1samp') in targets
+    assert ('scipy.stats', '', 'not_a_function') not in _INDEX_FILE_PATHS_TO_TARGETS[index_file_path]
+
+
+def test_scipy_override_reads_its_index_within_a_code_run(tmpdir):
+    with OVERRIDES_TARGETS_INDEX_FOLDER.temporary_set(tmpdir):
+        ScipyPValueOverride()._get_all_targets()
+        _INDEX_FILE_PATHS_TO_TARGETS.pop(ScipyPValueOverride()._get_targets_index_file_path())
+        # reading files is not allowed within the code run:
+        _, _, _, exception = CodeRunner(additional_contexts={'ScipyPValueOverride': ScipyPValueOverride()}).run(
+            'x = 1\n')
+    assert exception is None
+
+
+def test_scipy_override_index_depends_on_the_source_of_the_override():
+    class ChangedScipyPValueOverride(ScipyPValueOverride):
+        def _should_replace(self, parent, attr_name, attr) -> bool:
+            return attr_name == 'ttest_1samp'
+
+    key = ScipyPValueOverride()._get_targets_index_key()
+    changed_key = ChangedScipyPValueOverride()._get_targets_index_key()
+    assert changed_key[:-1] == key[:-1]
+    assert changed_key[-1] != key[-1]
+
+
+def test_statsmodels_fit_override_indexes_the_replaced_methods(tmpdir):
+    with OVERRIDES_TARGETS_INDEX_FOLDER.temporary_set(tmpdir):
+        discovered_targets = StatsmodelsFitPValueOverride()._get_all_targets()
+        index_file_path = StatsmodelsFitPValueOverride()._get_targets_index_file_path()
+        assert index_file_path.exists()
+        _INDEX_FILE_PATHS_TO_TARGETS.pop(index_file_path)  # read the index from the file
+        indexed_targets = StatsmodelsFitPValueOverride()._get_all_targets()
+    assert indexed_targets == discovered_targets
+    assert any(parent.__name__ == 'Logit' and attr_name == 'fit' for parent, attr_name in indexed_targets)
+
+
 def test_with_statsmodels_raise_on_pvalue_nan():
     with StatsmodelsFitPValueOverride() as context:
         data = pd.DataFrame({'a': [1, 2, 3], 'b': [4, None, 6], 'c': [7, 8, 9]})
@@ -0,0 +1,82 @@
+import gc
+import traceback
+
+import pandas as pd
+
+from data_to_paper.run_gpt_code import user_script_name
+from data_to_paper.run_gpt_code.user_script_name import is_called_from_user_script, is_filename_gpt_code, \
+    is_filename_test, IS_CHECKING
+
+
+def _is_called_from_user_script_by_traceback(offset: int = 3) -> bool:
+    """
+    The original, traceback-based, implementation. Used as a reference.
+    """
+    if IS_CHECKING:
+        return False
+    with IS_CHECKING.temporary_set(True):
+        tb = traceback.extract_stack()
+        filename = tb[-offset].filename
+        return is_filename_gpt_code(filename) or is_filename_test(filename)
+
+
+def _check_from_library_function(func):
+    # `offset=3` is the caller of the caller of `func`. Here, that is this (test) file.
+    return func()
+
+
+def test_is_called_from_user_script_from_test_file():
+    assert _check_from_library_function(is_called_from_user_script)
+    assert _check_from_library_function(_is_called_from_user_script_by_traceback)
+
+
+def test_is_called_from_user_script_from_library():
+    # the caller of `DataFrame.apply` is inside pandas:
+    df = pd.DataFrame({'a': [1, 2]})
+    assert df.apply(lambda _: is_called_from_user_script(offset=3)).tolist() == [False]
+    assert df.apply(lambda _: _is_called_from_user_script_by_traceback(offset=3)).tolist() == [False]
+
+
+def test_is_called_from_user_script_checks_each_code_object_once(monkeypatch):
+    checked_codes = []
+
+    def is_code_from_user_script(code):
+        checked_codes.append(code)
+        return is_filename_test(code.co_filename)
+
+    def extract_stack(*args, **kwargs):
+        raise AssertionError('The stack should not be extracted.')
+
+    monkeypatch.setattr(user_script_name, '_CODE_IDS_TO_IS_USER_SCRIPT', {})
+    monkeypatch.setattr(user_script_name, '_is_code_from_user_script', is_code_from_user_script)
+    monkeypatch.setattr(traceback, 'extract_stack', extract_stack)
+    results = []
+    for _ in range(100):
+        results.append(_check_from_library_function(is_called_from_user_script))
+    assert all(results)
+    assert checked_codes == [test_is_called_from_user_script_checks_each_code_object_once.__code__]
+
+
+def test_is_called_from_user_script_distinguishes_identical_code_of_different_files():
+    source = 'def check():\n    return is_called_from_user_script(offset=2)\n'
+    library_code = compile(source, '/lib/library.py', 'exec')
+    script_code = compile(source, f'/tmp/{user_script_name.module_filename}', 'exec')
+    library_namespace = {'is_called_from_user_script': is_called_from_user_script}
+    script_namespace = {'is_called_from_user_script': is_called_from_user_script}
+    exec(library_code, library_namespace)
+    exec(script_code, script_namespace)
+    assert library_namespace['check'].__code__ == script_namespace['check'].__code__  # equality ignores the filename
+    assert library_namespace['check']() is False
+    assert script_namespace['check']() is True
+
+
+def test_is_called_from_user_script_releases_code_objects(monkeypatch):
+    monkeypatch.setattr(user_script_name, '_CODE_IDS_TO_IS_USER_SCRIPT', {})
+    namespace = {'is_called_from_user_script': is_called_from_user_script}
+    exec(compile('def check():\n    return is_called_from_user_script(offset=2)\n', '/lib/library.py', 'exec'),
+         namespace)
+    namespace['check']()
+    assert len(user_script_name._CODE_IDS_TO_IS_USER_SCRIPT) == 1
+    del namespace
+    gc.collect()
+    assert len(user_script_name._CODE_IDS_TO_IS_USER_SCRIPT) == 0
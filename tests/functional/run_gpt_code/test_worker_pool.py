@@ -0,0 +1,93 @@
+import os
+import sys
+import time
+
+import pytest
+
+from data_to_paper.env import RUN_CODE_IN_WORKER_POOL, MAX_EXEC_TIME
+from data_to_paper.run_gpt_code.code_runner import CodeRunner
+from data_to_paper.run_gpt_code.code_runner_wrapper import CodeRunnerWrapper
+from data_to_paper.run_gpt_code.exceptions import FailedRunningCode
+from data_to_paper.run_gpt_code.worker_pool import SandboxWorkerPool, shutdown_sandbox_worker_pool
+
+
+@pytest.fixture()
+def pool():
+    pool = SandboxWorkerPool(modules_to_import=(), max_runs_per_worker=3).start()
+    yield pool
+    pool.shutdown()
+
+
+def test_worker_pool_reuses_worker_process(pool):
+    pids = [pool.run(os.getpid)[1] for _ in range(3)]
+    assert len(set(pids)) == 1
+    assert pids[0] != os.getpid()
+
+
+def test_worker_pool_recycles_worker_after_max_runs(pool):
+    pids = [pool.run(os.getpid)[1] for _ in range(4)]
+    assert pids[2] != pids[3]
+
+
+def test_worker_pool_recycles_worker_after_each_run_by_default():
+    pool = SandboxWorkerPool(modules_to_import=()).start()
+    try:
+        pids = [pool.run(os.getpid)[1] for _ in range(2)]
+    finally:
+        pool.shutdown()
+    assert pids[0] != pids[1]
+
+
+def get_max_exec_time():
+    return MAX_EXEC_TIME.val
+
+
+def test_worker_pool_runs_with_caller_env_values(pool):
+    with MAX_EXEC_TIME.temporary_set(7):
+        assert pool.run(get_max_exec_time)[1] == 7
+
+
+def test_worker_pool_returns_system_exit_and_replaces_worker(pool):
+    pid = pool.get_worker_pids()[0]
+    is_timeout, result = pool.run(sys.exit, args=(3, ))
+    assert not is_timeout
+    assert isinstance(result, SystemExit)
+    assert pool.run(os.getpid)[1] != pid
+
+
+def test_worker_pool_runs_in_caller_cwd(pool, tmpdir):
+    os.chdir(tmpdir)
+    assert pool.run(os.getcwd)[1] == os.getcwd()
+
+
+def test_worker_pool_returns_exceptions(pool):
+    is_timeout, result = pool.run(int, args=('not a number', ))
+    assert not is_timeout
+    assert isinstance(result, ValueError)
+
+
+def test_worker_pool_recycles_worker_on_timeout(pool):
+    pid = pool.get_worker_pids()[0]
+    is_timeout, result = pool.run(time.sleep, args=(10, ), timeout_sec=1)
+    assert is_timeout
+    assert result is None
+    assert pool.get_worker_pids()[0] != pid
+    assert pool.run(os.getpid)[1] != pid
+
+
+def test_code_runner_wrapper_with_worker_pool(tmpdir):
+    os.chdir(tmpdir)
+    with RUN_CODE_IN_WORKER_POOL.temporary_set(True):
+        try:
+            result = CodeRunnerWrapper(
+                code='with open("output.txt", "w") as f:\n    f.write("hello")\n',
+                code_runner=CodeRunner(allowed_open_write_files=("output.txt",), run_folder=tmpdir),
+            ).run_code_in_separate_process()
+            assert "output.txt" in result[1]
+            _, _, _, exception = CodeRunnerWrapper(
+                timeout_sec=1, code='import time\ntime.sleep(100)\n',
+            ).run_code_in_separate_process()
+            assert isinstance(exception, FailedRunningCode)
+            assert "1 seconds" in str(exception.exception)
+        finally:
+            shutdown_sandbox_worker_pool()
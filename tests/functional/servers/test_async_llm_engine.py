@@ -0,0 +1,151 @@
+import asyncio
+import time
+
+import pytest
+
+from data_to_paper import Message, Role
+from data_to_paper.env import LIMIT_LLM_REQUEST_RATES
+from data_to_paper.servers import async_llm_engine, llm_call
+from data_to_paper.servers.async_llm_engine import AsyncLLMEngine, TokenBucket, RateLimiter
+from data_to_paper.servers.llm_call import LLMServerCaller
+from data_to_paper.servers.model_engine import ModelEngine
+from data_to_paper.servers.types import MissingAPIKeyError, ServerErrorException
+
+
+class FakeAsyncLLMEngine(AsyncLLMEngine):
+    num_in_flight: int = 0
+    max_in_flight: int = 0
+
+    async def _create_chat_completion(self, messages, model_engine, delay=0.2, **kwargs):
+        self.num_in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.num_in_flight)
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            self.num_in_flight -= 1
+        return {'choices': [{'message': {'content': messages[-1]['content']}}]}
+
+
+@pytest.fixture
+def engine():
+    engine = FakeAsyncLLMEngine()
+    yield engine
+    engine.shutdown()
+
+
+class FakeClock:
+    """
+    Replaces the `time` module of `async_llm_engine`; advanced by the sleeps of the rate limiter.
+    """
+    def __init__(self):
+        self.now = 0.
+        self.sleeps = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(async_llm_engine, 'time', clock)
+    monkeypatch.setattr(async_llm_engine.asyncio, 'sleep', clock.sleep)
+    return clock
+
+
+def test_token_bucket_wait_time(clock):
+    bucket = TokenBucket(capacity=10, period=1.)
+    assert bucket.get_wait_time(10) == 0
+    bucket.consume(10)
+    assert bucket.get_wait_time(5) == 0.5
+    # amounts larger than the capacity are limited by the capacity:
+    assert bucket.get_wait_time(100) == 1.
+    clock.now += 0.5
+    assert bucket.get_wait_time(5) == 0
+
+
+def test_rate_limiter_delays_requests_beyond_the_limit(clock):
+    rate_limiter = RateLimiter(requests_per_minute=1000, tokens_per_minute=600)
+    rate_limiter._token_bucket.period = 1.  # 600 tokens per second
+
+    async def acquire_all():
+        for _ in range(3):
+            await rate_limiter.acquire(300)
+
+    asyncio.run(acquire_all())
+    assert clock.sleeps == [0.5]  # the first two requests are within the limit
+
+
+def test_async_llm_engine_runs_requests_concurrently(engine):
+    futures = [engine.submit([{'role': 'user', 'content': f'message{i}'}], ModelEngine.GPT4o_MINI, 10)
+               for i in range(5)]
+    assert [future.result() for future in futures] == [f'message{i}' for i in range(5)]
+    assert engine.max_in_flight == 5
+
+
+def _wait_until(condition, timeout_sec: float = 5.) -> bool:
+    deadline = time.monotonic() + timeout_sec
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_async_llm_engine_request_can_be_cancelled(engine):
+    future = engine.submit([{'role': 'user', 'content': 'slow'}], ModelEngine.GPT4o_MINI, 10, delay=10)
+    assert _wait_until(lambda: engine.num_in_flight == 1)
+    assert future.cancel()
+    assert _wait_until(lambda: engine.num_in_flight == 0)
+
+
+def test_llm_batch_returns_exceptions_in_place_of_failed_responses(monkeypatch):
+    engine = FakeAsyncLLMEngine()
+
+    async def create_chat_completion(messages, model_engine, **kwargs):
+        if messages[-1]['content'] == 'fail':
+            raise ServerErrorException(server='OpenAI', response='failed')
+        return {'choices': [{'message': {'content': messages[-1]['content']}}]}
+
+    engine._create_chat_completion = create_chat_completion
+    monkeypatch.setattr(llm_call, 'get_async_llm_engine', lambda: engine)
+    monkeypatch.setattr(llm_call, 'count_number_of_tokens_in_message', lambda *args: 10)
+    monkeypatch.setattr(LLMServerCaller, '_check_after_spending_money', classmethod(lambda *args: None))
+    monkeypatch.setattr(ModelEngine.GPT4o_MINI.api_key, 'key', 'fake-key', raising=False)
+    requests = [(([Message(Role.USER, content)], ), dict(model_engine=ModelEngine.GPT4o_MINI))
+                for content in ['first', 'fail', 'third']]
+    try:
+        responses = LLMServerCaller._get_server_responses(requests)
+    finally:
+        engine.shutdown()
+    assert [response.value for response in responses[::2]] == ['first', 'third']
+    assert isinstance(responses[1], ServerErrorException)
+
+
+def test_llm_failure_is_raised_and_not_recorded(monkeypatch):
+    engine = FakeAsyncLLMEngine()
+    monkeypatch.setattr(llm_call, 'get_async_llm_engine', lambda: engine)
+    monkeypatch.setattr(llm_call, 'count_number_of_tokens_in_message', lambda *args: 10)
+    monkeypatch.setattr(LLMServerCaller, '_check_after_spending_money', classmethod(lambda *args: None))
+    server = LLMServerCaller()
+    messages = [Message(Role.USER, 'hello')]
+    try:
+        monkeypatch.setattr(ModelEngine.GPT4o_MINI.api_key, 'key', None, raising=False)
+        with server.mock(record_more_if_needed=True) as mock:
+            with pytest.raises(MissingAPIKeyError):
+                mock.get_server_response(messages, model_engine=ModelEngine.GPT4o_MINI)
+        records = server.new_records
+        assert server._count_records(records) == 0  # the failure is not recorded
+
+        # replaying the recording, with a working key, gets the response from the server:
+        monkeypatch.setattr(ModelEngine.GPT4o_MINI.api_key, 'key', 'fake-key', raising=False)
+        with server.mock(old_records=records, record_more_if_needed=True) as mock:
+            assert mock.get_server_response(messages, model_engine=ModelEngine.GPT4o_MINI).value == 'hello'
+    finally:
+        engine.shutdown()
+
+
+def test_rate_limits_are_not_applied_by_default():
+    assert not LIMIT_LLM_REQUEST_RATES
@@ -0,0 +1,80 @@
+import pickle
+import time
+from copy import copy
+
+from data_to_paper.base_steps.literature_search import unite_citation_lists
+from data_to_paper.servers.crossref import CrossrefCitation
+from data_to_paper.servers.semantic_scholar import SemanticCitation
+
+
+def _create_crossref_citation(i, query='query'):
+    return CrossrefCitation({
+        'title': f'Effects of treatment number {i} on outcome measures in patients',
+        'first_author_family': f'Author{i % 97}',
+        'year': 2000 + i % 20,
+        'journal': 'Journal of Studies',
+        'type': 'journal-article',
+    }, search_rank=i, query=query)
+
+
+def _create_semantic_citation(i):
+    return SemanticCitation({
+        'title': f'Paper {i}',
+        'citationStyles': {'bibtex': f'@Article{{Smith{i}2020,\n author = {{J. Smith, A. Doe}},\n title = {{P}}\n}}'},
+    })
+
+
+def test_crossref_bibtex_id_is_cached_and_invalidated_on_change():
+    citation = _create_crossref_citation(1)
+    bibtex_id = citation.bibtex_id
+    assert citation.bibtex_id is bibtex_id
+    citation['title'] = 'A completely different title of paper'
+    assert citation.bibtex_id != bibtex_id
+    citation._bibtex_id_override = 'override'
+    assert citation.bibtex_id == 'override'
+    assert 'override' in citation.bibtex
+    # search attributes do not affect the citation:
+    citation.query = 'another query'
+    assert '_cached_bibtex_id' in citation.__dict__
+
+
+def test_semantic_bibtex_is_cached_and_invalidated_on_change():
+    citation = _create_semantic_citation(1)
+    assert citation.bibtex_id == 'Smith12020'
+    assert citation.bibtex is citation.bibtex
+    citation.update(citationStyles={'bibtex': '@Article{Doe2021,\n author = {A. Doe},\n title = {Paper}\n}'})
+    assert citation.bibtex_id == 'Doe2021'
+
+
+def test_copied_and_unpickled_citations_have_independent_caches():
+    citation = _create_crossref_citation(1)
+    bibtex_id = citation.bibtex_id
+    copied = copy(citation)
+    copied['first_author_family'] = 'Other'
+    assert copied.bibtex_id != bibtex_id
+    assert citation.bibtex_id == bibtex_id
+    assert pickle.loads(pickle.dumps(citation)).bibtex_id == bibtex_id
+
+
+def _unite_repeatedly(citations_lists, num_repeats):
+    start = time.perf_counter()
+    for _ in range(num_repeats):
+        united = unite_citation_lists(iter(citations) for citations in citations_lists)
+        assert len(set(united)) == len(united)
+    return time.perf_counter() - start
+
+
+class UncachedCrossrefCitation(CrossrefCitation):
+    bibtex_id = property(CrossrefCitation.bibtex_id.fget.__wrapped__)
+
+
+def test_unite_citation_lists_benchmark():
+    num_lists, num_citations = 10, 500
+    citations_lists = [[_create_crossref_citation(i, query=f'q{j}') for i in range(num_citations)]
+                       for j in range(num_lists)]
+    uncached_lists = [[UncachedCrossrefCitation(c, search_rank=c.search_rank, query=c.query) for c in citations]
+                      for citations in citations_lists]
+    _unite_repeatedly(citations_lists, 1)  # bibtex ids are calculated once
+    cached_time = _unite_repeatedly(citations_lists, 5)
+    uncached_time = _unite_repeatedly(uncached_lists, 5)
+    assert cached_time * 3 < uncached_time
@@ -0,0 +1,37 @@
+import time
+
+from data_to_paper.servers import http_session
+from data_to_paper.servers.http_session import request_with_retries, get_backoff_limiter
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class FakeSession:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.request_times = []
+
+    def request(self, method, url, **kwargs):
+        self.request_times.append(time.monotonic())
+        return self.responses.pop(0)
+
+
+def test_request_with_retries_waits_as_requested_by_server(monkeypatch):
+    session = FakeSession([FakeResponse(429, {'Retry-After': '0.3'}), FakeResponse(200)])
+    monkeypatch.setattr(http_session, 'get_http_session', lambda: session)
+    response = request_with_retries('GET', 'https://server', server_name='test_server_retry_after')
+    assert response.status_code == 200
+    assert session.request_times[1] - session.request_times[0] >= 0.3
+
+
+def test_backoff_limiter_is_shared_by_requests_to_the_same_server(monkeypatch):
+    session = FakeSession([FakeResponse(200)])
+    monkeypatch.setattr(http_session, 'get_http_session', lambda: session)
+    get_backoff_limiter('test_server_shared').block_for(0.3)
+    start = time.monotonic()
+    request_with_retries('GET', 'https://server', server_name='test_server_shared')
+    assert session.request_times[0] - start >= 0.25
@@ -2,8 +2,9 @@ import numpy as np
 import pytest
 from pytest import fixture
 
+from data_to_paper.servers import semantic_scholar
 from data_to_paper.servers.semantic_scholar import SEMANTIC_SCHOLAR_SERVER_CALLER, \
-    SEMANTIC_SCHOLAR_EMBEDDING_SERVER_CALLER
+    SEMANTIC_SCHOLAR_EMBEDDING_SERVER_CALLER, SemanticScholarEmbeddingServerCaller, split_papers_into_batches
 
 
 @fixture()
@@ -47,3 +48,58 @@ def test_semantic_scholar_paper_bibtex_id_not_none(query):
 def test_semantic_scholar_paper_bibtex_id_has_no_spaces(query):
     papers = SEMANTIC_SCHOLAR_SERVER_CALLER.get_server_response(query, rows=3)
     assert all(' ' not in paper.bibtex_id for paper in papers)
+
+
+class FakeEmbeddingResponse:
+    status_code = 200
+
+    def __init__(self, papers):
+        self.papers = papers
+
+    def json(self):
+        return {"preds": [{"paper_id": paper["paper_id"], "embedding": [len(paper["title"])] * 768}
+                          for paper in self.papers]}
+
+
+class FakeEmbeddingSession:
+    def __init__(self):
+        self.batches = []
+
+    def post(self, url, json):
+        self.batches.append(json)
+        return FakeEmbeddingResponse(json)
+
+
+def _create_paper(i):
+    return {"paper_id": "", "title": "t" * (i + 1), "abstract": "abstract"}
+
+
+def test_split_papers_into_batches():
+    papers = [_create_paper(i) for i in range(40)]
+    assert [len(batch) for batch in split_papers_into_batches(papers, max_papers=16)] == [16, 16, 8]
+    assert [len(batch) for batch in split_papers_into_batches(papers[:4], max_size=20)] == [2, 1, 1]
+
+
+def test_split_papers_into_batches_with_missing_abstract():
+    papers = [{"paper_id": "", "title": "title", "abstract": None}] * 3
+    assert [len(batch) for batch in split_papers_into_batches(papers, max_size=10)] == [2, 1]
+
+
+def test_embedding_server_sends_papers_in_batches_and_records_each_paper(monkeypatch):
+    session = FakeEmbeddingSession()
+    monkeypatch.setattr(semantic_scholar, "get_http_session", lambda: session)
+    papers = [_create_paper(i) for i in range(20)]
+    server = SemanticScholarEmbeddingServerCaller()
+    with server.mock(old_records={}) as mock:
+        # a paper embedded on its own is recorded as before:
+        assert mock.get_server_response(papers[0])[0] == 1
+        embeddings = mock.get_embeddings(papers + [papers[3]])
+    assert [embedding[0] for embedding in embeddings] == [i + 1 for i in range(20)] + [4]
+    assert [len(batch) for batch in session.batches] == [1, 16, 3]
+    assert len(server.new_records) == 20
+
+    # replay; each paper is retrieved from its own record:
+    with server.mock(old_records=server.new_records, record_more_if_needed=False) as mock:
+        assert np.array_equal(mock.get_server_response(papers[5]), embeddings[5])
+        assert [embedding[0] for embedding in mock.get_embeddings(papers[::-1])] == [i + 1 for i in range(20)][::-1]
+    assert len(session.batches) == 3
@@ -1,9 +1,14 @@
 import os
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
 
 from typing import Union
 
 import pytest
 
+from data_to_paper.env import DELAY_SERVER_CACHE_RETRIEVAL
 from data_to_paper.servers.base_server import ListServerCaller, ParameterizedQueryServerCaller, \
     NoMoreResponsesToMockError, convert_args_kwargs_to_tuple, OrderedKeyToListServerCaller
 
@@ -150,3 +155,170 @@ def test_mock_server_saves_upon_error(tmpdir):
     new_server = TestListServerCaller()
     with new_server.mock_with_file(file_path=file_path) as mock:
         assert mock.get_server_response() == 'response1'
+
+
+def test_mock_server_appends_new_records_to_journal(tmpdir):
+    server = TestOrderedKeyToListServerCaller()
+    file_path = os.path.join(tmpdir, 'responses.json')
+    journal_file_path = server.get_journal_file_path(file_path)
+    with server.mock(file_path=file_path, should_save=True) as mock:
+        assert mock.get_server_response('key1', 'response1') == 'response1'
+        assert mock.get_server_response('key2', 'response2') == 'response2'
+        assert not os.path.exists(file_path)
+        with open(journal_file_path) as f:
+            assert len(f.readlines()) == 2
+    # compacted on exit:
+    assert os.path.exists(file_path)
+    assert not os.path.exists(journal_file_path)
+    new_server = TestOrderedKeyToListServerCaller()
+    with new_server.mock_with_file(file_path=file_path, fail_if_not_all_responses_used=False) as mock:
+        assert mock.old_records == {'key1': ['response1'], 'key2': ['response2']}
+
+
+def test_mock_server_loads_records_from_file_and_journal(tmpdir):
+    file_path = os.path.join(tmpdir, 'responses.json')
+    server = TestOrderedKeyToListServerCaller()
+    with server.mock(file_path=file_path, should_save=True) as mock:
+        mock.get_server_response('key1', 'response1')
+
+    # simulate a run that was killed before the journal was compacted:
+    server = TestOrderedKeyToListServerCaller()
+    mock = server.mock_with_file(file_path=file_path).__enter__()
+    assert mock.get_server_response('key1') == 'response1'
+    mock.get_server_response('key1', 'response2')
+    mock.get_server_response('key2', 'response3')
+
+    new_server = TestOrderedKeyToListServerCaller()
+    with new_server.mock_with_file(file_path=file_path) as mock:
+        assert mock.old_records == {'key1': ['response1', 'response2'], 'key2': ['response3']}
+        for key, response in [('key1', 'response1'), ('key1', 'response2'), ('key2', 'response3')]:
+            assert mock.get_server_response(key) == response
+
+
+def test_mock_server_skips_journal_entries_already_in_file(tmpdir):
+    file_path = os.path.join(tmpdir, 'responses.txt')
+    server = TestListServerCaller()
+    mock = server.mock(file_path=file_path, should_save=True).__enter__()
+    mock.get_server_response('response1')
+    mock.get_server_response('response2')
+    # simulate being killed after compacting the file, but before removing the journal:
+    with open(server.get_journal_file_path(file_path)) as f:
+        journal = f.read()
+    mock.save_records()
+    with open(server.get_journal_file_path(file_path), 'w') as f:
+        f.write(journal)
+
+    new_server = TestListServerCaller()
+    with new_server.mock_with_file(file_path=file_path, fail_if_not_all_responses_used=False) as mock:
+        assert mock.old_records == ['response1', 'response2']
+
+
+class CountingOrderedKeyToListServerCaller(TestOrderedKeyToListServerCaller):
+    num_flattenings = 0
+
+    def _get_old_records_as_list(self):
+        self.num_flattenings += 1
+        return super()._get_old_records_as_list()
+
+
+def test_ordered_key_server_replay_of_5k_responses_is_linear():
+    records = {f'stage{i}': [f'response{i}_{j}' for j in range(500)] for i in range(10)}
+    server = CountingOrderedKeyToListServerCaller()
+    with DELAY_SERVER_CACHE_RETRIEVAL.temporary_set(0), \
+            server.mock(old_records=records, record_more_if_needed=False) as mock:
+        for key, values in records.items():
+            for value in values:
+                assert mock.get_server_response(key) == value
+    assert server.num_flattenings == 1  # the records are not flattened again for each response
+
+
+def test_ordered_key_server_old_records_are_re_flattened_after_mock():
+    server = TestOrderedKeyToListServerCaller()
+    with server.mock(old_records={'key1': ['response1']}) as mock:
+        assert mock.get_server_response('key1') == 'response1'
+    with server.mock(old_records={'key2': ['response2']}) as mock:
+        assert mock.get_server_response('key2') == 'response2'
+
+
+class TestConcurrentListServerCaller(TestListServerCaller):
+    @classmethod
+    def _get_server_responses(cls, requests):
+        # responses arrive in reverse order:
+        with ThreadPoolExecutor(len(requests)) as executor:
+            futures = [executor.submit(lambda i, r: time.sleep(0.05 * (len(requests) - i)) or r, i, args[0])
+                       for i, (args, kwargs) in enumerate(requests)]
+            return [future.result() for future in futures]
+
+
+def test_server_batch_responses_are_recorded_and_replayed_in_request_order():
+    server = TestConcurrentListServerCaller()
+    requests = [((f'response{i}', ), {}) for i in range(4)]
+    with server.mock(record_more_if_needed=True) as mock:
+        assert mock.get_server_responses(requests[:1]) == ['response0']
+        assert mock.get_server_responses(requests[1:]) == ['response1', 'response2', 'response3']
+    assert server.new_records == ['response0', 'response1', 'response2', 'response3']
+    with server.mock(old_records=server.new_records, record_more_if_needed=False) as mock:
+        assert mock.get_server_responses(requests) == ['response0', 'response1', 'response2', 'response3']
+
+
+def test_server_batch_responses_returns_exceptions_in_place():
+    server = TestListServerCaller()
+    exception = ValueError('bad value')
+    with server.mock(old_records=['response0', exception]) as mock:
+        assert mock.get_server_responses([((), {}), ((), {})]) == ['response0', exception]
+
+
+class TestConcurrentParameterizedQueryServerCaller(ParameterizedQueryServerCaller):
+    max_concurrent_requests = 4
+    num_calls = 0
+    # each request waits for all 4 distinct requests to be running (raises BrokenBarrierError otherwise):
+    barrier = threading.Barrier(4, timeout=5)
+
+    @classmethod
+    def _get_server_response(cls, query: str):
+        cls.num_calls += 1
+        cls.barrier.wait()
+        return query.upper()
+
+
+def test_parameterized_server_batch_merges_identical_requests_and_runs_concurrently():
+    server = TestConcurrentParameterizedQueryServerCaller()
+    queries = ['a', 'b', 'a', 'c', 'd', 'b']
+    with server.mock() as mock:
+        assert mock.get_server_responses([((query, ), {}) for query in queries]) == ['A', 'B', 'A', 'C', 'D', 'B']
+    assert TestConcurrentParameterizedQueryServerCaller.num_calls == 4
+    assert len(server.new_records) == 4
+
+
+class TestFailingParameterizedQueryServerCaller(ParameterizedQueryServerCaller):
+    max_concurrent_requests = 4
+
+    @classmethod
+    def _get_server_response(cls, query: str):
+        if query == 'fail':
+            raise ValueError('failed query')
+        return query.upper()
+
+
+def test_parameterized_server_batch_returns_failed_requests_in_place():
+    server = TestFailingParameterizedQueryServerCaller()
+    with server.mock() as mock:
+        responses = mock.get_server_responses([((query, ), {}) for query in ['a', 'fail', 'b']])
+    assert responses[0] == 'A' and responses[2] == 'B'
+    assert isinstance(responses[1], ValueError)
+    # responses are recorded up to the first failed request:
+    assert list(server.new_records.values()) == ['A']
+
+
+def test_server_batch_responses_are_saved_once(tmpdir, monkeypatch):
+    server = TestListServerCaller()
+    saved_batches = []
+    original_save_new_records = server._save_new_records
+    monkeypatch.setattr(server, '_save_new_records',
+                        lambda entries: saved_batches.append(entries) or original_save_new_records(entries))
+    file_path = str(tmpdir.join('records.pkl'))
+    with server.mock(should_save=True, file_path=file_path) as mock:
+        mock.get_server_responses([((f'response{i}', ), {}) for i in range(5)])
+        assert len(saved_batches) == 1
+        with open(server.get_journal_file_path(file_path)) as file:
+            assert len(file.readlines()) == 5
@@ -0,0 +1,125 @@
+import multiprocessing
+import pickle
+import sqlite3
+import time
+from contextlib import closing
+
+import numpy as np
+
+from data_to_paper.env import SHARED_RESPONSE_CACHE_FILEPATH
+from data_to_paper.servers.base_server import ParameterizedQueryServerCaller, convert_args_kwargs_to_tuple
+from data_to_paper.servers.shared_cache import SharedResponseCache
+
+
+def test_shared_cache_get_put_and_statistics(tmpdir):
+    cache = SharedResponseCache(tmpdir / 'cache.sqlite')
+    key = convert_args_kwargs_to_tuple(('diabetes  and obesity',), {'rows': 25})
+    assert cache.get('server', key) is None
+    cache.put('server', key, [{'title': 'paper'}])
+    # requests differing only by whitespace share the same entry:
+    assert cache.get('server', convert_args_kwargs_to_tuple((' diabetes and obesity',), {'rows': 25})) == \
+        [{'title': 'paper'}]
+    assert cache.get('other_server', key) is None
+    assert (cache.statistics.hits, cache.statistics.misses, cache.statistics.puts) == (1, 2, 1)
+    assert cache.statistics.hit_rate == 1 / 3
+
+
+def test_shared_cache_ttl(tmpdir):
+    cache = SharedResponseCache(tmpdir / 'cache.sqlite', ttl=0.2)
+    cache.put('server', ('key',), 'value')
+    assert cache.get('server', ('key',)) == 'value'
+    time.sleep(0.3)
+    assert cache.get('server', ('key',)) is None
+    assert cache.statistics.expired == 1
+
+
+def test_shared_cache_evicts_least_recently_used(tmpdir):
+    cache = SharedResponseCache(tmpdir / 'cache.sqlite')
+    for i in range(3):
+        cache.put('server', (i,), np.zeros(1000))
+    entry_size = cache.get_total_size() // 3
+    cache.get('server', (0,))  # 1 is now the least recently used
+    cache.max_size = 3 * entry_size
+    cache.put('server', (3,), np.zeros(1000))
+    assert len(cache) == 3
+    assert cache.get('server', (1,)) is None
+    assert cache.get('server', (0,)) is not None
+    assert cache.statistics.evictions == 1
+
+
+def test_shared_cache_evicts_only_when_over_the_limit(tmpdir, monkeypatch):
+    cache = SharedResponseCache(tmpdir / 'cache.sqlite', ttl=1000, max_size=10 ** 6)
+    statements = []
+    original_connect = cache._connect
+
+    def connect():
+        connection = original_connect()
+        connection.set_trace_callback(statements.append)
+        return connection
+
+    monkeypatch.setattr(cache, '_connect', connect)
+    for i in range(5):
+        cache.put('server', (i,), np.zeros(100))
+    cache.put('server', (0,), np.zeros(200))  # replacing an entry updates the total size
+    assert not any('BEGIN' in statement or 'DELETE' in statement or 'SUM(' in statement for statement in statements)
+    with closing(sqlite3.connect(cache.filepath)) as connection:
+        assert cache.get_total_size() == \
+            connection.execute('SELECT SUM(size) FROM responses').fetchone()[0]
+        assert 'responses_created' in \
+            connection.execute('EXPLAIN QUERY PLAN DELETE FROM responses WHERE created < 0').fetchone()[-1]
+
+
+def test_shared_cache_computes_the_total_size_of_an_existing_cache(tmpdir):
+    filepath = tmpdir / 'cache.sqlite'
+    with closing(sqlite3.connect(filepath)) as connection:
+        connection.execute(
+            'CREATE TABLE responses (namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, '
+            'size INTEGER NOT NULL, created REAL NOT NULL, last_access REAL NOT NULL, PRIMARY KEY (namespace, key))')
+        connection.execute("INSERT INTO responses VALUES ('server', 'key', x'00', 300, 0, 0)")
+        connection.commit()
+    cache = SharedResponseCache(filepath)
+    assert cache.get_total_size() == 300
+    cache.put('server', ('key',), 'value')
+    assert cache.get_total_size() == 300 + len(pickle.dumps('value'))
+
+
+def _put_values(filepath, start):
+    cache = SharedResponseCache(filepath, max_size=10 ** 6)
+    for i in range(start, start + 20):
+        cache.put('server', (i,), i)
+
+
+def test_shared_cache_concurrent_processes(tmpdir):
+    filepath = str(tmpdir / 'cache.sqlite')
+    processes = [multiprocessing.Process(target=_put_values, args=(filepath, 20 * i)) for i in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+    cache = SharedResponseCache(filepath)
+    assert len(cache) == 80
+    assert all(cache.get('server', (i,)) == i for i in range(80))
+
+
+class CountingQueryServerCaller(ParameterizedQueryServerCaller):
+    shared_cache_namespace = 'counting'
+    num_calls = 0
+
+    @classmethod
+    def _get_server_response(cls, query):
+        cls.num_calls += 1
+        return f'response to {query}'
+
+
+def test_shared_cache_is_used_across_runs_and_responses_are_recorded(tmpdir):
+    with SHARED_RESPONSE_CACHE_FILEPATH.temporary_set(str(tmpdir / 'cache.sqlite')):
+        run1 = CountingQueryServerCaller()
+        with run1.mock():
+            assert run1.get_server_response('query') == 'response to query'
+        run2 = CountingQueryServerCaller()
+        with run2.mock():
+            assert run2.get_server_response('query') == 'response to query'
+    assert CountingQueryServerCaller.num_calls == 1
+    # the response retrieved from the shared cache is recorded in the run's records (for replay):
+    assert run2.new_records == run1.new_records == {convert_args_kwargs_to_tuple(('query',), {}): 'response to query'}
@@ -0,0 +1,40 @@
+from data_to_paper.utils.multi_process import run_func_in_separate_process, MAX_PIPE_TRANSFER_SIZE, \
+    RESULT_TRANSFER_METRICS
+
+
+def _make_list(n):
+    return list(range(n))
+
+
+def _raise_value_error():
+    raise ValueError('bad value')
+
+
+def test_run_func_in_separate_process_through_pipe():
+    num_file_transfers = RESULT_TRANSFER_METRICS.num_file_transfers
+    num_transfers = RESULT_TRANSFER_METRICS.num_transfers
+    result, exception = run_func_in_separate_process(_make_list, 1000)
+    assert result == list(range(1000))
+    assert exception is None
+    assert RESULT_TRANSFER_METRICS.num_transfers == num_transfers + 1
+    assert RESULT_TRANSFER_METRICS.num_file_transfers == num_file_transfers
+
+
+def test_run_func_in_separate_process_falls_back_to_file_for_large_results():
+    num_file_transfers = RESULT_TRANSFER_METRICS.num_file_transfers
+    with MAX_PIPE_TRANSFER_SIZE.temporary_set(100):
+        result, exception = run_func_in_separate_process(_make_list, 1000)
+    assert result == list(range(1000))
+    assert RESULT_TRANSFER_METRICS.num_file_transfers == num_file_transfers + 1
+    assert RESULT_TRANSFER_METRICS.max_bytes > 100
+
+
+def test_run_func_in_separate_process_returns_exception():
+    result, exception = run_func_in_separate_process(_raise_value_error)
+    assert result is None
+    assert isinstance(exception, ValueError)
+
+
+def test_run_func_in_separate_process_with_queue():
+    result, exception = run_func_in_separate_process(_make_list, 10, use_file_instead_of_queue=False)
+    assert result == list(range(10))